@@ -0,0 +1,77 @@
+"""Import-time benchmark for visionlab.remote_data.
+
+Runs ``import visionlab.remote_data`` (plus a cheap attribute access) in fresh
+interpreters, reports the median wall time, and fails if
+
+  - any heavy dependency (torch, litdata, boto3, requests, ...) got imported, or
+  - the median import time exceeds ``--max-seconds``.
+
+Usage:
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --repeat 20 --max-seconds 0.3
+    python benchmarks/bench_import_time.py --importtime   # dump `-X importtime` for one run
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# modules that must not be loaded by `import visionlab.remote_data` / get_cache_dir
+HEAVY_MODULES = ['torch', 'litdata', 'boto3', 'botocore', 'requests', 'fire', 'tqdm', 'filelock']
+
+_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import visionlab.remote_data as rd
+rd.get_cache_dir
+elapsed = time.perf_counter() - t0
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+def run_probe(python=sys.executable):
+    out = subprocess.run([python, "-c", _PROBE], check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10, help="number of fresh interpreters to time")
+    parser.add_argument("--max-seconds", type=float, default=0.25, help="fail if the median import exceeds this")
+    parser.add_argument("--importtime", action="store_true", help="print `python -X importtime` output for one run")
+    parser.add_argument("--json", action="store_true", help="emit machine-readable results")
+    args = parser.parse_args(argv)
+
+    if args.importtime:
+        subprocess.run([sys.executable, "-X", "importtime", "-c", "import visionlab.remote_data as rd; rd.get_cache_dir"])
+
+    results = [run_probe() for _ in range(args.repeat)]
+    times = [r["seconds"] for r in results]
+    loaded = sorted({m.split('.')[0] for m in results[-1]["modules"]} & set(HEAVY_MODULES))
+    median = statistics.median(times)
+
+    failures = []
+    if loaded:
+        failures.append(f"heavy modules imported at package import: {', '.join(loaded)}")
+    if median > args.max_seconds:
+        failures.append(f"median import time {median:.3f}s exceeds budget {args.max_seconds:.3f}s")
+
+    if args.json:
+        print(json.dumps({
+            "benchmark": "import_time",
+            "repeat": args.repeat,
+            "median_seconds": median,
+            "min_seconds": min(times),
+            "max_seconds": max(times),
+            "heavy_modules_loaded": loaded,
+            "ok": not failures,
+        }))
+    else:
+        print(f"import visionlab.remote_data: median {median*1000:.1f} ms "
+              f"(min {min(times)*1000:.1f} ms, max {max(times)*1000:.1f} ms, n={args.repeat})")
+        for failure in failures:
+            print(f"FAIL: {failure}")
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""Compare two run_benchmarks.py result files (e.g. baseline commit vs. candidate).
+
+Prints the median-time ratio (candidate / baseline) for every benchmark present in both,
+and exits non-zero if any is slower than ``1 + --threshold``.
+
+Usage:
+    python benchmarks/compare.py baseline.json candidate.json --threshold 0.2
+"""
+import sys
+import json
+import argparse
+
+def _key(result):
+    return result['name'], tuple(sorted((k, str(v)) for k, v in result['params'].items()))
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report.get('meta', {}), {_key(r): r for r in report['results'] if 'median_s' in r}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fail if a median is more than this fraction slower (default 0.2)')
+    parser.add_argument('--min-seconds', type=float, default=0.001,
+                        help='ignore regressions in benchmarks faster than this (timer noise)')
+    args = parser.parse_args(argv)
+
+    base_meta, base = load(args.baseline)
+    cand_meta, cand = load(args.candidate)
+    print(f"baseline:  {base_meta.get('commit')}  candidate: {cand_meta.get('commit')}")
+
+    regressions = []
+    for key in sorted(set(base) & set(cand)):
+        b, c = base[key]['median_s'], cand[key]['median_s']
+        ratio = c / b if b else float('inf')
+        name, params = key
+        label = ' '.join(f"{k}={v}" for k, v in params)
+        flag = ''
+        if ratio > 1 + args.threshold and max(b, c) >= args.min_seconds:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        print(f"{name:<22} {label:<32} {b*1000:10.2f} ms -> {c*1000:10.2f} ms  x{ratio:5.2f}{flag}")
+
+    for key in sorted(set(base) ^ set(cand)):
+        print(f"{key[0]:<22} only in {'baseline' if key in base else 'candidate'}")
+
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""Minimal stand-in for the `s5cmd` binary, for offline benchmarks.
+
+Supports the subset of s5cmd the package uses:
+
+    s5cmd [--dry-run] [--no-sign-request] [--endpoint-url URL] [--numworkers N] \\
+          cp [--show-progress] [--concurrency N] [--part-size MB] s3://bucket/key dst
+    s5cmd [...] cp [...] local_file s3://bucket/key
+    s5cmd [...] ls s3://bucket/prefix
+    s5cmd [...] run commands.txt    (cp lines only)
+
+Uploads larger than --part-size (default 50 MiB, as in s5cmd) are sent as multipart
+uploads, so the resulting ETag matches what real S3 would report.
+
+Objects are fetched over http from the S3 stand-in (`servers.serve_s3`) at
+``--endpoint-url`` (or $S3_ENDPOINT_URL). With --show-progress, s5cmd-style progress
+lines are printed, e.g. ``45.00% ━━━━──── 4.50 MiB / 10.00 MiB (2.25 MiB/s) 3s left (0/1)``.
+Use `install_fake_s5cmd(bin_dir)` to put an executable `s5cmd` shim on PATH.
+"""
+import os
+import sys
+import time
+import stat
+import shlex
+import xml.etree.ElementTree as ET
+
+from urllib.parse import urlparse
+from urllib.request import urlopen, Request
+
+CHUNK = 1024 * 1024
+DEFAULT_PART_SIZE_MB = 50
+S3_NS = {'s3': 'http://s3.amazonaws.com/doc/2006-03-01/'}
+
+def _human(n):
+    for unit in ['B', 'KiB', 'MiB', 'GiB', 'TiB']:
+        if n < 1024 or unit == 'TiB':
+            return f"{n:.2f} {unit}"
+        n /= 1024
+
+def _progress_line(done, total, start):
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    rate = done / elapsed
+    left = (total - done) / rate if rate and total else 0
+    percent = 100.0 * done / total if total else 100.0
+    width = 20
+    filled = int(width * percent / 100)
+    bar = '━' * filled + '─' * (width - filled)
+    completed = 1 if done >= total else 0
+    return (f"\r{percent:.2f}% {bar} {_human(done)} / {_human(total)} "
+            f"({_human(rate)}/s) {int(left)}s left ({completed}/1)")
+
+def _object_url(endpoint, uri):
+    parsed = urlparse(uri)
+    return f"{endpoint.rstrip('/')}/{parsed.netloc}/{parsed.path.lstrip('/')}"
+
+def _request(url, method, data=None):
+    with urlopen(Request(url, data=data, method=method)) as response:
+        return response.headers, response.read()
+
+def upload(endpoint, src, dst, part_size_mb=DEFAULT_PART_SIZE_MB, show_progress=False):
+    url = _object_url(endpoint, dst)
+    total = os.path.getsize(src)
+    part_size = part_size_mb * CHUNK
+    start = time.perf_counter()
+    with open(src, 'rb') as f:
+        if total <= part_size:
+            _request(url, 'PUT', f.read())
+        else:
+            _, body = _request(url + '?uploads', 'POST', b'')
+            upload_id = ET.fromstring(body).find('s3:UploadId', S3_NS).text
+            done, part_number = 0, 1
+            for part in iter(lambda: f.read(part_size), b''):
+                _request(f"{url}?partNumber={part_number}&uploadId={upload_id}", 'PUT', part)
+                done += len(part)
+                part_number += 1
+                if show_progress:
+                    sys.stdout.write(_progress_line(done, total, start))
+                    sys.stdout.flush()
+            _request(f"{url}?uploadId={upload_id}", 'POST', b'')
+    if show_progress:
+        sys.stdout.write(_progress_line(total, total, start) + "\n")
+    else:
+        print(f"cp {src} {dst}")
+    return 0
+
+def cp(endpoint, src, dst, show_progress=False, dry_run=False, part_size_mb=DEFAULT_PART_SIZE_MB):
+    if dry_run:
+        print(f"cp {src} {dst}")
+        return 0
+    if dst.startswith('s3://'):
+        return upload(endpoint, src, dst, part_size_mb=part_size_mb, show_progress=show_progress)
+    if os.path.isdir(dst) or dst.endswith('/'):
+        dst = os.path.join(dst, os.path.basename(urlparse(src).path))
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+    start = time.perf_counter()
+    last_print = 0
+    with urlopen(_object_url(endpoint, src)) as response, open(dst, 'wb') as f:
+        total = int(response.headers.get('Content-Length', 0))
+        done = 0
+        while True:
+            chunk = response.read(CHUNK)
+            if not chunk:
+                break
+            f.write(chunk)
+            done += len(chunk)
+            if show_progress and time.perf_counter() - last_print > 0.1:
+                sys.stdout.write(_progress_line(done, total, start))
+                sys.stdout.flush()
+                last_print = time.perf_counter()
+    if show_progress:
+        sys.stdout.write(_progress_line(done, total, start) + "\n")
+    else:
+        print(f"cp {src} {dst}")
+    return 0
+
+def ls(endpoint, uri):
+    parsed = urlparse(uri)
+    url = f"{endpoint.rstrip('/')}/{parsed.netloc}?list-type=2&prefix={parsed.path.lstrip('/')}"
+    with urlopen(url) as response:
+        root = ET.fromstring(response.read())
+    for content in root.findall('s3:Contents', S3_NS):
+        key = content.find('s3:Key', S3_NS).text
+        size = content.find('s3:Size', S3_NS).text
+        print(f"2024/01/01 00:00:00 {int(size):>12} {key}")
+    return 0
+
+def run(endpoint, commands_path, dry_run=False):
+    """Execute the `cp` lines of an s5cmd command file, one after another."""
+    return_code = 0
+    with open(commands_path) as f:
+        for line in f:
+            parts = shlex.split(line)
+            if not parts:
+                continue
+            if parts[0] != 'cp':
+                print(f"ERROR \"{line.strip()}\": fake s5cmd run only supports cp", file=sys.stderr)
+                return_code = 1
+                continue
+            try:
+                return_code |= cp(endpoint, parts[-2], parts[-1], dry_run=dry_run)
+            except Exception as e:
+                print(f"ERROR \"{line.strip()}\": {e}", file=sys.stderr)
+                return_code = 1
+    return return_code
+
+def main(argv=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    endpoint = os.environ.get('S3_ENDPOINT_URL')
+    dry_run = False
+    while args and args[0].startswith('--'):
+        opt = args.pop(0)
+        if opt == '--endpoint-url':
+            endpoint = args.pop(0)
+        elif opt == '--dry-run':
+            dry_run = True
+        elif opt in ('--numworkers', '--log', '--retry-count'):
+            args.pop(0)
+    if not args:
+        print("usage: s5cmd [options] cp|ls ...", file=sys.stderr)
+        return 2
+    if endpoint is None:
+        print("ERROR: fake s5cmd needs --endpoint-url or S3_ENDPOINT_URL", file=sys.stderr)
+        return 1
+
+    command = args.pop(0)
+    show_progress = False
+    part_size_mb = DEFAULT_PART_SIZE_MB
+    while args and args[0].startswith('-'):
+        opt = args.pop(0)
+        if opt == '--show-progress':
+            show_progress = True
+        elif opt in ('--part-size', '-p'):
+            part_size_mb = int(args.pop(0))
+        elif opt in ('--concurrency', '-c'):
+            args.pop(0)
+    try:
+        if command == 'cp':
+            return cp(endpoint, args[0], args[1], show_progress=show_progress, dry_run=dry_run,
+                      part_size_mb=part_size_mb)
+        elif command == 'ls':
+            return ls(endpoint, args[0])
+        elif command == 'run':
+            return run(endpoint, args[0], dry_run=dry_run)
+    except Exception as e:
+        print(f"ERROR \"{command} {' '.join(args)}\": {e}", file=sys.stderr)
+        return 1
+    print(f"ERROR: unsupported command {command}", file=sys.stderr)
+    return 1
+
+def install_fake_s5cmd(bin_dir):
+    """Write an executable `s5cmd` shim into `bin_dir` (prepend it to PATH to use it)."""
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, 's5cmd')
+    with open(path, 'w') as f:
+        f.write(f"#!/bin/sh\nexec {sys.executable} {os.path.abspath(__file__)} \"$@\"\n")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+if __name__ == "__main__":
+    sys.exit(main())
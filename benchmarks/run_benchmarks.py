@@ -0,0 +1,250 @@
+"""Offline benchmark suite for visionlab.remote_data.
+
+Everything runs locally: a Range-capable http server, an S3-compatible stand-in and (unless
+--real-s5cmd) a fake `s5cmd` binary are started in-process, so results are reproducible and
+comparable between commits.
+
+Benchmarks:
+    calculate_s3_etag     ETag throughput over file sizes
+    get_file_metadata     local files and http urls
+    decompress_if_needed  tar extraction over file counts
+    download_from_url     cache miss / cache hit over file sizes, and many small files
+    s5cmd_cp              s5cmd transfer from the S3 stand-in over file sizes
+    upload_data_file      hash + multipart upload + ETag check to the S3 stand-in, per backend
+    import_time           `import visionlab.remote_data` in a fresh interpreter
+
+Usage:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --only download_from_url,s5cmd_cp --sizes 1MB,256MB
+    python benchmarks/compare.py baseline.json results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tarfile
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from servers import serve_http, serve_s3
+from fake_s5cmd import install_fake_s5cmd
+
+BENCHMARKS = ['calculate_s3_etag', 'get_file_metadata', 'decompress_if_needed',
+              'download_from_url', 's5cmd_cp', 'upload_data_file', 'import_time']
+
+_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024**2, 'GB': 1024**3}
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit in sorted(_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * _UNITS[unit])
+    return int(text)
+
+def format_size(n):
+    for unit in ['GB', 'MB', 'KB']:
+        if n >= _UNITS[unit] and n % _UNITS[unit] == 0:
+            return f"{n // _UNITS[unit]}{unit}"
+    return f"{n}B"
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def make_file(path, size, block=1024*1024):
+    """Write `size` pseudo-random bytes (one random block, repeated)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = os.urandom(min(block, size))
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            f.write(data[:remaining])
+            remaining -= len(data)
+    return path
+
+class Harness:
+    def __init__(self, workdir, repeat=3):
+        self.workdir = workdir
+        self.repeat = repeat
+        self.results = []
+
+    def measure(self, name, fn, setup=None, params=None, nbytes=None, repeat=None):
+        """Time `fn()` `repeat` times (running the untimed `setup()` before each) and record it."""
+        times = []
+        for _ in range(repeat or self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        median = statistics.median(times)
+        result = dict(name=name, params=params or {}, repeat=len(times),
+                      median_s=median, min_s=min(times), mean_s=statistics.mean(times))
+        if nbytes:
+            result['bytes'] = nbytes
+            result['throughput_MBps'] = nbytes / median / 1024**2 if median else None
+        self.results.append(result)
+        label = ' '.join(f"{k}={v}" for k, v in (params or {}).items())
+        rate = f" {result['throughput_MBps']:9.1f} MB/s" if nbytes else ''
+        print(f"{name:<22} {label:<32} median {median*1000:10.2f} ms{rate}")
+        return result
+
+    def skip(self, name, reason):
+        self.results.append(dict(name=name, params={}, skipped=reason))
+        print(f"{name:<22} SKIPPED: {reason}")
+
+# ---- benchmarks ----
+
+def bench_calculate_s3_etag(h, sizes, counts, env):
+    from visionlab.remote_data.s3_etag import calculate_s3_etag
+    for size in sizes:
+        path = make_file(os.path.join(h.workdir, 'etag', f'{size}.bin'), size)
+        h.measure('calculate_s3_etag', lambda: calculate_s3_etag(path),
+                  params=dict(size=format_size(size)), nbytes=size)
+
+def bench_get_file_metadata(h, sizes, counts, env):
+    from visionlab.remote_data.metadata import get_file_metadata
+    for size in sizes:
+        path = make_file(os.path.join(env['http_root'], 'metadata', f'{size}.bin'), size)
+        url = f"{env['http'].url}/metadata/{size}.bin"
+        h.measure('get_file_metadata', lambda: get_file_metadata(path),
+                  params=dict(source='local', size=format_size(size)))
+        h.measure('get_file_metadata', lambda: get_file_metadata(url),
+                  params=dict(source='http', size=format_size(size)))
+
+def bench_decompress_if_needed(h, sizes, counts, env):
+    from visionlab.remote_data.decompress import decompress_if_needed
+    for count in counts:
+        src = os.path.join(h.workdir, 'tar-src', str(count), 'top')
+        for i in range(count):
+            make_file(os.path.join(src, f'{i:06d}.bin'), 4096)
+        archive = os.path.join(h.workdir, 'tar', f'{count}.tar')
+        os.makedirs(os.path.dirname(archive), exist_ok=True)
+        with tarfile.open(archive, 'w') as tar:
+            tar.add(src, arcname='top')
+        out_dir = os.path.join(h.workdir, 'tar-out', str(count))
+        h.measure('decompress_if_needed',
+                  lambda: decompress_if_needed(archive, output_dir=out_dir),
+                  setup=lambda: shutil.rmtree(out_dir, ignore_errors=True),
+                  params=dict(files=count), nbytes=os.path.getsize(archive))
+
+def bench_download_from_url(h, sizes, counts, env):
+    from visionlab.remote_data.download import download_from_url
+    cache_dir = os.path.join(h.workdir, 'http-cache')
+    clear = lambda: shutil.rmtree(cache_dir, ignore_errors=True)
+    for size in sizes:
+        make_file(os.path.join(env['http_root'], 'files', f'{size}.bin'), size)
+        url = f"{env['http'].url}/files/{size}.bin"
+        fetch = lambda: download_from_url(url, cache_dir=cache_dir, progress=False)
+        h.measure('download_from_url', fetch, setup=clear,
+                  params=dict(cache='miss', size=format_size(size)), nbytes=size)
+        h.measure('download_from_url', fetch,
+                  params=dict(cache='hit', size=format_size(size)))
+    for count in counts:
+        urls = []
+        for i in range(count):
+            make_file(os.path.join(env['http_root'], 'small', str(count), f'{i:06d}.bin'), 4096)
+            urls.append(f"{env['http'].url}/small/{count}/{i:06d}.bin")
+        h.measure('download_from_url',
+                  lambda: [download_from_url(url, cache_dir=cache_dir, progress=False) for url in urls],
+                  setup=clear, params=dict(cache='miss', files=count, size='4KB'), nbytes=4096 * count)
+
+def bench_s5cmd_cp(h, sizes, counts, env):
+    from visionlab.remote_data.s5cmd_python import s5cmd_cp
+    out_dir = os.path.join(h.workdir, 's5cmd-out')
+    options = dict(endpoint_option=f"--endpoint-url {env['s3'].url}", no_signed_option='--no-sign-request',
+                   env=env['env'])
+    for size in sizes:
+        make_file(os.path.join(env['s3_root'], 'bench-bucket', f'{size}.bin'), size)
+        dst = os.path.join(out_dir, f'{size}.bin')
+        h.measure('s5cmd_cp',
+                  lambda: s5cmd_cp(f"s3://bench-bucket/{size}.bin", dst, options),
+                  setup=lambda: shutil.rmtree(out_dir, ignore_errors=True),
+                  params=dict(size=format_size(size)), nbytes=size)
+
+def bench_upload_data_file(h, sizes, counts, env):
+    from visionlab.remote_data.upload import upload_data_file
+    s3_config = dict(endpoint_url=env['s3'].url)
+    for size in sizes:
+        path = make_file(os.path.join(h.workdir, 'upload', f'{size}.bin'), size)
+        for backend in ['s5cmd', 'boto3']:
+            h.measure('upload_data_file',
+                      lambda: upload_data_file(path, f"s3://bench-bucket/uploads/{backend}/", s3_config=s3_config,
+                                               backend=backend, show_progress=False),
+                      params=dict(backend=backend, size=format_size(size)), nbytes=size)
+
+def bench_import_time(h, sizes, counts, env):
+    from bench_import_time import run_probe
+    h.measure('import_time', lambda: run_probe(), repeat=max(h.repeat, 5))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='4KB,1MB,32MB', help='comma-separated file sizes')
+    parser.add_argument('--counts', default='10,100', help='comma-separated file counts')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', default=None, help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--output', default=None, help='write results as json to this path')
+    parser.add_argument('--workdir', default=None, help='scratch directory (default: a temp dir)')
+    parser.add_argument('--real-s5cmd', action='store_true', help='use the s5cmd on PATH instead of the shim')
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(',') if s]
+    counts = [int(c) for c in args.counts.split(',') if c]
+    selected = args.only.split(',') if args.only else BENCHMARKS
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='remote-data-bench-')
+    env = dict(http_root=os.path.join(workdir, 'http-root'), s3_root=os.path.join(workdir, 's3-root'))
+    os.makedirs(env['http_root'], exist_ok=True)
+    os.makedirs(env['s3_root'], exist_ok=True)
+    env['http'] = serve_http(env['http_root'])
+    env['s3'] = serve_s3(env['s3_root'])
+
+    # point s5cmd (real or fake) and boto3 at the S3 stand-in, with dummy credentials; set
+    # process-wide since the package builds s5cmd's environment from os.environ
+    os.environ.update(S3_ENDPOINT_URL=env['s3'].url,
+                      AWS_ACCESS_KEY_ID='benchmark', AWS_SECRET_ACCESS_KEY='benchmark')
+    if not args.real_s5cmd:
+        bin_dir = os.path.join(workdir, 'bin')
+        install_fake_s5cmd(bin_dir)
+        os.environ['PATH'] = bin_dir + os.pathsep + os.environ.get('PATH', '')
+    env['env'] = dict(os.environ)
+
+    h = Harness(os.path.join(workdir, 'scratch'), repeat=args.repeat)
+    try:
+        for name in selected:
+            try:
+                globals()[f'bench_{name}'](h, sizes, counts, env)
+            except ImportError as e:
+                h.skip(name, f"missing dependency: {e}")
+            except Exception as e:
+                traceback.print_exc()
+                h.skip(name, f"{type(e).__name__}: {e}")
+    finally:
+        env['http'].stop()
+        env['s3'].stop()
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = dict(
+        meta=dict(commit=git_commit(), python=platform.python_version(), platform=platform.platform(),
+                  cpu_count=os.cpu_count(), timestamp=time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                  repeat=args.repeat, fake_s5cmd=not args.real_s5cmd),
+        results=h.results,
+    )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
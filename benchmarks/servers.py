@@ -0,0 +1,279 @@
+"""Local stand-in servers for offline benchmarks.
+
+- `serve_http(root)`: static file server with Range, ETag and HEAD support
+- `serve_s3(root)`: minimal path-style S3-compatible server (HeadObject, GetObject with
+  Range, ListObjectsV2, PutObject and multipart uploads) over ``<root>/<bucket>/<key>``;
+  signatures are not checked
+
+Both run in a daemon thread and return a handle with ``.url`` and ``.stop()``.
+"""
+import os
+import re
+import uuid
+import shutil
+import hashlib
+import threading
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+from xml.sax.saxutils import escape
+
+RANGE_REGEX = re.compile(r'bytes=(\d*)-(\d*)')
+COPY_CHUNK = 1024 * 1024
+
+_etag_cache = {}
+
+def file_etag(path, chunk_size=8*1024*1024):
+    """S3-style ETag (md5, or multipart md5-of-md5s) for a file, cached by (path, size, mtime)."""
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    if key not in _etag_cache:
+        md5s = []
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                md5s.append(hashlib.md5(chunk))
+        if len(md5s) <= 1:
+            etag = (md5s[0] if md5s else hashlib.md5()).hexdigest()
+        else:
+            etag = hashlib.md5(b''.join(m.digest() for m in md5s)).hexdigest() + f"-{len(md5s)}"
+        _etag_cache[key] = etag
+    return _etag_cache[key]
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """Serves files under `server.root` with Range support."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _resolve(self, path):
+        return os.path.join(self.server.root, unquote(path).lstrip('/'))
+
+    def _etag(self, path):
+        return file_etag(path)
+
+    def _send_range_not_satisfiable(self, size):
+        self.send_response(416)
+        self.send_header('Content-Range', f'bytes */{size}')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _send_file(self, path, head_only=False):
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+        match = RANGE_REGEX.match(self.headers.get('Range', ''))
+        if match and not size:
+            # like S3 and nginx: no range of an empty object is satisfiable
+            self._send_range_not_satisfiable(size)
+            return
+        if match:
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last), size - 1) if last else size - 1
+            else:
+                start, end = max(size - int(last), 0), size - 1
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Length', str(max(end - start + 1, 0)))
+        self.send_header('ETag', f'"{self._etag(path)}"')
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if head_only:
+            return
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(COPY_CHUNK, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    def do_HEAD(self):
+        self._send_file(self._resolve(urlparse(self.path).path), head_only=True)
+
+    def do_GET(self):
+        self._send_file(self._resolve(urlparse(self.path).path))
+
+class _S3Handler(_FileHandler):
+    """
+    Path-style S3: /<bucket>/<key>; GET /<bucket>?list-type=2&prefix=... lists objects.
+
+    Uploaded objects keep the ETag S3 would give them (md5 for PutObject, md5-of-part-md5s
+    for multipart uploads); objects placed on disk directly get 8 MiB multipart-style ETags.
+    """
+
+    def _etag(self, path):
+        st = os.stat(path)
+        uploaded = self.server.uploaded_etags.get(path)
+        if uploaded and uploaded[0] == (st.st_size, st.st_mtime_ns):
+            return uploaded[1]
+        return file_etag(path)
+
+    def _read_body(self):
+        """Request body, decoding the aws-chunked encoding newer SDKs use for checksums."""
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if 'aws-chunked' not in self.headers.get('Content-Encoding', '') \
+                and 'x-amz-decoded-content-length' not in self.headers:
+            return data
+        body, pos = [], 0
+        while True:
+            line_end = data.index(b'\r\n', pos)
+            size = int(data[pos:line_end].split(b';')[0], 16)
+            if size == 0:
+                return b''.join(body)
+            body.append(data[line_end + 2:line_end + 2 + size])
+            pos = line_end + 2 + size + 2
+
+    def _send_xml(self, body, headers=None):
+        body = ('<?xml version="1.0" encoding="UTF-8"?>' + body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_range_not_satisfiable(self, size):
+        body = ('<?xml version="1.0" encoding="UTF-8"?><Error><Code>InvalidRange</Code>'
+                '<Message>The requested range is not satisfiable</Message></Error>').encode('utf-8')
+        self.send_response(416)
+        self.send_header('Content-Range', f'bytes */{size}')
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_empty(self, headers=None):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _store(self, path, data_or_parts, etag):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.upload"
+        with open(tmp_path, 'wb') as f:
+            if isinstance(data_or_parts, bytes):
+                f.write(data_or_parts)
+            else:
+                for part_path in data_or_parts:
+                    with open(part_path, 'rb') as part:
+                        shutil.copyfileobj(part, f, COPY_CHUNK)
+        os.replace(tmp_path, path)
+        st = os.stat(path)
+        self.server.uploaded_etags[path] = ((st.st_size, st.st_mtime_ns), etag)
+
+    def do_PUT(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        data = self._read_body()
+        if 'uploadId' in query:
+            upload_dir = os.path.join(self.server.uploads_dir, query['uploadId'][0])
+            if not os.path.isdir(upload_dir):
+                self.send_error(404)
+                return
+            with open(os.path.join(upload_dir, f"{int(query['partNumber'][0]):05d}"), 'wb') as f:
+                f.write(data)
+            self._send_empty({'ETag': f'"{hashlib.md5(data).hexdigest()}"'})
+            return
+        etag = hashlib.md5(data).hexdigest()
+        self._store(self._resolve(parsed.path), data, etag)
+        self._send_empty({'ETag': f'"{etag}"'})
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query, keep_blank_values=True)
+        self._read_body()
+        bucket, key = parsed.path.lstrip('/').split('/', 1)
+        if 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            os.makedirs(os.path.join(self.server.uploads_dir, upload_id))
+            self._send_xml('<InitiateMultipartUploadResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                           f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(unquote(key))}</Key>"
+                           f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>")
+        elif 'uploadId' in query:
+            upload_dir = os.path.join(self.server.uploads_dir, query['uploadId'][0])
+            part_paths = [os.path.join(upload_dir, name) for name in sorted(os.listdir(upload_dir))]
+            md5s = []
+            for part_path in part_paths:
+                with open(part_path, 'rb') as f:
+                    md5s.append(hashlib.md5(f.read()).digest())
+            etag = hashlib.md5(b''.join(md5s)).hexdigest() + f"-{len(md5s)}"
+            self._store(self._resolve(parsed.path), part_paths, etag)
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            self._send_xml('<CompleteMultipartUploadResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                           f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(unquote(key))}</Key>"
+                           f"<ETag>&quot;{etag}&quot;</ETag></CompleteMultipartUploadResult>")
+        else:
+            self.send_error(400)
+
+    def do_DELETE(self):
+        # AbortMultipartUpload
+        query = parse_qs(urlparse(self.path).query)
+        if 'uploadId' in query:
+            shutil.rmtree(os.path.join(self.server.uploads_dir, query['uploadId'][0]), ignore_errors=True)
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        parts = parsed.path.lstrip('/').split('/', 1)
+        query = parse_qs(parsed.query)
+        if len(parts) == 1 or parts[1] == '' or 'list-type' in query:
+            self._list_objects(parts[0], query.get('prefix', [''])[0])
+        else:
+            self._send_file(self._resolve(parsed.path))
+
+    def _list_objects(self, bucket, prefix):
+        bucket_dir = os.path.join(self.server.root, bucket)
+        contents = []
+        for dirpath, _, filenames in os.walk(bucket_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, bucket_dir)
+                if key.startswith(prefix):
+                    contents.append(
+                        f"<Contents><Key>{escape(key)}</Key><Size>{os.path.getsize(path)}</Size>"
+                        f"<ETag>&quot;{self._etag(path)}&quot;</ETag></Contents>")
+        body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+                f"<KeyCount>{len(contents)}</KeyCount><IsTruncated>false</IsTruncated>"
+                + ''.join(sorted(contents)) + '</ListBucketResult>').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _Server:
+    def __init__(self, handler, root, host='127.0.0.1', port=0):
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.root = root
+        self.httpd.uploaded_etags = {}
+        self.httpd.uploads_dir = os.path.join(root, '.uploads')
+        self.url = f"http://{host}:{self.httpd.server_port}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def serve_http(root, host='127.0.0.1', port=0):
+    return _Server(_FileHandler, root, host=host, port=port)
+
+def serve_s3(root, host='127.0.0.1', port=0):
+    return _Server(_S3Handler, root, host=host, port=port)
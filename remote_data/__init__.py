@@ -1,6 +1,117 @@
-from .download import *
-from .s5cmd_python import *
-from .cache_dir import *
-from .decompress import *
-from .metadata import get_file_metadata
-from .s3_etag import calculate_s3_etag, get_etag_from_s3_uri
\ No newline at end of file
+"""visionlab.remote_data
+
+Utilities for fetching and syncing remote data.
+
+Public names are resolved lazily (PEP 562) so that ``import visionlab.remote_data``
+stays cheap: heavy dependencies (boto3, requests, tqdm, filelock, ...) are only
+imported once the code path that needs them is used.
+"""
+import importlib
+
+# public name -> submodule that defines it
+_LAZY_EXPORTS = {
+    # download
+    'download_data_file': '.download',
+    'download_from_s3_uri': '.download',
+    'download_from_url': '.download',
+    'download_from_mirrors': '.download',
+    'probe_mirrors': '.download',
+    'load_data_file': '.download',
+    'mmap_file': '.download',
+    'load_numpy': '.download',
+    'load_tensor': '.download',
+    'Prefetcher': '.prefetch',
+    # upload
+    'upload_data_file': '.upload',
+    'publish': '.upload',
+    # ranged reads
+    'RemoteFile': '.range_reader',
+    'open_remote': '.range_reader',
+    # streaming tar shards
+    'iter_tar_members': '.tar_stream',
+    'iter_tar_samples': '.tar_stream',
+    'stream_tar_shards': '.tar_stream',
+    # content-addressed store
+    'ContentStore': '.content_store',
+    'get_content_store': '.content_store',
+    # cache catalog
+    'CacheCatalog': '.catalog',
+    'get_catalog': '.catalog',
+    # integrity scrub
+    'scrub_cache': '.scrub',
+    'verify_file': '.scrub',
+    # node-local download broker
+    'DownloadBroker': '.broker',
+    'broker_download': '.broker',
+    'BrokerUnavailableError': '.broker',
+    # pack files of small objects
+    'PackReader': '.pack',
+    'fetch_into_pack': '.pack',
+    # partitioned bulk sync
+    'partitioned_sync': '.bulk_sync',
+    'wait_for_sync': '.bulk_sync',
+    # distributed fetch
+    'get_dist_info': '.distributed',
+    'distributed_download_data_file': '.distributed',
+    # shared-memory object store
+    'ShmObjectStore': '.shm_store',
+    'fetch_small_file': '.shm_store',
+    # metrics
+    'get_metrics_snapshot': '.metrics',
+    'add_metrics_callback': '.metrics',
+    'remove_metrics_callback': '.metrics',
+    'write_prometheus_textfile': '.metrics',
+    'start_prometheus_textfile_exporter': '.metrics',
+    # tracing
+    'enable_tracing': '.tracing',
+    'disable_tracing': '.tracing',
+    'export_chrome_trace': '.tracing',
+    'export_trace_jsonl': '.tracing',
+    # torch datasets
+    'RemoteFileDataset': '.dataset',
+    'RemoteIterableDataset': '.dataset',
+    # s5cmd
+    's5cmd_download_file': '.s5cmd_python',
+    's5cmd_cp': '.s5cmd_python',
+    's5cmd_sync': '.s5cmd_python',
+    'list_bucket': '.s5cmd_python',
+    'S5cmdProgress': '.s5cmd_python',
+    'parse_s5cmd_progress': '.s5cmd_python',
+    'tune_s5cmd_transfer': '.s5cmd_python',
+    'get_s5cmd_options_with_provider_hint': '.s5cmd_python',
+    'get_s5cmd_options': '.s5cmd_python',
+    'get_s5cmd_options_for_uri': '.s5cmd_python',
+    # cache dir
+    'Platform': '.cache_dir',
+    'SHARED_DATASET_DIR': '.cache_dir',
+    'is_slurm_available': '.cache_dir',
+    'check_platform': '.cache_dir',
+    'get_cache_root': '.cache_dir',
+    'get_cache_dir': '.cache_dir',
+    # decompress
+    'get_top_level_directory_fast': '.decompress',
+    'decompress_tarfile_if_needed': '.decompress',
+    'decompress_zipfile_if_needed': '.decompress',
+    'decompress_if_needed': '.decompress',
+    # metadata / etags
+    'get_file_metadata': '.metadata',
+    'get_file_metadata_batch': '.metadata',
+    'get_signed_url': '.presign',
+    'calculate_s3_etag': '.s3_etag',
+    'get_etag_from_s3_uri': '.s3_etag',
+    'get_etag_and_size_from_s3_uri': '.s3_etag',
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    # cache on the package so __getattr__ is only hit once per name
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,374 @@
+import os
+import json
+import time
+import heapq
+import hashlib
+import socket
+import logging
+import builtins
+import itertools
+import threading
+import socketserver
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['DownloadBroker', 'BrokerUnavailableError', 'serve_broker', 'broker_download', 'get_broker_socket_path']
+
+# path of the broker's unix socket (default: $XDG_RUNTIME_DIR or /tmp, per user)
+SOCKET_ENV_VAR = 'VISIONLAB_REMOTE_DATA_BROKER_SOCKET'
+# set to 0 to never route downloads through a broker
+BROKER_ENV_VAR = 'VISIONLAB_REMOTE_DATA_BROKER'
+
+_CONNECT_TIMEOUT = 1.0
+_DISPATCH_INTERVAL = 0.5
+# download arguments that only affect how a client displays the download, not its result
+_DISPLAY_KWARGS = ('progress',)
+# env vars that change which credentials a download uses or which cache it lands in
+# (the cache root itself is compared resolved, see `_env_identity`)
+_CLIENT_ENV_VARS = ('AWS_PROFILE', 'AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN',
+                    'AWS_REGION', 'AWS_SHARED_CREDENTIALS_FILE', 'AWS_CONFIG_FILE', 'S3_ENDPOINT_URL',
+                    'VISIONLAB_REMOTE_DATA_DEDUP', 'VISIONLAB_REMOTE_DATA_CATALOG')
+
+class BrokerUnavailableError(Exception):
+    """
+    No broker can serve this request (none listening, it went away, or it runs with
+    different credentials / cache root): download in-process instead. Distinct from
+    ConnectionError, which a download that failed inside the broker may raise.
+    """
+
+def get_broker_socket_path():
+    if os.environ.get(SOCKET_ENV_VAR):
+        return os.environ[SOCKET_ENV_VAR]
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+    return os.path.join(runtime_dir, f"visionlab-remote-data-broker-{os.getuid()}.sock")
+
+def _send(wfile, message):
+    wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+    wfile.flush()
+
+def _env_identity():
+    """Digest of this process's cache root and credential env (never sends secrets)."""
+    from visionlab.remote_data.cache_dir import get_cache_root
+    cache_root = get_cache_root()
+    identity = [os.path.abspath(cache_root) if cache_root else None,
+                [os.environ.get(var) for var in _CLIENT_ENV_VARS]]
+    return hashlib.sha1(json.dumps(identity).encode('utf-8')).hexdigest()
+
+def _receive(rfile):
+    line = rfile.readline()
+    if not line:
+        raise ConnectionError("broker closed the connection")
+    return json.loads(line)
+
+class _NicRate:
+    """Node-wide receive rate (bytes/sec) over all non-loopback interfaces, from /proc/net/dev."""
+    def __init__(self):
+        self._last = self._read()
+        self.rate = 0.0
+
+    @staticmethod
+    def _read():
+        try:
+            with open('/proc/net/dev') as f:
+                lines = f.readlines()[2:]
+        except OSError:
+            return None
+        total = 0
+        for line in lines:
+            name, data = line.split(':', 1)
+            if name.strip() != 'lo':
+                total += int(data.split()[0])
+        return time.monotonic(), total
+
+    def update(self):
+        current = self._read()
+        if current is None or self._last is None:
+            return None
+        (t0, b0), (t1, b1) = self._last, current
+        if t1 - t0 >= _DISPATCH_INTERVAL:
+            self.rate = (b1 - b0) / (t1 - t0)
+            self._last = current
+        return self.rate
+
+class _Job:
+    def __init__(self, key, uri, kwargs, priority, seq):
+        self.key = key
+        self.uri = uri
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.record = None
+        self.num_requests = 1
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class DownloadBroker:
+    """
+    Node-local download broker: one process that performs the downloads requested by every
+    rank and DataLoader worker on the node, over a unix socket.
+
+    - identical requests (same uri and arguments, progress display aside) are merged into
+      one download
+    - at most `max_concurrent` downloads run at once
+    - with `max_bytes_per_sec`, a new download only starts while the node's measured
+      receive rate (all non-loopback interfaces) is below the budget; s5cmd transfers
+      can't be throttled from outside, so the budget is enforced by admission
+    - queued requests start in request order (lower `priority` values first)
+
+    Clients use `broker_download`; `download_data_file` does so automatically when a
+    broker is listening, and downloads in-process otherwise.
+
+    Args:
+        socket_path: Unix socket to listen on (default `get_broker_socket_path()`).
+        max_concurrent: Maximum number of concurrent downloads.
+        max_bytes_per_sec: Node-wide receive budget (None: no budget).
+    """
+    def __init__(self, socket_path=None, max_concurrent=4, max_bytes_per_sec=None):
+        self.socket_path = socket_path or get_broker_socket_path()
+        self.max_concurrent = max_concurrent
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self._cond = threading.Condition()
+        self._queue = []
+        self._jobs = {}
+        self._active = 0
+        self._seq = itertools.count()
+        self._nic = _NicRate()
+        self._server = None
+        self._env_identity = None
+        self.stats = dict(requests=0, merged=0, completed=0, failed=0, rejected=0)
+
+    # ---- scheduling ----
+
+    def submit(self, uri, kwargs, priority=0):
+        """Queue a download (or join the identical one already queued/running); returns the job."""
+        key = json.dumps([uri, {k: v for k, v in kwargs.items() if k not in _DISPLAY_KWARGS}], sort_keys=True)
+        with self._cond:
+            self.stats['requests'] += 1
+            job = self._jobs.get(key)
+            if job is not None:
+                job.num_requests += 1
+                self.stats['merged'] += 1
+                return job
+            job = _Job(key, uri, kwargs, priority, next(self._seq))
+            self._jobs[key] = job
+            heapq.heappush(self._queue, job)
+            self._cond.notify_all()
+            return job
+
+    def queue_position(self, job):
+        with self._cond:
+            return sum(1 for queued in self._queue if queued < job)
+
+    def _can_start(self):
+        if not self._queue or self._active >= self.max_concurrent:
+            return False
+        if self.max_bytes_per_sec and self._active > 0:
+            rate = self._nic.update()
+            if rate is not None and rate >= self.max_bytes_per_sec:
+                return False
+        return True
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while True:
+                while not self._can_start():
+                    self._cond.wait(_DISPATCH_INTERVAL)
+                job = heapq.heappop(self._queue)
+                self._active += 1
+                threading.Thread(target=self._run, args=(job,), name=f"broker:{job.uri}", daemon=True).start()
+
+    def _run(self, job):
+        from visionlab.remote_data.download import download_data_file
+        from visionlab.remote_data.single_flight import track_fetch
+        logger.info(f"Downloading {job.uri} (requested {job.num_requests}x)")
+        try:
+            with track_fetch() as record:
+                job.result = download_data_file(job.uri, use_broker=False, **job.kwargs)
+            job.record = record
+        except Exception as e:
+            logger.error(f"Download of {job.uri} failed: {e}")
+            job.error = e
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._jobs.pop(job.key, None)
+                self.stats['failed' if job.error else 'completed'] += 1
+                self._cond.notify_all()
+            job.done.set()
+
+    # ---- serving ----
+
+    def _handle(self, rfile, wfile):
+        request = _receive(rfile)
+        op = request.get('op')
+        if op == 'ping':
+            _send(wfile, dict(status='ok', pid=os.getpid()))
+            return
+        if op == 'stats':
+            with self._cond:
+                _send(wfile, dict(status='ok', active=self._active, queued=len(self._queue), **self.stats))
+            return
+        if op != 'download':
+            _send(wfile, dict(status='error', type='ValueError', error=f"unknown op {op!r}"))
+            return
+        if request.get('env') != self._env_identity:
+            # downloads run in the broker's env: another cache root or other credentials
+            # would put the file elsewhere or fetch it as someone else
+            with self._cond:
+                self.stats['rejected'] += 1
+            _send(wfile, dict(status='unavailable', error="the broker runs with a different cache root or credentials"))
+            return
+
+        job = self.submit(request['uri'], request.get('kwargs', {}), priority=request.get('priority', 0))
+        merged = job.num_requests > 1
+        _send(wfile, dict(status='queued', position=self.queue_position(job), merged=merged))
+        job.done.wait()
+        if job.error is not None:
+            _send(wfile, dict(status='error', type=type(job.error).__name__, error=str(job.error)))
+            return
+        record = dict(job.record)
+        if merged and (record['downloaded'] or record['waited']):
+            # for this client, someone else did the download
+            record = dict(downloaded=0, waited=1, deduplicated=0, bytes=0)
+        cached_file, extracted_dir = job.result
+        _send(wfile, dict(status='done', cached_file=cached_file, extracted_dir=extracted_dir, record=record))
+
+    def serve_forever(self):
+        """Listen on the socket and serve requests until interrupted."""
+        broker = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    broker._handle(self.rfile, self.wfile)
+                except (ConnectionError, BrokenPipeError, ValueError) as e:
+                    logger.debug(f"client went away: {e}")
+
+        if os.path.exists(self.socket_path):
+            if _ping(self.socket_path):
+                raise RuntimeError(f"A broker is already listening on {self.socket_path}")
+            os.remove(self.socket_path)
+
+        os.makedirs(os.path.dirname(self.socket_path) or '.', exist_ok=True)
+        self._env_identity = _env_identity()
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self._server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600)
+        threading.Thread(target=self._dispatch_loop, name="broker-dispatch", daemon=True).start()
+        logger.info(f"Broker listening on {self.socket_path} (max_concurrent={self.max_concurrent}, "
+                    f"max_bytes_per_sec={self.max_bytes_per_sec})")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+def _connect(socket_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(_CONNECT_TIMEOUT)
+    try:
+        sock.connect(socket_path)
+    except OSError as e:
+        sock.close()
+        raise BrokerUnavailableError(f"no broker at {socket_path}: {e}") from e
+    sock.settimeout(None)
+    return sock
+
+def _ping(socket_path):
+    try:
+        with _connect(socket_path) as sock, sock.makefile('rwb') as sock_file:
+            _send(sock_file, dict(op='ping'))
+            return _receive(sock_file).get('status') == 'ok'
+    except (BrokerUnavailableError, OSError, ValueError):
+        return False
+
+def _raise_remote_error(reply):
+    error_type = getattr(builtins, reply.get('type', ''), None)
+    if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+        error_type = RuntimeError
+    raise error_type(f"(broker) {reply.get('error')}")
+
+def _absolute_paths(kwargs):
+    """
+    Resolve a relative `cache_dir` here rather than in the broker's cwd (`file_name` is
+    joined onto the cache dir, so it then resolves the same in both processes).
+    """
+    kwargs = dict(kwargs)
+    if kwargs.get('cache_dir'):
+        kwargs['cache_dir'] = os.path.abspath(os.path.expanduser(kwargs['cache_dir']))
+    return kwargs
+
+def broker_download(uri, socket_path=None, priority=0, **kwargs):
+    """
+    Ask the node's broker to download `uri` (arguments as for `download_data_file`).
+
+    Downloads run in the broker's environment and working directory, so the request
+    carries a digest of this process's cache root and credential env vars, and the broker
+    refuses it unless they match its own (explicit `cache_dir` / `s3_config` arguments
+    don't change that). A relative `cache_dir` is made absolute here, and the cache root
+    is compared resolved, so the file lands where this process would have put it.
+
+    Raises BrokerUnavailableError if no broker is reachable, it goes away before
+    answering, or it refuses the request, so callers can fall back to downloading
+    in-process. Errors of the download itself are re-raised as their builtin type.
+
+    Returns:
+        (cached_file, extracted_dir)
+    """
+    from visionlab.remote_data.single_flight import _record
+    socket_path = socket_path or get_broker_socket_path()
+    if not os.path.exists(socket_path):
+        raise BrokerUnavailableError(f"no broker at {socket_path}")
+
+    kwargs = _absolute_paths(kwargs)
+    request = dict(op='download', uri=uri, kwargs=kwargs, priority=priority, env=_env_identity())
+    with _connect(socket_path) as sock, sock.makefile('rwb') as sock_file:
+        try:
+            _send(sock_file, request)
+            reply = _receive(sock_file)
+            if reply.get('status') == 'queued':
+                logger.info(f"Broker queued {uri} at position {reply.get('position')}"
+                            + (" (merged with an identical request)" if reply.get('merged') else ""))
+                reply = _receive(sock_file)
+        except OSError as e:
+            raise BrokerUnavailableError(f"lost connection to broker at {socket_path}: {e}") from e
+
+    if reply.get('status') == 'unavailable':
+        raise BrokerUnavailableError(f"broker at {socket_path} refused {uri}: {reply.get('error')}")
+    if reply.get('status') == 'error':
+        _raise_remote_error(reply)
+    for key, value in reply.get('record', {}).items():
+        _record(key, value)
+    return reply['cached_file'], reply['extracted_dir']
+
+def _use_broker_default():
+    return os.environ.get(BROKER_ENV_VAR, '1') not in ('0', 'false', 'False', '')
+
+def serve_broker(socket_path=None, max_concurrent=4, max_mbps=None):
+    """
+    Run the node-local download broker in the foreground.
+
+    Args:
+        socket_path: Unix socket to listen on (default `get_broker_socket_path()`).
+        max_concurrent: Maximum number of concurrent downloads.
+        max_mbps: Node-wide receive budget in MB/s (None: no budget).
+    """
+    logging.basicConfig(level=logging.INFO)
+    max_bytes_per_sec = max_mbps * 1e6 if max_mbps else None
+    DownloadBroker(socket_path, max_concurrent=max_concurrent, max_bytes_per_sec=max_bytes_per_sec).serve_forever()
+
+def main():
+    import fire
+    fire.Fire(serve_broker)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+import os
+import json
+import time
+import uuid
+import glob
+import heapq
+import shlex
+import hashlib
+import logging
+import tempfile
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .progress import progress_bar
+from .tracing import span
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['get_sync_worker', 'list_prefix', 'assign_objects', 'partitioned_sync', 'wait_for_sync']
+
+_POLL_INTERVAL = 2.0
+_STATE_DIRNAME = '.sync'
+DEFAULT_MAX_CONCURRENT = 16
+
+def get_sync_worker():
+    """
+    (worker_id, num_workers) of this process in a partitioned sync: SLURM array tasks
+    times torch.distributed / launcher ranks (see `get_dist_info`).
+    """
+    from visionlab.remote_data.distributed import get_dist_info
+    info = get_dist_info()
+    task_id, num_tasks = 0, 1
+    if os.environ.get('SLURM_ARRAY_TASK_ID'):
+        task_min = int(os.environ.get('SLURM_ARRAY_TASK_MIN', 0))
+        task_id = int(os.environ['SLURM_ARRAY_TASK_ID']) - task_min
+        num_tasks = int(os.environ.get('SLURM_ARRAY_TASK_COUNT',
+                                       int(os.environ.get('SLURM_ARRAY_TASK_MAX', task_id + task_min)) - task_min + 1))
+    return task_id * info['world_size'] + info['rank'], num_tasks * info['world_size']
+
+def _sync_id():
+    """Shared by every worker of one sync run (the array job, or the distributed job)."""
+    from visionlab.remote_data.distributed import _job_id
+    if os.environ.get('SLURM_ARRAY_JOB_ID'):
+        return f"slurm-array-{os.environ['SLURM_ARRAY_JOB_ID']}"
+    return _job_id()
+
+def _sync_id_is_per_run(sync_id):
+    """SLURM job ids are never reused; 'local', MASTER_ADDR-PORT and torchrun run ids are."""
+    return sync_id.startswith('slurm-')
+
+def list_prefix(prefix, s3_config=None):
+    """
+    List every object below an s3 prefix.
+
+    Returns:
+        list of dicts with key (relative to the prefix), size and etag, sorted by key
+    """
+    from visionlab.auth import create_s3_client, parse_uri
+    _, bucket_name, key_prefix, _ = parse_uri(prefix)
+    key_prefix = key_prefix.rstrip('/') + '/' if key_prefix else ''
+    s3_client = create_s3_client(prefix, s3_config=s3_config)
+    objects = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=key_prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith('/'):
+                continue
+            objects.append(dict(key=obj['Key'][len(key_prefix):], size=obj['Size'], etag=obj['ETag'].strip('"')))
+    return sorted(objects, key=lambda obj: obj['key'])
+
+def assign_objects(objects, num_workers, strategy='size'):
+    """
+    Deterministically split `objects` (as from `list_prefix`) into `num_workers` shares.
+
+    Args:
+        strategy: 'size' balances total bytes (largest first onto the least-loaded worker);
+            'hash' assigns each key by its hash, so shares stay stable as the prefix grows.
+
+    Returns:
+        list of `num_workers` lists of objects
+    """
+    shares = [[] for _ in range(num_workers)]
+    if strategy == 'hash':
+        for obj in objects:
+            digest = hashlib.sha1(obj['key'].encode('utf-8')).digest()
+            shares[int.from_bytes(digest[:8], 'big') % num_workers].append(obj)
+    elif strategy == 'size':
+        loads = [(0, worker_id) for worker_id in range(num_workers)]
+        for obj in sorted(objects, key=lambda obj: (-obj['size'], obj['key'])):
+            load, worker_id = heapq.heappop(loads)
+            shares[worker_id].append(obj)
+            heapq.heappush(loads, (load + obj['size'], worker_id))
+    else:
+        raise ValueError(f"strategy must be 'size' or 'hash', got {strategy!r}")
+    return shares
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", dir=os.path.dirname(path))
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _wait_for_json(path, what, timeout, not_before=None):
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        data = _read_json(path)
+        if data is not None and (not_before is None or data.get('started', 0) >= not_before):
+            return data
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out after {timeout}s waiting for {what} ({path})")
+        time.sleep(_POLL_INTERVAL)
+
+def _prefix_id(prefix):
+    return hashlib.sha1(prefix.encode('utf-8')).hexdigest()[:16]
+
+def _state_dir(local_dir, prefix, sync_id=None):
+    """Per-run state (listing, done markers) of one sync run."""
+    return os.path.join(local_dir, _STATE_DIRNAME, f"{sync_id or _sync_id()}-{_prefix_id(prefix)}")
+
+def _current_path(local_dir, prefix):
+    """Which run (sync id and run id) last started syncing `prefix` into `local_dir`."""
+    return os.path.join(local_dir, _STATE_DIRNAME, f"{_prefix_id(prefix)}-current.json")
+
+def _manifest_path(local_dir, prefix):
+    """The completion manifest, keyed by (local_dir, prefix) only, so any job can wait on it."""
+    return os.path.join(local_dir, _STATE_DIRNAME, f"{_prefix_id(prefix)}-manifest.json")
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _start_run(local_dir, state_dir, listing_path, prefix, s3_config):
+    """Worker 0: drop an earlier run's state, then list the prefix (or record why it couldn't)."""
+    for path in [listing_path, _manifest_path(local_dir, prefix)] + glob.glob(os.path.join(state_dir, 'done-*.json')):
+        _remove(path)
+    listing = dict(prefix=prefix, run=uuid.uuid4().hex, started=time.time())
+    _write_json(_current_path(local_dir, prefix), dict(sync_id=_sync_id(), run=listing['run'], started=listing['started']))
+    try:
+        listing['objects'] = list_prefix(prefix, s3_config)
+    except Exception as e:
+        # so the other workers fail instead of waiting for a listing that never comes
+        _write_json(listing_path, dict(listing, error=f"{type(e).__name__}: {e}"))
+        raise
+    _write_json(listing_path, listing)
+    return listing
+
+def _local_path(local_dir, key):
+    """Where object `key` goes below `local_dir`; refuses keys that would land outside it."""
+    root = os.path.abspath(local_dir)
+    path = os.path.normpath(os.path.join(root, key))
+    if path == root or os.path.commonpath([root, path]) != root:
+        raise ValueError(f"Refusing to sync object key {key!r}: it resolves outside of {local_dir}")
+    return path
+
+def _is_present(local_dir, obj):
+    path = _local_path(local_dir, obj['key'])
+    return os.path.isfile(path) and os.path.getsize(path) == obj['size']
+
+def _fetch_boto3(prefix, local_dir, objects, s3_config, max_concurrent, pbar):
+    from visionlab.auth import create_s3_client, parse_uri
+    _, bucket_name, key_prefix, _ = parse_uri(prefix)
+    key_prefix = key_prefix.rstrip('/') + '/' if key_prefix else ''
+    s3_client = create_s3_client(prefix, s3_config=s3_config)
+
+    def fetch(obj):
+        path = _local_path(local_dir, obj['key'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.part', dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            s3_client.download_file(bucket_name, key_prefix + obj['key'], tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return obj
+
+    with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+        futures = [executor.submit(fetch, obj) for obj in objects]
+        try:
+            for future in as_completed(futures):
+                pbar.update(future.result()['size'])
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+def _fetch_s5cmd(prefix, local_dir, objects, s3_config, max_concurrent, pbar):
+    """One `s5cmd run` over a command file: s5cmd schedules the copies on its own workers."""
+    from visionlab.auth import normalize_uri
+    from visionlab.remote_data.s5cmd_python import get_s5cmd_options_for_uri
+    s5cmd_options = get_s5cmd_options_for_uri(prefix,
+                                              profile=s3_config.get('profile'),
+                                              endpoint_url=s3_config.get('endpoint_url'),
+                                              region=s3_config.get('region'))
+    s3_prefix = normalize_uri(prefix).rstrip('/') + '/'
+    fd, commands_path = tempfile.mkstemp(prefix='.s5cmd-run-', suffix='.txt', dir=local_dir)
+    with os.fdopen(fd, 'w') as f:
+        for obj in objects:
+            f.write(f"cp {shlex.quote(s3_prefix + obj['key'])} {shlex.quote(_local_path(local_dir, obj['key']))}\n")
+
+    cmd_parts = ["s5cmd",
+                 s5cmd_options.get('no_signed_option'),
+                 s5cmd_options.get('endpoint_option'),
+                 f"--numworkers {s3_config.get('numworkers') or max_concurrent}",
+                 "run",
+                 commands_path]
+    cmd = " ".join(part for part in cmd_parts if part)
+    logger.info(cmd)
+    try:
+        proc = subprocess.run(cmd, shell=True, capture_output=True, text=True,
+                              env=s5cmd_options.get('env', os.environ.copy()))
+    finally:
+        os.remove(commands_path)
+    missing = [obj for obj in objects if not _is_present(local_dir, obj)]
+    pbar.update(sum(obj['size'] for obj in objects if obj not in missing))
+    if proc.returncode != 0 or missing:
+        raise RuntimeError(f"s5cmd run failed for {len(missing)} of {len(objects)} objects "
+                           f"(return code {proc.returncode}): {proc.stderr.strip()[-2000:]}")
+
+def partitioned_sync(prefix, local_dir, s3_config=None, worker_id=None, num_workers=None,
+                     strategy='size', backend=None, max_concurrent=DEFAULT_MAX_CONCURRENT,
+                     wait=True, timeout=None, show_progress=True):
+    """
+    Bring everything below an s3 `prefix` into `local_dir` (typically on a shared
+    filesystem), split across many workers so the transfer is not limited to one node.
+
+    Worker 0 lists the prefix once and shares the listing; every worker takes its
+    deterministic share (`assign_objects`), fetches the objects it doesn't already have
+    (same path and size), and writes a done marker. The worker that completes the set
+    writes the completion manifest, keyed by (`local_dir`, `prefix`) alone; with `wait`,
+    every worker returns once it exists, and other jobs can block on it with
+    `wait_for_sync`. Object keys that would resolve outside `local_dir` (e.g. containing
+    '..') are refused with ValueError before anything is fetched. Unless the run is a SLURM job (whose id
+    is never reused, so a requeued worker 0 picks up the existing listing), worker 0
+    clears the previous run's listing, done markers and manifest first, and the other
+    workers ignore a listing from before they started.
+
+    Workers default to `get_sync_worker()`: SLURM array tasks times distributed ranks.
+
+    Args:
+        prefix: s3 prefix (any provider scheme understood by visionlab.auth).
+        local_dir: Destination directory; objects keep their path below the prefix.
+        s3_config: Credentials / endpoint, as elsewhere.
+        worker_id, num_workers: Override the detected worker layout.
+        strategy: 'size' (byte-balanced) or 'hash', see `assign_objects`.
+        backend: 's5cmd' (one `s5cmd run` per share) or 'boto3'; default s5cmd if installed.
+        max_concurrent: Concurrent transfers per worker.
+        wait: If True, wait for all workers and return the manifest.
+        timeout: Seconds to wait for the listing / manifest (None: forever).
+        show_progress: If True, show a progress bar for this worker's share.
+
+    Returns:
+        the manifest dict (with `wait`), else this worker's done record
+    """
+    from visionlab.remote_data.upload import _default_backend
+    s3_config = s3_config or {}
+    backend = backend or _default_backend()
+    if worker_id is None or num_workers is None:
+        worker_id, num_workers = get_sync_worker()
+    os.makedirs(local_dir, exist_ok=True)
+    state_dir = _state_dir(local_dir, prefix)
+    listing_path = os.path.join(state_dir, 'listing.json')
+
+    with span("partitioned_sync", prefix=prefix, worker_id=worker_id, num_workers=num_workers) as call_span:
+        per_run = _sync_id_is_per_run(_sync_id())
+        listing = _read_json(listing_path) if per_run else None
+        if worker_id == 0 and (listing is None or 'error' in listing):
+            listing = _start_run(local_dir, state_dir, listing_path, prefix, s3_config)
+        elif worker_id != 0:
+            from visionlab.remote_data.distributed import _process_start_time, _MARKER_MAX_SKEW
+            not_before = None if per_run else _process_start_time() - _MARKER_MAX_SKEW
+            listing = _wait_for_json(listing_path, f"the listing of {prefix}", timeout, not_before=not_before)
+        if 'error' in listing:
+            raise RuntimeError(f"Worker 0 failed to list {prefix}: {listing['error']}")
+        objects = listing['objects']
+
+        for obj in objects:
+            _local_path(local_dir, obj['key'])
+        share = assign_objects(objects, num_workers, strategy=strategy)[worker_id]
+        todo = [obj for obj in share if not _is_present(local_dir, obj)]
+        todo_bytes = sum(obj['size'] for obj in todo)
+        logger.info(f"worker {worker_id}/{num_workers}: {len(share)} objects, {len(todo)} to fetch ({todo_bytes} bytes)")
+        call_span.set(objects=len(share), fetched=len(todo), bytes=todo_bytes)
+
+        start = time.monotonic()
+        record = dict(worker_id=worker_id, run=listing.get('run'), objects=len(share), fetched=len(todo), bytes=todo_bytes)
+        pbar = progress_bar(total=todo_bytes, unit="B", unit_scale=True, unit_divisor=1024,
+                            desc=f"sync {worker_id}/{num_workers}", disable=not show_progress)
+        try:
+            if todo:
+                fetch = _fetch_s5cmd if backend == 's5cmd' else _fetch_boto3
+                fetch(prefix, local_dir, todo, s3_config, max_concurrent, pbar)
+        except Exception as e:
+            record['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            pbar.close()
+            record['seconds'] = time.monotonic() - start
+            _write_json(os.path.join(state_dir, f"done-{worker_id}.json"), record)
+            _maybe_write_manifest(local_dir, prefix, state_dir, listing, num_workers)
+
+    if not wait:
+        return record
+    return wait_for_sync(local_dir, prefix, timeout=timeout, sync_id=_sync_id())
+
+def _maybe_write_manifest(local_dir, prefix, state_dir, listing, num_workers):
+    """Write the manifest once every worker has reported success in this run (idempotent)."""
+    records = [_read_json(os.path.join(state_dir, f"done-{worker_id}.json")) for worker_id in range(num_workers)]
+    if any(record is None or 'error' in record or record.get('run') != listing.get('run') for record in records):
+        return
+    objects = listing['objects']
+    _write_json(_manifest_path(local_dir, prefix),
+                dict(num_workers=num_workers, num_objects=len(objects), sync_id=_sync_id(), run=listing.get('run'),
+                     total_bytes=sum(obj['size'] for obj in objects),
+                     completed=time.time(), objects=objects))
+
+def wait_for_sync(local_dir, prefix, timeout=None, sync_id=None):
+    """
+    Block until the partitioned sync of `prefix` into `local_dir` has completed, and
+    return its manifest. Works from any job: by default it waits for the run that last
+    started on (`local_dir`, `prefix`), or for whatever manifest exists if none is
+    recorded; pass `sync_id` to wait for the run of one particular job instead. Raises
+    RuntimeError as soon as any worker of that run reports a failure.
+    """
+    manifest_path = _manifest_path(local_dir, prefix)
+    current_path = _current_path(local_dir, prefix)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        if sync_id is None:
+            current = _read_json(current_path) or {}
+            run_sync_id = current.get('sync_id')
+        else:
+            current, run_sync_id = None, sync_id
+        listing = (_read_json(os.path.join(_state_dir(local_dir, prefix, run_sync_id), 'listing.json')) or {}
+                   if run_sync_id else {})
+        run = listing.get('run') or (current or {}).get('run')
+        manifest = _read_json(manifest_path)
+        if manifest is not None and (run_sync_id is None or (manifest.get('sync_id') == run_sync_id
+                                                             and (run is None or manifest.get('run') == run))):
+            manifest['prefix'] = prefix
+            manifest['local_dir'] = local_dir
+            return manifest
+        errors = []
+        if 'error' in listing and listing.get('run') == run:
+            errors.append(f"worker 0: {listing['error']}")
+        state_dir = _state_dir(local_dir, prefix, run_sync_id) if run_sync_id else None
+        if state_dir and os.path.isdir(state_dir):
+            for name in sorted(os.listdir(state_dir)):
+                if name.startswith('done-') and name.endswith('.json'):
+                    record = _read_json(os.path.join(state_dir, name)) or {}
+                    if 'error' in record and run is not None and record.get('run') == run:
+                        errors.append(f"worker {record['worker_id']}: {record['error']}")
+        if errors:
+            raise RuntimeError(f"Partitioned sync of {prefix} failed:\n" + "\n".join(errors))
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out after {timeout}s waiting for the sync of {prefix}")
+        time.sleep(_POLL_INTERVAL)
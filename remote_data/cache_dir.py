@@ -1,21 +1,30 @@
 import os
 import warnings
-from torch.hub import _get_torch_home
 from enum import Enum
 from pathlib import Path
 from collections import OrderedDict
-from litdata.constants import _IS_IN_STUDIO
 from urllib.parse import urlparse
 from pdb import set_trace
 
-from visionlab.auth import (
-    get_aws_credentials_with_provider_hint,
-    normalize_uri,
-    parse_uri,
-    S3_PROVIDER_ENDPOINT_URLS
-)
 from .metadata import get_file_metadata
 
+__all__ = [
+    'SHARED_DATASET_DIR',
+    'Platform',
+    'is_slurm_available',
+    'check_platform',
+    'get_cache_root',
+    'get_cache_dir',
+]
+
+def _get_torch_home():
+    # same resolution as torch.hub._get_torch_home, without importing torch
+    return os.path.expanduser(
+        os.getenv('TORCH_HOME', os.path.join(os.getenv('XDG_CACHE_HOME', '~/.cache'), 'torch'))
+    )
+
+# same check as litdata.constants._IS_IN_STUDIO, without importing litdata
+_IS_IN_STUDIO = bool(os.getenv("LIGHTNING_CLOUD_PROJECT_ID", None)) and bool(os.getenv("LIGHTNING_CLUSTER_ID", None))
 
 _DEFAULT_STUDIO_CACHEDIR = _get_torch_home().replace("/torch", "/visionlab")
 _DEFAULT_DIRS=OrderedDict([
@@ -70,6 +79,8 @@ def get_cache_dir(source=None, cache_root=None, profile=None):
     '''
     cache_root = get_cache_root() if cache_root is None else cache_root
     if source is None: return cache_root
+    from visionlab.auth import normalize_uri, S3_PROVIDER_ENDPOINT_URLS
+
     parsed = urlparse(source)
     scheme = parsed.scheme
     netloc = parsed.netloc
@@ -0,0 +1,581 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['CacheCatalog', 'get_catalog']
+
+# set to 0 to disable the catalog, 1 to enable it even for a cache on a network
+# filesystem (it is then kept node-local), or to the path of the catalog
+CATALOG_ENV_VAR = 'VISIONLAB_REMOTE_DATA_CATALOG'
+CATALOG_FILENAME = 'catalog.sqlite'
+# SQLite's WAL mode is unsafe on these across hosts
+_NETWORK_FSTYPES = ('nfs', 'nfs4', 'lustre', 'gpfs', 'cifs', 'smb3', 'smbfs', 'beegfs', 'ceph', 'glusterfs',
+                    'fuse.glusterfs', 'fuse.sshfs', 'fuse.ceph', 'panfs', 'wekafs')
+
+# trees created by get_cache_dir (and use_hash_filename)
+CACHE_TREES = ('s3', 'http', 'https', 'mnt', 'hashid')
+ARCHIVE_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.zip')
+# bookkeeping files next to cache entries
+_SKIP_SUFFIXES = ('.lock', '.partial', '.link', '.tmp', '.index.json')
+S3_ETAG_REGEX = re.compile(r'^([0-9a-f]{32}(?:-\d+)?)(\..*)?$')
+
+# cache hits only `touch`, and rewrite last_used at most this often per file and process
+_TOUCH_INTERVAL = 60
+_BUSY_TIMEOUT = 30
+# writes on the download path give up instead of stalling a download on a busy catalog
+_HOT_PATH_BUSY_TIMEOUT = 0.5
+_MAX_TOUCHED = 65536
+_REBUILD_BATCH = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    uri TEXT,
+    provider TEXT,
+    location TEXT,
+    etag TEXT,
+    sha256 TEXT,
+    size INTEGER,
+    mtime REAL,
+    created REAL,
+    last_used REAL,
+    verified REAL,
+    etag_verified INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_uri ON files(uri);
+CREATE INDEX IF NOT EXISTS files_etag ON files(etag);
+CREATE INDEX IF NOT EXISTS files_sha256 ON files(sha256);
+CREATE INDEX IF NOT EXISTS files_last_used ON files(last_used);
+CREATE TABLE IF NOT EXISTS extractions (
+    output TEXT PRIMARY KEY,
+    archive TEXT NOT NULL,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS extractions_archive ON extractions(archive);
+"""
+
+_UPSERT_FILE = """
+INSERT INTO files (path, uri, provider, location, etag, sha256, size, mtime, created, last_used, verified, etag_verified)
+VALUES (:path, :uri, :provider, :location, :etag, :sha256, :size, :mtime, :now, :last_used, :verified, :etag_verified)
+ON CONFLICT(path) DO UPDATE SET
+    uri = COALESCE(excluded.uri, files.uri),
+    provider = COALESCE(excluded.provider, files.provider),
+    location = COALESCE(excluded.location, files.location),
+    etag = COALESCE(excluded.etag, files.etag),
+    sha256 = COALESCE(excluded.sha256, files.sha256),
+    size = excluded.size,
+    mtime = excluded.mtime,
+    last_used = MAX(COALESCE(files.last_used, 0), excluded.last_used),
+    verified = CASE
+        WHEN excluded.verified IS NOT NULL THEN excluded.verified
+        WHEN files.size IS excluded.size AND files.mtime IS excluded.mtime THEN files.verified
+        ELSE NULL END,
+    etag_verified = CASE
+        WHEN excluded.etag_verified THEN 1
+        WHEN excluded.etag IS NULL OR excluded.etag IS files.etag THEN files.etag_verified
+        ELSE 0 END
+"""
+
+_USAGE_COLUMNS = ('provider', 'location')
+
+def _split_uri(uri):
+    """(provider, location) for grouping: s3 provider and bucket, url scheme and host, or 'mnt'."""
+    if not uri:
+        return None, None
+    parsed = urlparse(uri)
+    if parsed.scheme:
+        return parsed.scheme, parsed.netloc
+    return 'mnt', None
+
+def _uri_from_cache_path(tree, relpath):
+    """The uri a cache entry was downloaded from, inferred from its place in the `get_cache_dir` layout."""
+    parts = relpath.split(os.sep)
+    if tree == 's3' and len(parts) >= 3:
+        return f"{parts[0]}://{parts[1]}/{'/'.join(parts[2:])}"
+    if tree in ('http', 'https') and len(parts) >= 2:
+        return f"{tree}://{parts[0]}/{'/'.join(parts[1:])}"
+    if tree == 'mnt':
+        return '/' + '/'.join(parts)
+    return None
+
+def _is_archive(name):
+    return name.endswith(ARCHIVE_SUFFIXES) and not name.endswith('.pth.tar')
+
+def _extraction_folder(archive):
+    """Top-level folder an archive extracts into (as `decompress_if_needed` does), or None."""
+    from .decompress import _load_tar_index, get_top_level_directory_fast
+    if archive.endswith('.zip'):
+        import zipfile
+        with zipfile.ZipFile(archive) as zip_ref:
+            names = zip_ref.namelist()
+        top = names[0].split('/')[0] if names else None
+    else:
+        index = _load_tar_index(archive)
+        if index is not None:
+            top = next((name.split('/')[0] for name, *_ in index['members'] if '/' in name), None)
+        else:
+            top = get_top_level_directory_fast(archive)
+    return os.path.join(os.path.dirname(archive), top) if top else None
+
+def _content_store_keys(cas_root):
+    """(st_dev, st_ino) -> {'etag': ..., 'sha256': ...} for the objects in the content store."""
+    keys = {}
+    for kind in ('etag', 'sha256'):
+        kind_dir = os.path.join(cas_root, kind)
+        if not os.path.isdir(kind_dir):
+            continue
+        for dirpath, _, filenames in os.walk(kind_dir):
+            for name in filenames:
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+                value = name.rsplit('-', 1)[0] if kind == 'etag' else name
+                keys.setdefault((st.st_dev, st.st_ino), {})[kind] = value
+    return keys
+
+class CacheCatalog:
+    """
+    Transactional SQLite (WAL) catalog of the cache: which uri each cache entry came
+    from, its ETag / sha256, size, when it was last used and last verified, and which
+    archive each extracted folder came from. Lookups by path, uri, ETag or sha256 are
+    index lookups instead of filesystem probes of the cache trees.
+
+    Entries are recorded by the download, verification and extraction paths, and
+    `rebuild` re-creates the catalog from what is on disk. Each thread (and forked
+    process) gets its own connection; writers wait for each other (WAL allows readers
+    during writes). SQLite's WAL mode needs a filesystem with working locks and shared
+    memory on one host: for a cache shared across nodes over NFS, point
+    VISIONLAB_REMOTE_DATA_CATALOG at a node-local path (and `rebuild` it there).
+
+    Args:
+        path: Database file (default ``<cache_root>/catalog.sqlite``; see `get_catalog`).
+    """
+    def __init__(self, path=None):
+        if path is None:
+            from .cache_dir import get_cache_root
+            path = os.path.join(get_cache_root(), CATALOG_FILENAME)
+        self.path = path
+        self._local = threading.local()
+        self._touched = {}
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # never reuse a connection inherited through fork
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=_BUSY_TIMEOUT, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            # WAL commits are durable at checkpoints; a crash loses at most the last entries
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            columns = [row['name'] for row in connection.execute("PRAGMA table_info(files)")]
+            if 'etag_verified' not in columns:
+                try:
+                    connection.execute("ALTER TABLE files ADD COLUMN etag_verified INTEGER DEFAULT 0")
+                except sqlite3.OperationalError:
+                    pass  # added by a concurrent process
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    def _write(self, sql, params=(), busy_timeout=None):
+        connection = self._connection()
+        if busy_timeout is not None:
+            connection.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = connection.executemany(sql, params) if isinstance(params, list) else connection.execute(sql, params)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        finally:
+            if busy_timeout is not None:
+                connection.execute(f"PRAGMA busy_timeout={_BUSY_TIMEOUT * 1000}")
+        return cursor.rowcount
+
+    def _query(self, sql, params=()):
+        return [dict(row) for row in self._connection().execute(sql, params)]
+
+    # ---- recording ----
+
+    def _file_row(self, path, uri=None, etag=None, sha256=None, verified=False, etag_verified=False,
+                  last_used=None, st=None):
+        st = os.stat(path) if st is None else st
+        now = time.time()
+        provider, location = _split_uri(uri)
+        return dict(path=os.path.abspath(path), uri=uri, provider=provider, location=location,
+                    etag=etag.strip('"') if etag else None, sha256=sha256.lower() if sha256 else None, size=st.st_size,
+                    mtime=st.st_mtime, now=now, last_used=now if last_used is None else last_used,
+                    verified=now if verified else None, etag_verified=int(bool(etag_verified)))
+
+    def record_file(self, path, uri=None, etag=None, sha256=None, verified=False, etag_verified=False,
+                    busy_timeout=None):
+        """
+        Add or update the entry for the cache file at `path` (size and mtime are read from
+        disk). Known fields are kept when an argument is None; the verification time is
+        kept only while the file's size and mtime are unchanged.
+
+        Args:
+            path: Cached file.
+            uri: Uri it was downloaded from.
+            etag: Remote ETag.
+            sha256: sha256 of the contents (or the prefix from a ``name-<sha256>.ext`` url).
+            verified: True if the contents were just checked against `etag` / `sha256`.
+            etag_verified: True if they were checked against `etag` itself, so the ETag is
+                known to be a content hash (not e.g. an SSE-KMS or server-specific ETag);
+                kept for as long as the recorded ETag doesn't change.
+            busy_timeout: Seconds to wait for other writers (default 30).
+        """
+        row = self._file_row(path, uri=uri, etag=etag, sha256=sha256, verified=verified, etag_verified=etag_verified)
+        self._write(_UPSERT_FILE, row, busy_timeout=busy_timeout)
+        self._touched[row['path']] = row['last_used']
+
+    def mark_verified(self, path, verified_at=None, etag_verified=False):
+        """Record that `path` passed an integrity check at `verified_at` (default now), against its ETag if `etag_verified`."""
+        st = os.stat(path)
+        self._write("UPDATE files SET verified = ?, size = ?, mtime = ?, etag_verified = MAX(etag_verified, ?) "
+                    "WHERE path = ?",
+                    (verified_at or time.time(), st.st_size, st.st_mtime, int(bool(etag_verified)),
+                     os.path.abspath(path)))
+
+    def touch(self, path, busy_timeout=None):
+        """
+        Update the last-used time of `path`. Throttled: repeated touches of a path within
+        a minute (in this process) don't write at all.
+        """
+        path = os.path.abspath(path)
+        now = time.time()
+        if now - self._touched.get(path, 0) < _TOUCH_INTERVAL:
+            return
+        if len(self._touched) > _MAX_TOUCHED:
+            self._touched.clear()
+        self._touched[path] = now
+        self._write("UPDATE files SET last_used = ? WHERE path = ? AND COALESCE(last_used, 0) < ?",
+                    (now, path, now - _TOUCH_INTERVAL), busy_timeout=busy_timeout)
+
+    def record_extraction(self, archive, output, busy_timeout=None):
+        """Record that `output` (a folder or file) was extracted from `archive` (no write if already known)."""
+        archive, output = os.path.abspath(archive), os.path.abspath(output)
+        if self.source_archive(output, exact=True) == archive:
+            return
+        self._write("INSERT INTO extractions (output, archive, created) VALUES (?, ?, ?) "
+                    "ON CONFLICT(output) DO UPDATE SET archive = excluded.archive, created = excluded.created",
+                    (output, archive, time.time()), busy_timeout=busy_timeout)
+
+    def remove(self, path):
+        """Forget the entry for `path` (and extractions into it)."""
+        path = os.path.abspath(path)
+        self._write("DELETE FROM files WHERE path = ?", (path,))
+        self._write("DELETE FROM extractions WHERE output = ?", (path,))
+
+    # ---- lookups ----
+
+    def lookup(self, path=None, uri=None, etag=None, sha256=None):
+        """
+        Entries matching all given fields, most recently used first. `sha256` matches
+        entries whose recorded hash starts with it.
+
+        Returns:
+            list of dicts (path, uri, provider, location, etag, sha256, size, mtime,
+            created, last_used, verified, etag_verified); times are unix timestamps.
+        """
+        clauses, params = [], []
+        if path is not None:
+            clauses.append("path = ?")
+            params.append(os.path.abspath(path))
+        if uri is not None:
+            clauses.append("uri = ?")
+            params.append(uri)
+        if etag is not None:
+            clauses.append("etag = ?")
+            params.append(etag.strip('"'))
+        if sha256 is not None:
+            # a prefix range, so it is still an index lookup ('g' sorts after every hex digit)
+            clauses.append("sha256 >= ? AND sha256 < ?")
+            params.extend([sha256, sha256 + 'g'])
+        if not clauses:
+            raise ValueError("lookup needs at least one of path, uri, etag, sha256")
+        return self._query(f"SELECT * FROM files WHERE {' AND '.join(clauses)} ORDER BY last_used DESC", params)
+
+    def cached_path(self, uri):
+        """Path of an existing cache entry for `uri`, or None."""
+        for entry in self.lookup(uri=uri):
+            if os.path.exists(entry['path']):
+                return entry['path']
+        return None
+
+    def entries(self, under=None):
+        """All entries (in path order), or those for files inside the folder `under`."""
+        if under is None:
+            return self._query("SELECT * FROM files ORDER BY path")
+        prefix = os.path.abspath(under) + os.sep
+        # every path starting with prefix sorts in [prefix, prefix with its last character incremented)
+        return self._query("SELECT * FROM files WHERE path >= ? AND path < ? ORDER BY path",
+                           (prefix, prefix[:-1] + chr(ord(os.sep) + 1)))
+
+    def source_archive(self, path, exact=False):
+        """
+        The archive that `path` was extracted from (it, or one of its parent folders, was
+        recorded as an extraction), or None.
+        """
+        path = os.path.abspath(path)
+        while True:
+            rows = self._query("SELECT archive FROM extractions WHERE output = ?", (path,))
+            if rows:
+                return rows[0]['archive']
+            parent = os.path.dirname(path)
+            if exact or parent == path:
+                return None
+            path = parent
+
+    def extractions(self, archive):
+        """Folders (or files) extracted from `archive`."""
+        rows = self._query("SELECT output FROM extractions WHERE archive = ?", (os.path.abspath(archive),))
+        return [row['output'] for row in rows]
+
+    # ---- reports ----
+
+    def usage(self, group_by=('provider', 'location'), unused_for=None):
+        """
+        Files and bytes per group, largest first.
+
+        Args:
+            group_by: Any of 'provider' (s3 provider / url scheme / 'mnt') and 'location'
+                (bucket / host), or an empty tuple for totals.
+            unused_for: Only count entries not used in this many seconds.
+
+        Returns:
+            list of dicts with the group columns plus files, bytes, last_used, verified_files.
+        """
+        group_by = (group_by,) if isinstance(group_by, str) else tuple(group_by)
+        unknown = set(group_by) - set(_USAGE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Can't group by {sorted(unknown)}, choose from {_USAGE_COLUMNS}")
+        columns = ''.join(f"{column}, " for column in group_by)
+        where, params = "", ()
+        if unused_for is not None:
+            where, params = "WHERE COALESCE(last_used, 0) < ?", (time.time() - unused_for,)
+        group = f"GROUP BY {', '.join(group_by)}" if group_by else ""
+        return self._query(f"SELECT {columns}COUNT(*) AS files, COALESCE(SUM(size), 0) AS bytes, "
+                           f"MAX(last_used) AS last_used, COUNT(verified) AS verified_files "
+                           f"FROM files {where} {group} ORDER BY bytes DESC", params)
+
+    def least_recently_used(self, limit=100, unused_for=None):
+        """Entries used longest ago (e.g. eviction candidates), optionally only those unused for `unused_for` seconds."""
+        where, params = "", []
+        if unused_for is not None:
+            where = "WHERE COALESCE(last_used, 0) < ?"
+            params.append(time.time() - unused_for)
+        return self._query(f"SELECT * FROM files {where} ORDER BY last_used ASC LIMIT ?", params + [limit])
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    # ---- rebuild ----
+
+    def rebuild(self, cache_root=None, progress=True):
+        """
+        Re-create the catalog from the cache on disk: walk the s3/, http(s)/, mnt/ and
+        hashid/ trees, infer each entry's uri from its path, recover ETags / sha256s from
+        the content store (same inode), and record extracted archive folders instead of
+        descending into them. Known last-used / verification times are kept for files
+        that haven't changed; entries for files that are gone are dropped.
+
+        Args:
+            cache_root: Cache to scan (default: `get_cache_root()`).
+            progress: Log a line every 10000 files.
+
+        Returns:
+            dict with files, extractions, removed.
+        """
+        if cache_root is None:
+            from .cache_dir import get_cache_root
+            cache_root = get_cache_root()
+        cache_root = os.path.abspath(cache_root)
+        store_keys = _content_store_keys(os.path.join(cache_root, 'cas'))
+
+        seen, files, extractions = set(), [], []
+        def flush():
+            if files:
+                self._write(_UPSERT_FILE, files)
+                files.clear()
+
+        for tree in CACHE_TREES:
+            tree_root = os.path.join(cache_root, tree)
+            for dirpath, dirnames, filenames in os.walk(tree_root):
+                # hidden folders are staging / bookkeeping (.extracting-*, .sync, .dist)
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+                for name in filenames:
+                    if name.startswith('.') or name.endswith(_SKIP_SUFFIXES):
+                        continue
+                    file_path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(file_path)
+                    except OSError:
+                        continue
+                    keys = store_keys.get((st.st_dev, st.st_ino), {})
+                    etag = keys.get('etag')
+                    if etag is None and tree == 'hashid':
+                        match = S3_ETAG_REGEX.match(name)
+                        etag = match.group(1) if match else None
+                    uri = _uri_from_cache_path(tree, os.path.relpath(file_path, tree_root))
+                    files.append(self._file_row(file_path, uri=uri, etag=etag, sha256=keys.get('sha256'),
+                                                last_used=st.st_atime, st=st))
+                    seen.add(file_path)
+                    if _is_archive(name):
+                        try:
+                            folder = _extraction_folder(file_path)
+                        except Exception as e:
+                            logger.warning(f"Could not read archive {file_path}: {e}")
+                            folder = None
+                        if folder is not None and os.path.isdir(folder):
+                            extractions.append((folder, file_path, st.st_mtime))
+                            # extracted contents are not cache entries of their own
+                            if os.path.basename(folder) in dirnames:
+                                dirnames.remove(os.path.basename(folder))
+                    if len(files) >= _REBUILD_BATCH:
+                        flush()
+                        if progress:
+                            logger.info(f"Catalog rebuild: {len(seen)} files")
+        flush()
+        if extractions:
+            self._write("INSERT OR REPLACE INTO extractions (output, archive, created) VALUES (?, ?, ?)", extractions)
+
+        root_prefix = cache_root + os.sep
+        stale = [(row['path'],) for row in self._query("SELECT path FROM files")
+                 if row['path'].startswith(root_prefix) and row['path'] not in seen]
+        if stale:
+            self._write("DELETE FROM files WHERE path = ?", stale)
+        logger.info(f"Rebuilt catalog {self.path}: {len(seen)} files, {len(extractions)} extractions, "
+                    f"{len(stale)} removed")
+        return dict(files=len(seen), extractions=len(extractions), removed=len(stale))
+
+def _mount_fstype(path):
+    """Filesystem type of the mount holding `path` (from /proc/mounts), or None."""
+    path = os.path.realpath(path)
+    best, fstype = '', None
+    try:
+        with open('/proc/mounts') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace('\\040', ' ')
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and len(mount_point) > len(best):
+                    best, fstype = mount_point, fields[2]
+    except OSError:
+        return None
+    return fstype
+
+def _is_network_filesystem(path):
+    fstype = _mount_fstype(path)
+    return fstype is not None and (fstype in _NETWORK_FSTYPES or fstype.split('.')[0] in _NETWORK_FSTYPES)
+
+def _node_local_path(cache_root):
+    """Catalog path on this node's local disk for a cache on a shared filesystem."""
+    import hashlib
+    import tempfile
+    root_id = hashlib.sha1(os.path.abspath(cache_root).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"visionlab-remote-data-{os.getuid()}", f"catalog-{root_id}.sqlite")
+
+_default_catalogs = {}
+_default_catalogs_lock = threading.Lock()
+_shared_roots = {}
+
+def get_catalog(path=None, enabled=None):
+    """
+    The cache catalog, or None when it is disabled or there's no cache root.
+
+    By default the catalog is ``<cache_root>/catalog.sqlite``. When the cache root is on
+    a network filesystem (NFS, Lustre, ...; e.g. netscratch), where SQLite's WAL mode is
+    unsafe across hosts, the catalog is off by default; enabling it (``enabled=True`` or
+    VISIONLAB_REMOTE_DATA_CATALOG=1) then keeps it on this node's local disk (under the
+    temp dir), so it only knows this node's downloads until `rebuild`. Set
+    VISIONLAB_REMOTE_DATA_CATALOG=0 to disable it, or to a path to keep it there.
+    """
+    setting = os.environ.get(CATALOG_ENV_VAR)
+    if enabled is None and setting is not None:
+        enabled = setting not in ('0', 'false', 'False', '')
+    if enabled is False:
+        return None
+    if path is None and setting not in (None, '0', 'false', 'False', '', '1', 'true', 'True'):
+        path = setting
+    if path is None:
+        from .cache_dir import get_cache_root
+        cache_root = get_cache_root()
+        if cache_root is None:
+            return None
+        if cache_root not in _shared_roots:
+            _shared_roots[cache_root] = _is_network_filesystem(cache_root)
+        if _shared_roots[cache_root]:
+            if not enabled:
+                return None
+            path = _node_local_path(cache_root)
+        else:
+            path = os.path.join(cache_root, CATALOG_FILENAME)
+    with _default_catalogs_lock:
+        if path not in _default_catalogs:
+            _default_catalogs[path] = CacheCatalog(path)
+        return _default_catalogs[path]
+
+def _record_file(path, **kwargs):
+    """`record_file` in the default catalog; catalog failures never fail the caller."""
+    try:
+        catalog = get_catalog()
+        if catalog is not None and os.path.isfile(path):
+            catalog.record_file(path, busy_timeout=_HOT_PATH_BUSY_TIMEOUT, **kwargs)
+    except (sqlite3.Error, OSError) as e:
+        logger.debug(f"Could not record {path} in the cache catalog: {e}")
+
+def _record_fetch(path, fetch_record, **kwargs):
+    """
+    After a download call: record the entry if the file was just fetched (downloaded,
+    waited for, or linked from the content store), else only `touch` it (a cache hit).
+    """
+    if fetch_record['downloaded'] or fetch_record['waited'] or fetch_record['deduplicated']:
+        _record_file(path, **kwargs)
+        return
+    try:
+        catalog = get_catalog()
+        if catalog is not None:
+            catalog.touch(path, busy_timeout=_HOT_PATH_BUSY_TIMEOUT)
+    except (sqlite3.Error, OSError) as e:
+        logger.debug(f"Could not touch {path} in the cache catalog: {e}")
+
+def _record_extraction(archive, output):
+    """`record_extraction` in the default catalog; catalog failures never fail the caller."""
+    try:
+        catalog = get_catalog()
+        if catalog is not None:
+            catalog.record_extraction(archive, output, busy_timeout=_HOT_PATH_BUSY_TIMEOUT)
+    except (sqlite3.Error, OSError) as e:
+        logger.debug(f"Could not record the extraction of {archive} in the cache catalog: {e}")
+
+def rebuild_catalog(cache_root=None, catalog=None):
+    """Rebuild the catalog (default: `get_catalog()`) from the cache on disk."""
+    if catalog is None:
+        catalog = get_catalog(enabled=True)
+    elif isinstance(catalog, str):
+        catalog = CacheCatalog(catalog)
+    return catalog.rebuild(cache_root)
+
+def main():
+    import fire
+    fire.Fire({
+        'rebuild': rebuild_catalog,
+        'usage': lambda group_by=('provider', 'location'), unused_for=None: get_catalog(enabled=True).usage(group_by, unused_for),
+        'lookup': lambda uri=None, etag=None, sha256=None, path=None: get_catalog(enabled=True).lookup(path=path, uri=uri, etag=etag, sha256=sha256),
+    })
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import os
+import re
+import uuid
+import errno
+import fcntl
+import shutil
+import logging
+
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from .single_flight import _record
+from .tracing import span
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['ContentStore', 'get_content_store', 'probe_http_content']
+
+# set to 0 to disable content-addressed dedup of downloads
+DEDUP_ENV_VAR = 'VISIONLAB_REMOTE_DATA_DEDUP'
+
+# only S3-style ETags (md5, or md5-of-part-md5s) identify content; other servers'
+# ETags (e.g. nginx's "<mtime>-<size>") are opaque and can't be shared across uris
+S3_ETAG_REGEX = re.compile(r'^[0-9a-f]{32}(-\d+)?$')
+SHA256_REGEX = re.compile(r'^[0-9a-f]{64}$')
+
+# linux ioctl to share extents between two files (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+def _reflink(src, dst):
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+def probe_http_content(url):
+    """
+    (etag, size) of an http(s) object from a 1-byte ranged GET (HEAD isn't allowed by
+    presigned GET urls). The ETag is None unless it looks like an S3 content hash.
+    """
+    from .range_reader import _is_empty_object_response
+    request = Request(url, headers={'Range': 'bytes=0-0', 'User-Agent': 'visionlab.remote_data'})
+    try:
+        with urlopen(request) as response:
+            etag = (response.headers.get('ETag') or '').strip('"') or None
+            content_range = response.headers.get('Content-Range')
+            if content_range and '/' in content_range:
+                total = content_range.rsplit('/', 1)[1]
+                size = int(total) if total.isdigit() else None
+            else:
+                length = response.headers.get('Content-Length')
+                size = int(length) if length else None
+    except HTTPError as e:
+        if not _is_empty_object_response(e.code, e.headers):
+            raise
+        etag, size = (e.headers.get('ETag') or '').strip('"') or None, 0
+    if etag is not None and not S3_ETAG_REGEX.match(etag):
+        etag = None
+    return etag, size
+
+class ContentStore:
+    """
+    Content-addressed store shared by all uri-path cache entries.
+
+    Objects are stored once under `root`, keyed by sha256 when known
+    (``sha256/<ab>/<sha256>``) or by S3 ETag and size (``etag/<ab>/<etag>-<size>``).
+    Cache entries (``s3/<provider>/<bucket>/<key>``, ``http/...``, ``hashid/...``) are
+    hardlinks to the stored object, so the same checkpoint reached through AWS, Wasabi
+    and a presigned url is downloaded and stored once.
+
+    - `materialize` creates a cache entry from the store (hardlink, else reflink, else
+      copy when the cache entry is on another filesystem) instead of downloading it
+    - `add` registers a downloaded file, or replaces it with a link to an identical
+      stored object
+
+    Stored objects are shared: modify cache entries by writing a new file, not in place.
+
+    Args:
+        root: Store directory (default ``<cache_root>/cas``).
+    """
+    def __init__(self, root=None):
+        if root is None:
+            from .cache_dir import get_cache_root
+            root = get_cache_root('cas')
+        self.root = root
+
+    def keys(self, etag=None, size=None, sha256=None):
+        """Store keys (relative paths) for the given identifiers, most specific first."""
+        keys = []
+        if sha256 and SHA256_REGEX.match(sha256):
+            keys.append(os.path.join('sha256', sha256[:2], sha256))
+        etag = etag.strip('"') if etag else None
+        if etag and size is not None and S3_ETAG_REGEX.match(etag):
+            keys.append(os.path.join('etag', etag[:2], f"{etag}-{size}"))
+        return keys
+
+    def has_etag_entries(self):
+        """Whether any object is stored by ETag (if not, an ETag lookup can't hit)."""
+        try:
+            with os.scandir(os.path.join(self.root, 'etag')) as it:
+                return any(True for _ in it)
+        except FileNotFoundError:
+            return False
+
+    def lookup(self, etag=None, size=None, sha256=None):
+        """Path of the stored object, or None."""
+        for key in self.keys(etag=etag, size=size, sha256=sha256):
+            path = os.path.join(self.root, key)
+            try:
+                if size is None or os.path.getsize(path) == size:
+                    return path
+            except OSError:
+                continue
+        return None
+
+    def materialize(self, dst, etag=None, size=None, sha256=None):
+        """
+        Create `dst` from the stored object, if there is one. Returns True on success.
+
+        `dst` appears atomically (linked or copied to a temp name, then renamed).
+        """
+        src = self.lookup(etag=etag, size=size, sha256=sha256)
+        if src is None:
+            return False
+        os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+        tmp_dst = f"{dst}.{uuid.uuid4().hex[:8]}.link"
+        with span("cas_materialize", file=dst, source=src) as link_span:
+            try:
+                try:
+                    os.link(src, tmp_dst)
+                    method = 'hardlink'
+                except OSError:
+                    try:
+                        _reflink(src, tmp_dst)
+                        method = 'reflink'
+                    except OSError:
+                        shutil.copyfile(src, tmp_dst)
+                        method = 'copy'
+                os.replace(tmp_dst, dst)
+            except FileNotFoundError:
+                # evicted between lookup and link
+                return False
+            finally:
+                if os.path.exists(tmp_dst):
+                    os.remove(tmp_dst)
+            link_span.set(method=method)
+        logger.info(f"Deduplicated {dst} from content store ({method}): {src}")
+        _record('deduplicated')
+        return True
+
+    def add(self, path, etag=None, size=None, sha256=None):
+        """
+        Register the file at `path` under every key it has.
+
+        Missing store entries become hardlinks to `path`; if an identical object is
+        already stored as a separate copy, `path` is replaced by a link to it.
+        Files on another filesystem than the store are left alone.
+        """
+        if size is None:
+            size = os.path.getsize(path)
+        for key in self.keys(etag=etag, size=size, sha256=sha256):
+            entry = os.path.join(self.root, key)
+            try:
+                os.makedirs(os.path.dirname(entry), exist_ok=True)
+                try:
+                    os.link(path, entry)
+                    continue
+                except FileExistsError:
+                    pass
+                if os.path.samefile(path, entry) or os.path.getsize(entry) != size:
+                    continue
+                tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.link"
+                os.link(entry, tmp_path)
+                os.replace(tmp_path, path)
+                logger.info(f"Replaced {path} with a link to {entry}")
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    logger.warning(f"Could not add {path} to content store: {e}")
+                else:
+                    logger.debug(f"{path} is on another filesystem than the content store {self.root}")
+                return
+
+_default_stores = {}
+
+def get_content_store(root=None, dedup=None):
+    """
+    The content store for `root` (default ``<cache_root>/cas``), or None when dedup is
+    disabled (``dedup=False``, or VISIONLAB_REMOTE_DATA_DEDUP=0) or there's no cache root.
+    """
+    if dedup is None:
+        dedup = os.environ.get(DEDUP_ENV_VAR, '1') not in ('0', 'false', 'False', '')
+    if not dedup:
+        return None
+    if root is None:
+        from .cache_dir import get_cache_root
+        root = get_cache_root('cas')
+        if root is None:
+            return None
+    if root not in _default_stores:
+        _default_stores[root] = ContentStore(root)
+    return _default_stores[root]
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+
+import torch
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
+
+from visionlab.remote_data.download import download_data_file
+from visionlab.remote_data.distributed import get_dist_info
+from visionlab.remote_data.prefetch import Prefetcher
+from visionlab.remote_data.single_flight import track_fetch
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['FetchStats', 'RemoteFileDataset', 'RemoteIterableDataset']
+
+def _get_dist_info():
+    """(rank, world_size) from torch.distributed if initialized, else from the launcher env."""
+    info = get_dist_info()
+    return info['rank'], info['world_size']
+
+def _get_worker_info():
+    """(worker_id, num_workers) of the current DataLoader worker ((0, 1) in the main process)."""
+    info = get_worker_info()
+    if info is None:
+        return 0, 1
+    return info.id, info.num_workers
+
+class FetchStats:
+    """
+    Cache hit/miss counts for the fetches made by one DataLoader worker (or the main process).
+
+    hits: file was already in the cache
+    misses: this process downloaded the file
+    waits: another process was downloading the file, and we waited for it
+    dedups: file was linked from the content store (cached under another uri)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.dedups = 0
+        self.bytes_downloaded = 0
+        self.fetch_seconds = 0.0
+
+    def record(self, fetch_record, seconds):
+        with self._lock:
+            if fetch_record['downloaded']:
+                self.misses += 1
+            elif fetch_record['waited']:
+                self.waits += 1
+            elif fetch_record['deduplicated']:
+                self.dedups += 1
+            else:
+                self.hits += 1
+            self.bytes_downloaded += fetch_record['bytes']
+            self.fetch_seconds += seconds
+
+    @property
+    def num_fetches(self):
+        return self.hits + self.misses + self.waits + self.dedups
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.num_fetches if self.num_fetches else 0.0
+
+    def as_dict(self):
+        rank, world_size = _get_dist_info()
+        worker_id, num_workers = _get_worker_info()
+        return dict(rank=rank, world_size=world_size, worker_id=worker_id, num_workers=num_workers,
+                    pid=os.getpid(), hits=self.hits, misses=self.misses, waits=self.waits,
+                    dedups=self.dedups, hit_rate=self.hit_rate, bytes_downloaded=self.bytes_downloaded,
+                    fetch_seconds=self.fetch_seconds)
+
+    # DataLoader pickles the dataset into each worker; each worker gets fresh counters
+    def __reduce__(self):
+        return (FetchStats, ())
+
+class _RemoteDatasetMixin:
+    """Fetch-through-cache, loading, and stats reporting shared by both datasets."""
+
+    def _init_remote(self, uris, loader, transform, stats_dir, download_kwargs):
+        self.uris = list(uris)
+        self.loader = loader
+        self.transform = transform
+        self.stats_dir = stats_dir
+        self.download_kwargs = download_kwargs
+        self.download_kwargs.setdefault('progress', False)
+        self.stats = FetchStats()
+
+    def fetch(self, uri):
+        """Download `uri` through the cache (if needed), recording a hit or miss."""
+        start = time.perf_counter()
+        with track_fetch() as record:
+            cached_file, extracted_dir = download_data_file(uri, **self.download_kwargs)
+        self.stats.record(record, time.perf_counter() - start)
+        return cached_file, extracted_dir
+
+    def load(self, uri, cached_file, extracted_dir):
+        # for non-archives, extracted_dir is the cached file itself
+        sample = extracted_dir if self.loader is None else self.loader(extracted_dir)
+        if self.transform is not None:
+            sample = self.transform(sample)
+        return sample
+
+    def report_stats(self):
+        """Log this worker's cache stats and, if `stats_dir` is set, write them as json."""
+        stats = self.stats.as_dict()
+        logger.info(f"rank {stats['rank']} worker {stats['worker_id']}: "
+                    f"{stats['hits']} hits, {stats['misses']} misses, {stats['waits']} waits, "
+                    f"{stats['dedups']} dedups "
+                    f"(hit rate {stats['hit_rate']:.1%}), {stats['bytes_downloaded']} bytes downloaded")
+        if self.stats_dir is not None:
+            os.makedirs(self.stats_dir, exist_ok=True)
+            filename = f"fetch-stats-rank{stats['rank']}-worker{stats['worker_id']}.json"
+            with open(os.path.join(self.stats_dir, filename), 'w') as f:
+                json.dump(stats, f, indent=2)
+        return stats
+
+class RemoteFileDataset(_RemoteDatasetMixin, Dataset):
+    """
+    Map-style dataset over remote files: index -> uri -> cached file -> sample.
+
+    Files are fetched on demand through the cache with `download_data_file`. Concurrent
+    workers (or ranks) asking for the same file share a single download. Each worker
+    keeps its own hit/miss counts in ``self.stats``; call `report_stats` to log them.
+
+    Args:
+        uris: Sequence of remote uris.
+        loader: Optional callable mapping the local path to a sample (default: the path).
+            For archives the path is the extracted directory.
+        transform: Optional callable applied to the loaded sample.
+        stats_dir: Optional directory where `report_stats` writes per-worker json.
+        **download_kwargs: Passed through to `download_data_file`.
+    """
+    def __init__(self, uris, loader=None, transform=None, stats_dir=None, **download_kwargs):
+        self._init_remote(uris, loader, transform, stats_dir, download_kwargs)
+
+    def __len__(self):
+        return len(self.uris)
+
+    def __getitem__(self, index):
+        uri = self.uris[index]
+        cached_file, extracted_dir = self.fetch(uri)
+        return self.load(uri, cached_file, extracted_dir)
+
+class RemoteIterableDataset(_RemoteDatasetMixin, IterableDataset):
+    """
+    Iterable dataset over remote files that prefetches ahead in the background.
+
+    The uri list is (optionally) shuffled with ``seed + epoch`` and split into disjoint
+    shards, one per (distributed rank, DataLoader worker), so no file is prefetched by
+    more than one worker. Each worker prefetches its shard with a `Prefetcher` and logs
+    its cache stats at the end of every pass.
+
+    Args:
+        uris: Sequence of remote uris.
+        loader: Optional callable mapping the local path to a sample (default: the path).
+        transform: Optional callable applied to the loaded sample.
+        shuffle: Shuffle uris each epoch (call `set_epoch` to change the order).
+        seed: Base seed for shuffling; must match across ranks.
+        even_shards: Pad shards (by repeating uris) so every rank sees the same number
+            of samples, which DDP needs to avoid hanging on the last step.
+        prefetch_files: Prefetch window (files) per worker.
+        prefetch_bytes: Prefetch window (bytes) per worker.
+        num_download_threads: Concurrent downloads per worker.
+        stats_dir: Optional directory where per-worker stats are written as json.
+        **download_kwargs: Passed through to `download_data_file`.
+    """
+    def __init__(self, uris, loader=None, transform=None, shuffle=False, seed=0,
+                 even_shards=False, prefetch_files=4, prefetch_bytes=None,
+                 num_download_threads=4, stats_dir=None, **download_kwargs):
+        self._init_remote(uris, loader, transform, stats_dir, download_kwargs)
+        self.shuffle = shuffle
+        self.seed = seed
+        self.even_shards = even_shards
+        self.prefetch_files = prefetch_files
+        self.prefetch_bytes = prefetch_bytes
+        self.num_download_threads = num_download_threads
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def shard_uris(self):
+        """The uris assigned to this (rank, worker), in iteration order."""
+        uris = list(self.uris)
+        if self.shuffle:
+            random.Random(self.seed + self.epoch).shuffle(uris)
+
+        rank, world_size = _get_dist_info()
+        worker_id, num_workers = _get_worker_info()
+        num_shards = world_size * num_workers
+        shard_id = rank * num_workers + worker_id
+
+        if self.even_shards and uris and len(uris) % num_shards:
+            padding = num_shards - len(uris) % num_shards
+            uris += (uris * (padding // len(uris) + 1))[:padding]
+        return uris[shard_id::num_shards]
+
+    def __iter__(self):
+        prefetcher = Prefetcher(self.shard_uris(),
+                                max_files=self.prefetch_files,
+                                max_bytes=self.prefetch_bytes,
+                                num_workers=self.num_download_threads,
+                                fetch_fn=self.fetch)
+        with prefetcher:
+            for uri, cached_file, extracted_dir in prefetcher:
+                yield self.load(uri, cached_file, extracted_dir)
+        self.report_stats()
@@ -1,9 +1,208 @@
 import os
+import json
+import time
+import fcntl
+import shutil
+import logging
 import zipfile
 import tarfile
+import tempfile
 
+from fnmatch import fnmatch
+from contextlib import contextmanager
 from pdb import set_trace
 
+from .metrics import extract_seconds
+from .tracing import span
+from .catalog import _record_extraction
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = [
+    'get_top_level_directory_fast',
+    'decompress_tarfile_if_needed',
+    'decompress_zipfile_if_needed',
+    'decompress_if_needed',
+]
+
+@contextmanager
+def _extraction_lock(file_path):
+    """Serialize extraction of `file_path` across processes (flock on `<file_path>.extract.lock`)."""
+    with open(f"{file_path}.extract.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _merge_into(src_dir, dst_dir):
+    """Move the contents of `src_dir` into `dst_dir`, descending into directories both have."""
+    for name in os.listdir(src_dir):
+        src, dst = os.path.join(src_dir, name), os.path.join(dst_dir, name)
+        if os.path.isdir(dst) and os.path.isdir(src) and not os.path.islink(src):
+            _merge_into(src, dst)
+        else:
+            os.replace(src, dst)
+
+def _extract_staged(extract_fn, output_dir):
+    """
+    Run `extract_fn(staging_dir)` in a hidden directory inside `output_dir`, then move the
+    extracted entries into place, so a partially extracted folder is never visible (and a
+    crashed extraction is not mistaken for a finished one). Entries are merged into
+    existing directories, so a selective extraction adds to an earlier one.
+    """
+    staging_dir = tempfile.mkdtemp(prefix='.extracting-', dir=output_dir)
+    try:
+        extract_fn(staging_dir)
+        _merge_into(staging_dir, output_dir)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def _as_list(patterns):
+    if patterns is None:
+        return []
+    return [patterns] if isinstance(patterns, str) else list(patterns)
+
+def _member_selector(include=None, exclude=None, members=None):
+    """
+    Callable ``select(member_name) -> bool`` for a selective extraction, or None to extract
+    everything.
+
+    Args:
+        include: Glob pattern(s) (fnmatch, so '*' also matches '/'); a pattern naming a
+            directory, e.g. 'val' or 'imagenet/val/', selects everything below it.
+        exclude: Glob pattern(s) removed from the selection.
+        members: Exact member name(s); a directory name selects everything below it.
+    """
+    include, exclude = _as_list(include), _as_list(exclude)
+    members = {member.rstrip('/') for member in _as_list(members)}
+    if not (include or exclude or members):
+        return None
+
+    def matches(name, patterns):
+        return any(fnmatch(name, pattern) or fnmatch(name, pattern.rstrip('/') + '/*') for pattern in patterns)
+
+    def in_members(name):
+        parts = name.split('/')
+        return any('/'.join(parts[:i]) in members for i in range(1, len(parts) + 1))
+
+    def select(name):
+        name = name.rstrip('/')
+        selected = (not include and not members) or matches(name, include) or in_members(name)
+        return selected and not matches(name, exclude)
+    return select
+
+def _selection_root(names, output_dir):
+    """The common top-level folder of the extracted members, else `output_dir`."""
+    top_levels = {name.split('/')[0] for name in names}
+    if len(top_levels) == 1 and any('/' in name for name in names):
+        return os.path.join(output_dir, top_levels.pop())
+    return output_dir
+
+def _all_present(entries, output_dir):
+    """True if every (name, size) regular-file entry already exists with that size."""
+    for name, size in entries:
+        path = os.path.join(output_dir, name)
+        if not (os.path.isfile(path) and os.path.getsize(path) == size):
+            return False
+    return True
+
+# ---- tar member index ----
+
+def _tar_index_path(file_path):
+    return f"{file_path}.index.json"
+
+def _save_tar_index(file_path, members):
+    """
+    Persist ``<archive>.index.json``: name, type, size and header offset of every member,
+    so later selective extractions know what to look for (and, for an uncompressed tar,
+    can seek straight to it).
+    """
+    stat = os.stat(file_path)
+    index = dict(size=stat.st_size, mtime=stat.st_mtime,
+                 members=[[m.name, 'f' if m.isfile() else 'd' if m.isdir() else 'o', m.size, m.offset]
+                          for m in members])
+    index_path = _tar_index_path(file_path)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        logger.debug(f"Could not write tar index {index_path}: {e}")
+
+def _load_tar_index(file_path):
+    try:
+        with open(_tar_index_path(file_path)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    stat = os.stat(file_path)
+    if index.get('size') != stat.st_size or index.get('mtime') != stat.st_mtime:
+        return None
+    return index
+
+def _extract_tar_selected(file_path, select, output_dir, members=None, include_patterns=None):
+    """
+    Extract the members of `file_path` accepted by `select` into `output_dir`.
+
+    With a persisted member index the selection is known up front: an uncompressed tar
+    seeks straight to each selected member, a compressed one is read only up to the last
+    selected member. Without an index the archive is scanned (stopping early once every
+    explicitly named file member has been found) and the index is written if the scan
+    reached the end.
+
+    Returns:
+        names of the extracted members
+    """
+    index = _load_tar_index(file_path)
+    if index is not None:
+        selected = [(name, size, offset) for name, kind, size, offset in index['members'] if select(name)]
+        if not selected:
+            return []
+        if _all_present([(name, size) for name, kind, size, _ in index['members']
+                         if kind == 'f' and select(name)], output_dir):
+            print(f"Selected members of {file_path} have already been extracted to {output_dir}.")
+            return [name for name, _, _ in selected]
+
+    def extract(staging_dir):
+        extracted = []
+        with tarfile.open(file_path, 'r:*') as tar:
+            if index is not None and file_path.endswith('.tar'):
+                # random access: read each selected header where the index says it is
+                for name, size, offset in selected:
+                    tar.fileobj.seek(offset)
+                    member = tarfile.TarInfo.fromtarfile(tar)
+                    tar.extract(member, path=staging_dir)
+                    extracted.append(member.name)
+                return extracted
+
+            remaining = None
+            if index is not None:
+                remaining = {name.rstrip('/') for name, _, _ in selected}
+            elif members and not include_patterns:
+                remaining = {member.rstrip('/') for member in _as_list(members)}
+            scanned, complete = [], True
+            for member in tar:
+                scanned.append(member)
+                if select(member.name):
+                    tar.extract(member, path=staging_dir)
+                    extracted.append(member.name)
+                    if remaining is not None and (member.isfile() or index is not None):
+                        remaining.discard(member.name.rstrip('/'))
+                        if not remaining:
+                            complete = False
+                            break
+            if index is None and complete:
+                _save_tar_index(file_path, scanned)
+        return extracted
+
+    result = []
+    _extract_staged(lambda staging_dir: result.extend(extract(staging_dir)), output_dir)
+    return result
+
+# ---- extraction ----
+
 def get_top_level_directory_fast(file_path):
     with tarfile.open(file_path, 'r:*') as tar:
         for member in tar:
@@ -11,7 +210,7 @@ def get_top_level_directory_fast(file_path):
                 return member.name.split('/')[0]
     return None
 
-def decompress_tarfile_if_needed(file_path, output_dir=None):
+def decompress_tarfile_if_needed(file_path, output_dir=None, include=None, exclude=None, members=None):
     # Check if the file exists
     if not os.path.exists(file_path):
         raise ValueError(f"File does not exist: {file_path}")
@@ -26,24 +225,43 @@ def decompress_tarfile_if_needed(file_path, output_dir=None):
     # If the output directory doesn't exist, create it
     os.makedirs(output_dir, exist_ok=True)
 
+    select = _member_selector(include, exclude, members)
+    if select is not None:
+        # Only extract the requested members
+        with _extraction_lock(file_path):
+            print(f"Extracting selected members of {file_path} to {output_dir}")
+            with extract_seconds.time(format='tar'), span("extract", file=file_path, format='tar', selective=True):
+                names = _extract_tar_selected(file_path, select, output_dir, members=members,
+                                              include_patterns=include)
+        if not names:
+            raise ValueError(f"No members of {file_path} match include={include}, exclude={exclude}, members={members}")
+        return _selection_root(names, output_dir)
+
     # Assuming the first folder inside the tar file is the root folder of its contents
     # This will be used to check if the contents have already been extracted
     top_folder_name = get_top_level_directory_fast(file_path)
     expected_extracted_folder = os.path.join(output_dir, top_folder_name)
-    
+
     # Check if the contents have already been extracted
     if os.path.exists(expected_extracted_folder):
         print(f"Contents have already been extracted to {expected_extracted_folder}.")
-    else:
+        return expected_extracted_folder
+
+    with _extraction_lock(file_path):
+        # another process may have extracted it while we waited for the lock
+        if os.path.exists(expected_extracted_folder):
+            return expected_extracted_folder
         # Contents have not been extracted; proceed with extraction
         print(f"Extracting {file_path} to {output_dir}")
-        with tarfile.open(file_path, 'r:*') as tar:
-            tar.extractall(path=output_dir)
+        with extract_seconds.time(format='tar'), span("extract", file=file_path, format='tar'), \
+                tarfile.open(file_path, 'r:*') as tar:
+            _extract_staged(lambda staging_dir: tar.extractall(path=staging_dir), output_dir)
+            _save_tar_index(file_path, tar.getmembers())
             print(f"File {file_path} has been decompressed to {output_dir}.")
 
     return expected_extracted_folder
 
-def decompress_zipfile_if_needed(file_path, output_dir=None):
+def decompress_zipfile_if_needed(file_path, output_dir=None, include=None, exclude=None, members=None):
     # Check if the file exists
     if not os.path.exists(file_path):
         raise ValueError(f"File does not exist: {file_path}")
@@ -58,30 +276,67 @@ def decompress_zipfile_if_needed(file_path, output_dir=None):
     # If the output directory doesn't exist, create it
     os.makedirs(output_dir, exist_ok=True)
 
-    # Assuming the first folder inside the zip file is the root folder of its contents
-    # This will be used to check if the contents have already been extracted
+    select = _member_selector(include, exclude, members)
     with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        if select is not None:
+            # the central directory lists every member, so only the selected ones are read
+            selected = [info for info in zip_ref.infolist() if select(info.filename)]
+            if not selected:
+                raise ValueError(f"No members of {file_path} match include={include}, exclude={exclude}, members={members}")
+            names = [info.filename for info in selected]
+            if _all_present([(info.filename, info.file_size) for info in selected if not info.is_dir()], output_dir):
+                print(f"Selected members of {file_path} have already been extracted to {output_dir}.")
+                return _selection_root(names, output_dir)
+            with _extraction_lock(file_path):
+                print(f"Extracting {len(selected)} selected members of {file_path} to {output_dir}")
+                with extract_seconds.time(format='zip'), span("extract", file=file_path, format='zip', selective=True):
+                    _extract_staged(lambda staging_dir: zip_ref.extractall(path=staging_dir, members=selected), output_dir)
+            return _selection_root(names, output_dir)
+
+        # Assuming the first folder inside the zip file is the root folder of its contents
+        # This will be used to check if the contents have already been extracted
         top_folder_name = zip_ref.namelist()[0].split('/')[0]
         expected_extracted_folder = os.path.join(output_dir, top_folder_name)
 
         # Check if the contents have already been extracted
         if os.path.exists(expected_extracted_folder):
             print(f"Contents have already been extracted to {expected_extracted_folder}.")
-        else:
+            return expected_extracted_folder
+
+        with _extraction_lock(file_path):
+            # another process may have extracted it while we waited for the lock
+            if os.path.exists(expected_extracted_folder):
+                return expected_extracted_folder
             # Contents have not been extracted; proceed with extraction
             print(f"Extracting {file_path} to {output_dir}")
-            zip_ref.extractall(path=output_dir)
+            with extract_seconds.time(format='zip'), span("extract", file=file_path, format='zip'):
+                _extract_staged(lambda staging_dir: zip_ref.extractall(path=staging_dir), output_dir)
             print(f"File {file_path} has been decompressed to {output_dir}.")
 
     return expected_extracted_folder
 
-def decompress_if_needed(file_path, output_dir=None, ignore_non_archives=True):
+def decompress_if_needed(file_path, output_dir=None, ignore_non_archives=True,
+                         include=None, exclude=None, members=None):
+    """
+    Extract a .tar / .tar.gz / .tgz / .zip archive next to it (or into `output_dir`),
+    unless it has already been extracted.
+
+    `include` / `exclude` (glob patterns) and `members` (exact names) restrict the
+    extraction to part of the archive, e.g. ``include='*/val/*'`` or
+    ``members=['meta/labels.json']``; see `_member_selector`. The selected members are
+    merged into the output directory, and the common folder of the selection is returned.
+    """
+    selection = dict(include=include, exclude=exclude, members=members)
     # Determine the file extension and call the appropriate decompression function
     if (not file_path.endswith('.pth.tar')) and (file_path.endswith('.tar') or file_path.endswith('.tar.gz') or file_path.endswith('.tgz')):
-        return decompress_tarfile_if_needed(file_path, output_dir)
+        extracted = decompress_tarfile_if_needed(file_path, output_dir, **selection)
+        _record_extraction(file_path, extracted)
+        return extracted
     elif file_path.endswith('.zip'):
-        return decompress_zipfile_if_needed(file_path, output_dir)
+        extracted = decompress_zipfile_if_needed(file_path, output_dir, **selection)
+        _record_extraction(file_path, extracted)
+        return extracted
     elif ignore_non_archives:
         return file_path
     else:
-        raise ValueError("Unsupported file type. Only .tar, .tar.gz, .tgz, and .zip files are supported.")
\ No newline at end of file
+        raise ValueError("Unsupported file type. Only .tar, .tar.gz, .tgz, and .zip files are supported.")
@@ -0,0 +1,222 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['get_dist_info', 'distributed_download_data_file']
+
+_MARKER_POLL_INTERVAL = 1.0
+# a marker written this long before this process started is from an earlier run (covers
+# the launch skew between ranks and clock skew between nodes)
+_MARKER_MAX_SKEW = 30.0
+_import_time = time.time()
+_start_time = None
+
+def _torch_dist():
+    """torch.distributed if it is initialized in this process (without importing torch)."""
+    torch = sys.modules.get('torch')
+    if torch is None:
+        return None
+    dist = getattr(torch, 'distributed', None)
+    if dist is not None and dist.is_available() and dist.is_initialized():
+        return dist
+    return None
+
+def _slurm_local_world_size():
+    if os.environ.get('SLURM_NTASKS_PER_NODE'):
+        return int(os.environ['SLURM_NTASKS_PER_NODE'])
+    # e.g. "4(x2),3": tasks on this job's nodes; use the first node's count
+    match = re.match(r'(\d+)', os.environ.get('SLURM_TASKS_PER_NODE', ''))
+    return int(match.group(1)) if match else None
+
+def get_dist_info():
+    """
+    Rank layout of this process, from torch.distributed if initialized, else from the
+    launcher env (torchrun: RANK, LOCAL_RANK, ...; SLURM: SLURM_PROCID, SLURM_LOCALID, ...).
+
+    Without LOCAL_RANK / SLURM_LOCALID, local_rank is the global rank (right only on a
+    single node), and without a per-node count, local_world_size is the world size.
+
+    Returns:
+        dict with rank, world_size, local_rank, local_world_size
+    """
+    dist = _torch_dist()
+    if dist is not None:
+        rank, world_size = dist.get_rank(), dist.get_world_size()
+    else:
+        rank = int(os.environ.get('RANK', os.environ.get('SLURM_PROCID', 0)))
+        world_size = int(os.environ.get('WORLD_SIZE', os.environ.get('SLURM_NTASKS', 1)))
+
+    local_rank = os.environ.get('LOCAL_RANK', os.environ.get('SLURM_LOCALID'))
+    local_rank = int(local_rank) if local_rank is not None else rank
+    local_world_size = os.environ.get('LOCAL_WORLD_SIZE')
+    local_world_size = int(local_world_size) if local_world_size else _slurm_local_world_size()
+    if local_world_size is None:
+        local_world_size = world_size
+    return dict(rank=rank, world_size=world_size, local_rank=local_rank, local_world_size=local_world_size)
+
+def _local_rank_known():
+    return os.environ.get('LOCAL_RANK') is not None or os.environ.get('SLURM_LOCALID') is not None
+
+def _process_start_time():
+    """Wall-clock start time of this process (from /proc, else when this module was imported)."""
+    global _start_time
+    if _start_time is None:
+        try:
+            with open('/proc/self/stat') as f:
+                # fields after the "(comm)" start at field 3; starttime is field 22
+                start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+            with open('/proc/stat') as f:
+                boot_time = next(int(line.split()[1]) for line in f if line.startswith('btime'))
+            _start_time = boot_time + start_ticks / os.sysconf('SC_CLK_TCK')
+        except (OSError, ValueError, IndexError, StopIteration):
+            _start_time = _import_time
+    return _start_time
+
+def _job_id():
+    # only namespaces the markers: 'local', MASTER_ADDR-PORT, and a torchrun run id
+    # outside rendezvous are reused across runs, so markers also carry a start time
+    if os.environ.get('SLURM_JOB_ID'):
+        return f"slurm-{os.environ['SLURM_JOB_ID']}.{os.environ.get('SLURM_STEP_ID', 0)}"
+    if os.environ.get('TORCHELASTIC_RUN_ID', 'none') != 'none':
+        return f"torchrun-{os.environ['TORCHELASTIC_RUN_ID']}"
+    if os.environ.get('MASTER_ADDR'):
+        return f"{os.environ['MASTER_ADDR']}-{os.environ.get('MASTER_PORT', 0)}"
+    return 'local'
+
+def _marker_path(uri, kwargs, scope):
+    key = hashlib.sha1(json.dumps([uri, kwargs], sort_keys=True, default=str).encode()).hexdigest()
+    if scope == 'node':
+        # node-local, so each node's leader only signals its own node
+        marker_dir = os.path.join(tempfile.gettempdir(), f"visionlab-remote-data-dist-{os.getuid()}")
+    elif kwargs.get('cache_dir'):
+        marker_dir = os.path.join(kwargs['cache_dir'], '.dist')
+    else:
+        from visionlab.remote_data.cache_dir import get_cache_root
+        marker_dir = get_cache_root('dist')
+    return os.path.join(marker_dir, f"{_job_id()}-{key}.json")
+
+def _write_marker(marker_path, state):
+    os.makedirs(os.path.dirname(marker_path), exist_ok=True)
+    tmp_path = f"{marker_path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, marker_path)
+
+def _clear_marker(marker_path):
+    try:
+        os.remove(marker_path)
+    except FileNotFoundError:
+        pass
+
+def _read_marker(marker_path):
+    try:
+        with open(marker_path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('started', 0) < _process_start_time() - _MARKER_MAX_SKEW:
+        # written by an earlier run with the same job id (its result or error is not ours)
+        return None
+    if 'error' not in state and not os.path.exists(state['cached_file']):
+        # left over from an earlier fetch whose file has since been evicted
+        return None
+    return state
+
+def _wait_for_marker(marker_path, uri, timeout):
+    logger.info(f"Waiting for the leader rank to fetch {uri}")
+    deadline = time.monotonic() + timeout
+    while True:
+        state = _read_marker(marker_path)
+        if state is not None:
+            return state
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out after {timeout}s waiting for the leader rank to fetch {uri}")
+        time.sleep(_MARKER_POLL_INTERVAL)
+
+def distributed_download_data_file(uri, scope='node', timeout=3600, **kwargs):
+    """
+    Fetch `uri` once per node (scope='node', for node-local caches) or once per job
+    (scope='global', for a cache on a shared filesystem) instead of once per rank.
+
+    The leader (local rank 0, or rank 0) downloads and extracts with `download_data_file`
+    and records the result (or error) in a marker file, stamped with the time it started
+    fetching (markers from before this run are ignored); the other ranks wait on a
+    torch.distributed barrier when one is initialized (so this must then be called by
+    every rank), or else poll the marker, and return the leader's paths without touching
+    the remote.
+    Ranks are detected from torch.distributed or the torchrun / SLURM env vars; scope='node'
+    on more than one node raises RuntimeError unless the local rank is known.
+
+    Args:
+        uri: As for `download_data_file`.
+        scope: 'node' or 'global'.
+        timeout: Seconds to wait for the leader when polling the marker.
+        **kwargs: Passed to `download_data_file`.
+
+    Returns:
+        (cached_file, extracted_dir)
+    """
+    from visionlab.remote_data.download import download_data_file
+    from visionlab.remote_data.single_flight import _record, track_fetch
+    if scope not in ('node', 'global'):
+        raise ValueError(f"scope must be 'node' or 'global', got {scope!r}")
+
+    info = get_dist_info()
+    if info['world_size'] == 1:
+        return download_data_file(uri, **kwargs)
+
+    if scope == 'node' and not _local_rank_known() and info['world_size'] > info['local_world_size']:
+        # every rank off the first node would poll a node-local marker nobody writes
+        raise RuntimeError(f"scope='node' needs each rank's local rank, but neither LOCAL_RANK nor "
+                           f"SLURM_LOCALID is set ({info['world_size']} ranks, {info['local_world_size']} "
+                           "per node); set LOCAL_RANK, or use scope='global' with a shared cache")
+
+    is_leader = (info['local_rank'] if scope == 'node' else info['rank']) == 0
+    marker_path = _marker_path(uri, kwargs, scope)
+    dist = _torch_dist()
+
+    error = None
+    if is_leader:
+        # drop an earlier run's marker before fetching, so no rank can pick it up meanwhile
+        started = time.time()
+        _clear_marker(marker_path)
+        try:
+            with track_fetch() as record:
+                cached_file, extracted_dir = download_data_file(uri, **kwargs)
+            fetched = bool(record['downloaded'] or record['waited'])
+            _write_marker(marker_path, dict(cached_file=cached_file, extracted_dir=extracted_dir,
+                                            started=started, fetched=fetched))
+        except Exception as e:
+            error = e
+            _write_marker(marker_path, dict(error=f"{type(e).__name__}: {e}", started=started))
+
+    if dist is not None:
+        dist.barrier()
+
+    if is_leader:
+        if error is not None:
+            raise error
+        return cached_file, extracted_dir
+
+    if dist is not None:
+        state = _read_marker(marker_path)
+        if state is None:
+            # our leader is on another node (no node-local rank info): fetch ourselves
+            return download_data_file(uri, **kwargs)
+    else:
+        state = _wait_for_marker(marker_path, uri, timeout)
+
+    if 'error' in state:
+        raise RuntimeError(f"Leader rank failed to fetch {uri}: {state['error']}")
+    if state.get('fetched'):
+        # a cache hit for the leader is one for us too
+        _record('waited')
+    return state['cached_file'], state['extracted_dir']
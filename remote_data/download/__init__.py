@@ -1,3 +1,5 @@
 from .download_data_file import download_data_file
 from .download_from_s3_uri import download_from_s3_uri
-from .download_from_url import download_from_url
\ No newline at end of file
+from .download_from_url import download_from_url
+from .download_from_mirrors import download_from_mirrors, probe_mirrors
+from .load_data_file import load_data_file, mmap_file, load_numpy, load_tensor
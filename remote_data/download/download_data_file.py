@@ -1,19 +1,55 @@
+import os
+import logging
 
 from visionlab.auth import check_is_s3_uri
+from ..broker import broker_download, BrokerUnavailableError, _use_broker_default
+from ..cache_dir import get_cache_root, get_cache_dir
 from .download_from_s3_uri import download_from_s3_uri
 from .download_from_url import download_from_url
+from .download_from_mirrors import download_from_mirrors
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+def _resolve_cache_dir(uri, cache_dir, use_hash_filename):
+    '''the cache_dir the download_from_* functions would pick in this process, so that a
+        broker (with its own env) writes where we would; None for http urls, whose cache
+        dir comes from a HEAD request (the broker only serves clients with its cache root)
+    '''
+    if cache_dir is not None:
+        return cache_dir
+    if use_hash_filename:
+        return get_cache_root('hashid')
+    first_uri = uri[0] if isinstance(uri, (list, tuple)) else uri
+    if check_is_s3_uri(first_uri):
+        return os.path.dirname(get_cache_dir(first_uri))
+    return None
 
 def download_data_file(uri, cache_dir=None, progress=True,
                        check_hash=False, hash_prefix=None, file_name=None,
                        expires_in_seconds=3600, use_hash_filename=False,
-                       s3_config=None):
+                       s3_config=None, dedup=None, use_broker=None,
+                       distributed=None, include=None, exclude=None, members=None):
     '''download remote data file
         Supports:
             - s3-compatible storage (public, or private - if the required 
                                      credentials are available or provided via s3_config)
             - http://, https:// urls
+            - a list of equivalent uris (mirrors); the fastest is used, see `download_from_mirrors`
+
+        With `dedup` (default on, see VISIONLAB_REMOTE_DATA_DEDUP), a file whose content is
+        already cached under another uri is linked from the content store, not downloaded.
+
+        With `use_broker` (default on, see VISIONLAB_REMOTE_DATA_BROKER), the download is
+        handed to the node's download broker when one is listening (`remote_data.broker`),
+        so all processes on the node share one queue; otherwise it runs in-process.
+
+        With `distributed='node'` (or 'global'), only local rank 0 (or rank 0) fetches and
+        extracts; the other ranks wait for it, see `distributed_download_data_file`.
+
+        `include` / `exclude` (glob patterns) and `members` (exact names) extract only part
+        of an archive, e.g. include='*/val/*', see `decompress_if_needed`.
     '''
-    
+
     # shared kwargs across fetch methods
     kwargs = dict(cache_dir=cache_dir,
                   progress=progress,
@@ -21,9 +57,30 @@ def download_data_file(uri, cache_dir=None, progress=True,
                   hash_prefix=hash_prefix,
                   file_name=file_name,
                   use_hash_filename=use_hash_filename,
-                  s3_config=s3_config)
-    
-    if check_is_s3_uri(uri):
+                  s3_config=s3_config,
+                  dedup=dedup,
+                  include=include,
+                  exclude=exclude,
+                  members=members)
+
+    if distributed:
+        from ..distributed import distributed_download_data_file
+        return distributed_download_data_file(uri, scope=distributed, expires_in_seconds=expires_in_seconds,
+                                              use_broker=use_broker, **kwargs)
+
+    if use_broker is None:
+        use_broker = _use_broker_default()
+    if use_broker:
+        try:
+            broker_kwargs = dict(kwargs, cache_dir=_resolve_cache_dir(uri, cache_dir, use_hash_filename))
+            return broker_download(uri, expires_in_seconds=expires_in_seconds, **broker_kwargs)
+        except BrokerUnavailableError as e:
+            logger.debug(f"Downloading in-process: {e}")
+
+    if isinstance(uri, (list, tuple)):
+        # equivalent copies on several providers / mirrors
+        cached_file, extracted_dir = download_from_mirrors(uri, **kwargs)
+    elif check_is_s3_uri(uri):
         # use s5cmd for faster s3 downloads
         cached_file, extracted_dir = download_from_s3_uri(uri, **kwargs)
     else:
@@ -0,0 +1,345 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from urllib.parse import urlparse
+from typing import Mapping, Any, Optional, Sequence
+
+from visionlab.remote_data.cache_dir import get_cache_root, get_cache_dir
+from visionlab.remote_data.metadata import split_name
+from visionlab.remote_data.decompress import decompress_if_needed
+from visionlab.remote_data.progress import progress_bar
+from visionlab.remote_data.range_reader import _open_range_source
+from visionlab.remote_data.single_flight import single_flight_download, track_fetch
+from visionlab.remote_data.content_store import get_content_store
+from visionlab.remote_data.catalog import _record_fetch
+from visionlab.remote_data import endpoint_stats
+from visionlab.remote_data import metrics
+from visionlab.remote_data.tracing import span
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['download_from_mirrors', 'probe_mirrors']
+
+# matches bfd8deac from resnet18-bfd8deac.pth.tar
+HASH_REGEX = re.compile(r'-([a-f0-9]*)\.(?:[^.]+(?:\.[^.]+)*)')
+
+MiB = 1024 * 1024
+DEFAULT_PROBE_BYTES = 64 * 1024
+DEFAULT_CHUNK_SIZE = 8 * MiB
+DEFAULT_STALL_TIMEOUT = 30
+# assumed per-connection throughput for endpoints we have no history for
+UNKNOWN_THROUGHPUT = 50 * MiB
+_WATCHDOG_INTERVAL = 0.5
+
+class _Mirror:
+    def __init__(self, uri, source, latency):
+        self.uri = uri
+        self.source = source
+        self.latency = latency
+        # same key s5cmd_download_file records under
+        self.endpoint = endpoint_stats.endpoint_key(uri, endpoint_url=source.endpoint_url)
+        self.error = None
+
+    @property
+    def size(self):
+        return self.source.size
+
+    @property
+    def etag(self):
+        return self.source.etag
+
+    def expected_seconds(self, num_bytes):
+        """Estimated time to fetch `num_bytes`: probe latency + bytes / recent per-connection throughput."""
+        stats = endpoint_stats.get_endpoint_stats(self.endpoint) or {}
+        return self.latency + num_bytes / (stats.get('per_stream') or UNKNOWN_THROUGHPUT)
+
+    def as_dict(self):
+        return dict(uri=self.uri, endpoint=self.endpoint, latency=self.latency, size=self.size,
+                    etag=self.etag, expected_seconds=self.expected_seconds(self.size or 0))
+
+def _probe(uris, s3_config=None, probe_bytes=DEFAULT_PROBE_BYTES, timeout=DEFAULT_STALL_TIMEOUT):
+    """Probe all uris concurrently; returns the reachable ones as _Mirror, fastest first."""
+    def probe_one(uri):
+        start = time.perf_counter()
+        source = _open_range_source(uri, s3_config=s3_config)
+        try:
+            source.probe(probe_bytes)
+        except BaseException:
+            source.close()
+            raise
+        mirror = _Mirror(uri, source, time.perf_counter() - start)
+        endpoint_stats.record_latency(mirror.endpoint, mirror.latency)
+        return mirror
+
+    executor = ThreadPoolExecutor(max_workers=len(uris))
+    futures = {executor.submit(probe_one, uri): uri for uri in uris}
+    done, not_done = wait(futures, timeout=timeout)
+    # don't wait for probes that are stuck; their threads finish (or time out) in the background
+    executor.shutdown(wait=False)
+
+    mirrors = []
+    for future in done:
+        try:
+            mirrors.append(future.result())
+        except Exception as e:
+            logger.warning(f"Mirror {futures[future]} is unavailable: {e}")
+    for future in not_done:
+        logger.warning(f"Mirror {futures[future]} did not answer within {timeout}s")
+    if not mirrors:
+        raise RuntimeError(f"None of the mirrors could be reached: {uris}")
+
+    # mirrors must agree on the size; trust the majority (the fastest mirror breaks ties)
+    mirrors.sort(key=lambda m: m.latency)
+    size_counts = Counter(m.size for m in mirrors)
+    size = max(size_counts, key=lambda s: (size_counts[s], -min(m.latency for m in mirrors if m.size == s)))
+    for mirror in mirrors:
+        if mirror.size != size:
+            logger.warning(f"Ignoring mirror {mirror.uri}: size {mirror.size} != {size}")
+            mirror.source.close()
+    mirrors = [m for m in mirrors if m.size == size]
+    mirrors.sort(key=lambda m: m.expected_seconds(size))
+    return mirrors
+
+def probe_mirrors(uris: Sequence[str], s3_config=None, probe_bytes=DEFAULT_PROBE_BYTES,
+                  timeout=DEFAULT_STALL_TIMEOUT):
+    """
+    Probe equivalent uris with a small ranged read and rank them.
+
+    Returns:
+        list of dicts (uri, endpoint, latency, size, etag, expected_seconds), fastest first.
+    """
+    mirrors = _probe(uris, s3_config=s3_config, probe_bytes=probe_bytes, timeout=timeout)
+    try:
+        return [mirror.as_dict() for mirror in mirrors]
+    finally:
+        _close(mirrors)
+
+def _close(mirrors):
+    for mirror in mirrors:
+        mirror.source.close()
+
+def _fetch_ranges(mirrors, dst, size, chunk_size, num_sources, stall_timeout, progress):
+    """
+    Download `size` bytes into `dst` in `chunk_size` ranges, from up to `num_sources`
+    mirrors at once (best ranked first).
+
+    A mirror that errors or makes no progress for `stall_timeout` seconds is dropped: the
+    bytes it already wrote are kept, the rest of its range goes back to the queue, and the
+    next-best mirror takes over.
+    """
+    pending = deque((start, min(start + chunk_size, size)) for start in range(0, size, chunk_size))
+    cond = threading.Condition()
+    active = {}
+    pbar = progress_bar(total=size, unit="B", unit_scale=True, unit_divisor=1024,
+                        desc=os.path.basename(dst), disable=not progress)
+
+    fd = os.open(dst, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, size)
+
+        def worker(mirror, state):
+            while True:
+                with cond:
+                    if not pending or mirror.error is not None:
+                        break
+                    start, end = pending.popleft()
+                pos = start
+                chunk_start = time.perf_counter()
+                try:
+                    pieces, state['close'] = mirror.source.stream(start, end, timeout=stall_timeout)
+                    state['last_progress'] = time.monotonic()
+                    for piece in pieces:
+                        piece = piece[:end - pos]
+                        os.pwrite(fd, piece, pos)
+                        pos += len(piece)
+                        state['last_progress'] = time.monotonic()
+                        pbar.update(len(piece))
+                        if pos >= end:
+                            break
+                    state['close']()
+                    if pos < end:
+                        raise IOError(f"connection closed after {pos - start} of {end - start} bytes")
+                    endpoint_stats.record_throughput(mirror.endpoint, end - start,
+                                                     time.perf_counter() - chunk_start)
+                except Exception as e:
+                    if state['stalled']:
+                        e = TimeoutError(f"no progress for {stall_timeout}s")
+                    logger.warning(f"Mirror {mirror.uri} failed at byte {pos} of [{start}, {end}): {e}; "
+                                   "falling back to the next mirror")
+                    with cond:
+                        mirror.error = e
+                        if pos < end:
+                            pending.appendleft((pos, end))
+                    break
+                finally:
+                    state['close'] = None
+            with cond:
+                active.pop(mirror, None)
+                cond.notify_all()
+
+        def start_workers():
+            healthy = [m for m in mirrors if m.error is None and m not in active]
+            while pending and len(active) < num_sources and healthy:
+                mirror = healthy.pop(0)
+                state = dict(close=None, last_progress=time.monotonic(), stalled=False)
+                active[mirror] = state
+                threading.Thread(target=worker, args=(mirror, state), daemon=True).start()
+
+        with cond:
+            start_workers()
+            while pending or active:
+                cond.wait(_WATCHDOG_INTERVAL)
+                now = time.monotonic()
+                for mirror, state in list(active.items()):
+                    if state['close'] is not None and not state['stalled'] \
+                            and now - state['last_progress'] > stall_timeout:
+                        # unblocks the worker's read; it then requeues the rest of its range
+                        state['stalled'] = True
+                        state['close']()
+                if pending and not active and all(m.error is not None for m in mirrors):
+                    errors = '; '.join(f"{m.uri}: {m.error}" for m in mirrors)
+                    raise RuntimeError(f"All mirrors failed: {errors}")
+                start_workers()
+    finally:
+        os.close(fd)
+        pbar.close()
+
+def download_from_mirrors(uris: Sequence[str], cache_dir=None, progress=True,
+                          check_hash=False, hash_prefix=None, file_name=None,
+                          s3_config=None, stripe=False, max_sources=3,
+                          chunk_size=DEFAULT_CHUNK_SIZE, probe_bytes=DEFAULT_PROBE_BYTES,
+                          stall_timeout=DEFAULT_STALL_TIMEOUT, dedup=None,
+                          lock_timeout=600, use_hash_filename=False,
+                          include=None, exclude=None, members=None) -> Mapping[str, Any]:
+    """
+    Download one file from whichever of several equivalent uris is fastest.
+
+    All uris (s3-provider uris and http(s) urls, e.g. an aws:// and a wasabi:// copy and
+    an https mirror) are probed concurrently with a small ranged read, and ranked by the
+    measured latency plus the per-endpoint throughput remembered from earlier transfers.
+    The file is fetched in `chunk_size` ranges from the best mirror, or with
+    ``stripe=True`` from the best `max_sources` mirrors at once. If a mirror errors or
+    stalls for `stall_timeout` seconds, the next mirror continues from the exact byte
+    where it stopped.
+
+    The file is cached under the path of the first uri, and downloaded at most once across
+    concurrent processes (see `single_flight_download`).
+
+    Args:
+        uris: Equivalent uris for the same object.
+        cache_dir: Cache directory (default: the cache directory of ``uris[0]``).
+        progress: If True, show a progress bar.
+        check_hash: If True, verify the sha256 prefix in the file name (``name-<sha256>.ext``).
+        hash_prefix: Expected sha256 prefix (implies verification).
+        file_name: Name of the cached file (default: basename of ``uris[0]``).
+        s3_config: Credentials/endpoint overrides (profile, endpoint_url, region).
+        stripe: If True, download ranges from several mirrors in parallel.
+        max_sources: Number of mirrors used at once when striping.
+        chunk_size: Size of each range request.
+        probe_bytes: Size of the ranged read used to probe each mirror.
+        stall_timeout: Seconds without progress before falling back to another mirror.
+        dedup: Use the content store (see `download_data_file`).
+        lock_timeout: Maximum time to wait for another process' download.
+        use_hash_filename: If True, cache as ``<cache_root>/hashid/<etag><ext>`` using the
+            ETag of the best mirror (this always probes the mirrors first).
+        include, exclude, members: Extract only part of an archive (see `decompress_if_needed`).
+
+    Returns:
+        (cached_filename, extracted_folder)
+    """
+    uris = list(uris)
+    if not uris:
+        raise ValueError("Expected at least one uri")
+
+    mirrors = []
+    try:
+        return _download_from_mirrors(uris, mirrors, cache_dir=cache_dir, progress=progress,
+                                      check_hash=check_hash, hash_prefix=hash_prefix, file_name=file_name,
+                                      s3_config=s3_config, stripe=stripe, max_sources=max_sources,
+                                      chunk_size=chunk_size, probe_bytes=probe_bytes,
+                                      stall_timeout=stall_timeout, dedup=dedup, lock_timeout=lock_timeout,
+                                      use_hash_filename=use_hash_filename,
+                                      include=include, exclude=exclude, members=members)
+    finally:
+        # the probes' http sessions (connection pools)
+        _close(mirrors)
+
+def _download_from_mirrors(uris, mirrors, cache_dir, progress, check_hash, hash_prefix, file_name,
+                           s3_config, stripe, max_sources, chunk_size, probe_bytes, stall_timeout,
+                           dedup, lock_timeout, use_hash_filename, include, exclude, members):
+    with span("download_from_mirrors", uri=uris[0], num_mirrors=len(uris)) as call_span:
+        def _get_mirrors():
+            if not mirrors:
+                with span("probe_mirrors", num_mirrors=len(uris)):
+                    mirrors.extend(_probe(uris, s3_config=s3_config, probe_bytes=probe_bytes,
+                                          timeout=stall_timeout))
+                logger.info(f"Mirror ranking: {[m.uri for m in mirrors]}")
+            return mirrors
+
+        with span("cache_path", uri=uris[0]):
+            if use_hash_filename:
+                cache_dir = cache_dir or get_cache_root('hashid')
+                _, ext = split_name(urlparse(uris[0]).path)
+                etag = next((m.etag for m in _get_mirrors() if m.etag), None)
+                if etag is None:
+                    raise ValueError(f"use_hash_filename needs an ETag, but none of the mirrors returned one: {uris}")
+                file_name = etag + ext
+            elif cache_dir is None:
+                cache_dir = os.path.dirname(get_cache_dir(uris[0]))
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        file_name = file_name or os.path.basename(urlparse(uris[0]).path)
+        cached_filename = os.path.join(cache_dir, file_name)
+        if check_hash and hash_prefix is None:
+            matches = HASH_REGEX.findall(file_name)
+            hash_prefix = matches[-1] if matches else None
+            assert hash_prefix is not None, "check_hash is True, but the filename does not contain a hash_prefix. Expected <filename>-<hashid>.<ext>"
+
+        content_store = get_content_store(dedup=dedup)
+        fetch_start = time.perf_counter()
+        with track_fetch() as fetch_record:
+            if not os.path.isfile(cached_filename):
+                size = _get_mirrors()[0].size
+                deduplicated = content_store is not None and any(
+                    content_store.materialize(cached_filename, etag=m.etag, size=size) for m in mirrors)
+                if not deduplicated:
+                    def _download(tmp_file):
+                        num_sources = min(max_sources, len(mirrors)) if stripe else 1
+                        _fetch_ranges(mirrors, tmp_file, size, chunk_size, num_sources, stall_timeout, progress)
+                        if hash_prefix is not None:
+                            _check_sha256_prefix(tmp_file, hash_prefix)
+                    single_flight_download(cached_filename, _download, lock_timeout=lock_timeout,
+                                           show_progress=progress, total_bytes=size)
+        # only a fresh download of the right size is shared with other uris (cache hits
+        # and pre-existing, possibly truncated files are not)
+        if content_store is not None and (fetch_record['downloaded'] or fetch_record['waited']):
+            for mirror in mirrors:
+                if mirror.size is not None and os.path.getsize(cached_filename) == mirror.size:
+                    content_store.add(cached_filename, etag=mirror.etag, size=mirror.size)
+        best = mirrors[0].endpoint if mirrors else endpoint_stats.endpoint_key(uris[0])
+        metrics.record_fetch('mirrors', best, fetch_record, time.perf_counter() - fetch_start)
+        call_span.set(cached_file=cached_filename, bytes=fetch_record['bytes'], best_mirror=best,
+                      cache_hit=not (fetch_record['downloaded'] or fetch_record['waited']))
+
+        etag = next((mirror.etag for mirror in mirrors if mirror.etag), None)
+        _record_fetch(cached_filename, fetch_record, uri=uris[0], etag=etag, sha256=hash_prefix,
+                      verified=hash_prefix is not None and fetch_record['downloaded'])
+        extracted_folder = decompress_if_needed(cached_filename, include=include, exclude=exclude, members=members)
+
+    return cached_filename, extracted_folder
+
+def _check_sha256_prefix(file_path, hash_prefix):
+    sha256 = hashlib.sha256()
+    with metrics.verify_seconds.time(algorithm='sha256'), span("verify_sha256", file=file_path):
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(MiB), b''):
+                sha256.update(chunk)
+    digest = sha256.hexdigest()
+    if digest[:len(hash_prefix)] != hash_prefix:
+        raise RuntimeError(f'invalid hash value (expected "{hash_prefix}", got "{digest}")')
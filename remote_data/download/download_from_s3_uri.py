@@ -1,17 +1,23 @@
 import os
 import sys
 import re
+import time
 import logging
 
 from pathlib import Path
 from typing import Mapping, Any, Optional, Dict
 from pdb import set_trace
 
-from visionlab.auth import check_is_s3_uri, normalize_uri, split_name
-from visionlab.remote_data.s3_etag import get_etag_from_s3_uri, calculate_s3_etag
+from visionlab.auth import check_is_s3_uri, normalize_uri, parse_uri, split_name
+from visionlab.remote_data.s3_etag import get_etag_and_size_from_s3_uri, calculate_s3_etag
 from visionlab.remote_data.s5cmd_python import s5cmd_download_file
 from visionlab.remote_data.cache_dir import get_cache_root, get_cache_dir
 from visionlab.remote_data.decompress import decompress_if_needed
+from visionlab.remote_data.single_flight import track_fetch
+from visionlab.remote_data.content_store import get_content_store
+from visionlab.remote_data.catalog import _record_fetch
+from visionlab.remote_data import metrics
+from visionlab.remote_data.tracing import span
 
 # matches bfd8deac from resnet18-bfd8deac.pth.tar
 HASH_REGEX = re.compile(r'-([a-f0-9]*)\.(?:[^.]+(?:\.[^.]+)*)')
@@ -20,27 +26,42 @@ logger = logging.getLogger(__name__)
 
 def download_from_s3_uri(uri, cache_dir=None, progress=True, 
                          check_hash=False, hash_prefix=None, file_name=None,
-                         s3_config=None, use_hash_filename=False) -> Mapping[str, Any]:
+                         s3_config=None, use_hash_filename=False, dedup=None,
+                         include=None, exclude=None, members=None) -> Mapping[str, Any]:
 
     logger.info(f"download_from_s3_uri: {uri}")
-    
+    with span("download_from_s3_uri", uri=uri) as call_span:
+        cached_filename, extracted_folder = _download_from_s3_uri(
+            uri, call_span, cache_dir=cache_dir, progress=progress,
+            check_hash=check_hash, hash_prefix=hash_prefix, file_name=file_name,
+            s3_config=s3_config, use_hash_filename=use_hash_filename, dedup=dedup,
+            include=include, exclude=exclude, members=members)
+    return cached_filename, extracted_folder
+
+def _download_from_s3_uri(uri, call_span, cache_dir=None, progress=True, 
+                          check_hash=False, hash_prefix=None, file_name=None,
+                          s3_config=None, use_hash_filename=False, dedup=None,
+                          include=None, exclude=None, members=None):
     # make sure this is an s3_uri
     is_s3_uri = check_is_s3_uri(uri)
     if is_s3_uri == False:
         raise ValueError(f"Expected an s3_uri, got {uri}")
 
     # get the file ETag (md5 hash-like)
-    etag = get_etag_from_s3_uri(uri, s3_config=s3_config)
+    with span("etag_head", uri=uri) as etag_span:
+        etag, object_size = get_etag_and_size_from_s3_uri(uri, s3_config=s3_config)
+        etag_span.set(etag=etag, size=object_size)
     logger.info(f"etag: {etag}")    
     
     # get the cache dir
-    if cache_dir is None: 
-        if use_hash_filename:
-            cache_dir = get_cache_root('hashid')
-        else:
-            cache_file_path = get_cache_dir(uri)
-            cache_dir = os.path.dirname(cache_file_path)
-    Path(cache_dir).mkdir(parents=True, exist_ok=True)            
+    with span("cache_path", uri=uri):
+        if cache_dir is None: 
+            if use_hash_filename:
+                cache_dir = get_cache_root('hashid')
+            else:
+                cache_file_path = get_cache_dir(uri)
+                cache_dir = os.path.dirname(cache_file_path)
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)            
     logger.info(f"cache_dir: {cache_dir}")
 
     # normalize the uri
@@ -58,27 +79,43 @@ def download_from_s3_uri(uri, cache_dir=None, progress=True,
     cached_filename = os.path.join(cache_dir, file_name)
     logger.info(f"cached_filename: {cached_filename}")
 
-    # download the file if not present:
-    if not os.path.isfile(cached_filename):
-        
-        s5cmd_download_file(
-            remote_filepath=uri, 
-            local_filepath=cached_filename,
-            s3_config=s3_config,
-            show_progress=progress
-        )
-        
+    # download the file if not present (and not already in the content store under another uri):
+    content_store = get_content_store(dedup=dedup)
+    fetch_start = time.perf_counter()
+    with track_fetch() as fetch_record:
+        if not os.path.isfile(cached_filename) and not (
+                content_store and content_store.materialize(cached_filename, etag=etag, size=object_size)):
+            s5cmd_download_file(
+                remote_filepath=uri, 
+                local_filepath=cached_filename,
+                s3_config=s3_config,
+                show_progress=progress,
+                object_size=object_size
+            )
+    metrics.record_fetch('s5cmd', parse_uri(uri)[0], fetch_record, time.perf_counter() - fetch_start)
+    call_span.set(cached_file=cached_filename, bytes=fetch_record['bytes'],
+                  cache_hit=not (fetch_record['downloaded'] or fetch_record['waited']))
+
+    if fetch_record['downloaded'] or fetch_record['waited']:
         if check_hash:
             print("computing aws s3-style etag to check file integrity...")
-            local_etag = calculate_s3_etag(cached_filename)
+            with metrics.verify_seconds.time(algorithm='s3_etag'), span("verify_etag", file=cached_filename):
+                local_etag = calculate_s3_etag(cached_filename).strip('"')
             target_etag = etag if hash_prefix is None else hash_prefix
             if local_etag != target_etag:
                 msg = f'Remote File ETag {etag} does not match Local File ETag {local_etag}'
                 logger.error(msg)
                 raise ValueError(msg)
+    verified = check_hash and (fetch_record['downloaded'] or fetch_record['waited'])
+    # only a fresh download of the right size (and ETag, with check_hash) is shared with
+    # other uris; a pre-existing or truncated file must not be handed out under this ETag
+    if (content_store is not None and (fetch_record['downloaded'] or fetch_record['waited'])
+            and os.path.getsize(cached_filename) == object_size):
+        content_store.add(cached_filename, etag=etag, size=object_size)
+    _record_fetch(cached_filename, fetch_record, uri=uri, etag=etag, verified=verified,
+                  etag_verified=verified and hash_prefix is None)
 
     # extract if this is a compressed file:
-    extracted_folder = decompress_if_needed(cached_filename)
+    extracted_folder = decompress_if_needed(cached_filename, include=include, exclude=exclude, members=members)
     
     return cached_filename, extracted_folder
-    
\ No newline at end of file
@@ -1,53 +1,146 @@
 import os
 import sys
 import re
+import errno
+import shutil
+import time
+import hashlib
 import logging
+import tempfile
+import warnings
 
 from urllib.parse import urlparse
-from torch.hub import download_url_to_file
+from urllib.request import Request, urlopen
 from typing import Mapping, Any, Optional, Dict
 from pdb import set_trace
 
-from visionlab.auth import sign_url_if_needed
+from visionlab.remote_data.presign import get_signed_url
 from visionlab.remote_data.cache_dir import get_cache_root, get_cache_dir
 from visionlab.remote_data.metadata import get_file_metadata
 from visionlab.remote_data.decompress import decompress_if_needed
+from visionlab.remote_data.progress import progress_bar
+from visionlab.remote_data.single_flight import single_flight_download, track_fetch
+from visionlab.remote_data.content_store import get_content_store, probe_http_content
+from visionlab.remote_data.catalog import _record_fetch
+from visionlab.remote_data import metrics
+from visionlab.remote_data.tracing import span
 
 logger = logging.getLogger(__name__)
 
 # matches bfd8deac from resnet18-bfd8deac.pth.tar
 HASH_REGEX = re.compile(r'-([a-f0-9]*)\.(?:[^.]+(?:\.[^.]+)*)')
 
+READ_DATA_CHUNK = 128 * 1024
+
+def download_url_to_file(url: str, dst: str, hash_prefix: Optional[str] = None,
+                         progress: bool = True, in_place: bool = False):
+    r"""Download object at the given URL to a local path.
+
+    Port of :func:`torch.hub.download_url_to_file` so that plain http(s) downloads
+    don't require importing torch. The object is streamed into a temporary file
+    next to ``dst`` and moved into place once complete (and verified).
+
+    Args:
+        url (str): URL of the object to download
+        dst (str): Full path where object will be saved, e.g. ``/tmp/temporary_file``
+        hash_prefix (str, optional): If not None, the SHA256 downloaded file should start with ``hash_prefix``.
+            Default: None
+        progress (bool, optional): whether or not to display a progress bar to stderr
+            Default: True
+        in_place (bool, optional): write straight to ``dst``, which the caller already treats as
+            a temporary file (e.g. the temp path of :func:`single_flight_download`, whose size
+            waiting processes poll for their progress bars). Default: False
+
+    Returns:
+        the response headers
+    """
+    file_size = None
+    req = Request(url, headers={"User-Agent": "visionlab.remote_data"})
+    u = urlopen(req)
+    headers = u.info()
+    content_length = headers.get("Content-Length")
+    if content_length:
+        file_size = int(content_length)
+
+    # Write to a temporary file in the destination folder and move it into place
+    # at the end, so a partial download is never mistaken for a cached file.
+    dst = os.path.expanduser(dst)
+    dst_dir = os.path.dirname(dst)
+    if in_place:
+        f = open(dst, 'wb')
+    else:
+        f = tempfile.NamedTemporaryFile(delete=False, dir=dst_dir, prefix=".download-", suffix=".partial")
+    try:
+        sha256 = hashlib.sha256() if hash_prefix is not None else None
+        with progress_bar(total=file_size, disable=not progress,
+                          unit="B", unit_scale=True, unit_divisor=1024) as pbar:
+            while True:
+                buffer = u.read(READ_DATA_CHUNK)
+                if len(buffer) == 0:
+                    break
+                f.write(buffer)
+                if sha256 is not None:
+                    sha256.update(buffer)
+                pbar.update(len(buffer))
+
+        f.close()
+        if sha256 is not None:
+            digest = sha256.hexdigest()
+            if digest[:len(hash_prefix)] != hash_prefix:
+                raise RuntimeError(f'invalid hash value (expected "{hash_prefix}", got "{digest}")')
+        if not in_place:
+            shutil.move(f.name, dst)
+    finally:
+        f.close()
+        u.close()
+        # in place, the caller removes what is left of a failed download
+        if not in_place and os.path.exists(f.name):
+            os.remove(f.name)
+    return headers
+
 def download_from_url(url, cache_dir=None, progress=True, 
                       check_hash=False, hash_prefix=None, file_name=None,
                       expires_in_seconds=3600, s3_config=None,
-                      use_hash_filename=False) -> Mapping[str, Any]:
+                      use_hash_filename=False, dedup=None,
+                      include=None, exclude=None, members=None) -> Mapping[str, Any]:
     
-    signed_url = sign_url_if_needed(url, s3_config=s3_config)
-
-    if cache_dir is None: 
-        if use_hash_filename:
-            cache_dir = get_cache_root('hashid')
-        else:
-            cache_file_path = get_cache_dir(signed_url)
-            cache_dir = os.path.dirname(cache_file_path)
-
-    if use_hash_filename:
-        metadata = get_file_metadata(signed_url)
-        file_name = metadata['signature'] + metadata['ext']
-        hash_prefix = metadata.get('sha256_prefix', hash_prefix)     
-        
-    cached_filename = torch_download_data_from_url(
-        url = signed_url,
-        data_dir = cache_dir,
-        progress = progress,
-        check_hash = check_hash,
-        hash_prefix = hash_prefix,
-        file_name = file_name,
-    )
-
-    logger.info(f"cached_filename: {cached_filename}")
-    extracted_folder = decompress_if_needed(cached_filename)
+    with span("download_from_url", uri=url) as call_span:
+        with span("sign_url", uri=url):
+            signed_url = get_signed_url(url, s3_config=s3_config, expires_in_seconds=expires_in_seconds)
+
+        with span("cache_path", uri=url):
+            if cache_dir is None: 
+                if use_hash_filename:
+                    cache_dir = get_cache_root('hashid')
+                else:
+                    cache_file_path = get_cache_dir(signed_url)
+                    cache_dir = os.path.dirname(cache_file_path)
+
+            if use_hash_filename:
+                metadata = get_file_metadata(signed_url)
+                file_name = metadata['signature'] + metadata['ext']
+                hash_prefix = metadata.get('sha256_prefix', hash_prefix)     
+            
+        fetch_start = time.perf_counter()
+        with track_fetch() as fetch_record:
+            cached_filename = torch_download_data_from_url(
+                url = signed_url,
+                data_dir = cache_dir,
+                progress = progress,
+                check_hash = check_hash,
+                hash_prefix = hash_prefix,
+                file_name = file_name,
+                content_store = get_content_store(dedup=dedup),
+            )
+        metrics.record_fetch('http', urlparse(url).netloc, fetch_record, time.perf_counter() - fetch_start)
+        call_span.set(cached_file=cached_filename, bytes=fetch_record['bytes'],
+                      cache_hit=not (fetch_record['downloaded'] or fetch_record['waited']))
+
+        logger.info(f"cached_filename: {cached_filename}")
+        # download_url_to_file checks the sha256 prefix of what it downloads
+        _record_fetch(cached_filename, fetch_record, uri=url, sha256=hash_prefix,
+                      verified=hash_prefix is not None and fetch_record['downloaded'])
+        extracted_folder = decompress_if_needed(cached_filename, include=include, exclude=exclude, members=members)
 
     return cached_filename, extracted_folder
     
@@ -57,7 +150,8 @@ def torch_download_data_from_url(
     progress: bool = True,
     check_hash: bool = False,
     hash_prefix: Optional[str] = None,
-    file_name: Optional[str] = None
+    file_name: Optional[str] = None,
+    content_store = None,
 ) -> Dict[str, Any]:
     r"""Downloads the object at the given URL.
 
@@ -67,8 +161,8 @@ def torch_download_data_from_url(
     If the object is already present in `data_dir`, it's deserialized and
     returned.
 
-    The default value of ``data_dir`` is ``<hub_dir>/../data`` where
-    ``hub_dir`` is the directory returned by :func:`~torch.hub.get_dir`.
+    The default value of ``data_dir`` is ``<cache_root>/data`` where
+    ``cache_root`` is the directory returned by :func:`get_cache_root`.
 
     Args:
         url (str): URL of the object to download
@@ -81,6 +175,9 @@ def torch_download_data_from_url(
             ensure unique names and to verify the contents of the file.
             Default: False
         file_name (str, optional): name for the downloaded file. Filename from ``url`` will be used if not set.
+        content_store (ContentStore, optional): if given, a missing file is linked from the store when
+            an object with the same S3-style ETag and size (or full sha256 ``hash_prefix``) is already
+            there, and downloaded files are added to it.
 
     Example:
         >>> state_dict = torch.hub.load_state_dict_from_url('https://s3.amazonaws.com/pytorch/models/resnet18-5c106cde.pth')
@@ -91,7 +188,7 @@ def torch_download_data_from_url(
         warnings.warn('TORCH_MODEL_ZOO is deprecated, please use env TORCH_HOME instead')    
     
     if data_dir is None:
-        data_dir = default_data_dir
+        data_dir = get_cache_root('data')
 
     try:
         os.makedirs(data_dir, exist_ok=True)
@@ -121,8 +218,35 @@ def torch_download_data_from_url(
     else:
         cached_file = os.path.join(data_dir, filename)
 
-    if not os.path.exists(cached_file):
+    content_keys = dict(sha256=hash_prefix)
+    # the ETag probe costs a request, so only make it when an ETag lookup can hit
+    if content_store is not None and not os.path.exists(cached_file) and content_store.has_etag_entries():
+        try:
+            content_keys['etag'], content_keys['size'] = probe_http_content(url)
+        except OSError as e:
+            logger.debug(f"Could not probe {url} for its ETag: {e}")
+
+    if not os.path.exists(cached_file) and not (
+            content_store is not None and content_store.materialize(cached_file, **content_keys)):
         sys.stderr.write('Downloading: "{}" to {}\n'.format(url, cached_file))
-        download_url_to_file(url, cached_file, hash_prefix, progress=progress)
+        response_headers = {}
+
+        def download(tmp_file):
+            response_headers.update(download_url_to_file(url, tmp_file, hash_prefix, progress=progress, in_place=True))
+
+        # one process downloads, concurrent callers (e.g. DataLoader workers) wait for it
+        with track_fetch() as fetch_record:
+            single_flight_download(cached_file, download, show_progress=progress,
+                                   total_bytes=content_keys.get('size'))
+        # only share what this process just downloaded, at the advertised size (the sha256
+        # key is checked by download_url_to_file); the keys come from the probe, or else
+        # from the download's own response
+        if content_store is not None and fetch_record['downloaded']:
+            if 'etag' not in content_keys:
+                content_keys['etag'] = (response_headers.get('ETag') or '').strip('"') or None
+                length = response_headers.get('Content-Length')
+                content_keys['size'] = int(length) if length else None
+            if content_keys['size'] in (None, os.path.getsize(cached_file)):
+                content_store.add(cached_file, **content_keys)
 
     return cached_file
\ No newline at end of file
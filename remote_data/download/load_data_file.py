@@ -0,0 +1,164 @@
+import os
+import mmap
+import logging
+import warnings
+
+from .download_data_file import download_data_file
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['mmap_file', 'load_numpy', 'load_tensor', 'load_data_file']
+
+_MADVISE = {
+    'normal': 'MADV_NORMAL',
+    'sequential': 'MADV_SEQUENTIAL',
+    'random': 'MADV_RANDOM',
+    'willneed': 'MADV_WILLNEED',
+}
+
+def _madvise(mapping, advice):
+    """Pass a page-cache access hint for the whole mapping (no-op where unsupported)."""
+    if advice is None:
+        return
+    flag = getattr(mmap, _MADVISE[advice], None)
+    if flag is not None and hasattr(mapping, 'madvise'):
+        mapping.madvise(flag)
+
+def mmap_file(file_path, readonly=True, advice=None):
+    """
+    Memory-map a local file and return a memoryview of its bytes.
+
+    The mapping is backed by the page cache, so every process on the node that maps the
+    same cached file shares one physical copy. With ``readonly=False`` the mapping is
+    copy-on-write: writes are private to this process and never modify the cached file.
+
+    Args:
+        file_path: Path to the local (cached) file.
+        readonly: Map read-only (default) or copy-on-write.
+        advice: Optional access hint: 'normal', 'sequential', 'random' or 'willneed'.
+
+    Returns:
+        memoryview
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        access = mmap.ACCESS_READ if readonly else mmap.ACCESS_COPY
+        mapping = mmap.mmap(f.fileno(), 0, access=access)
+    _madvise(mapping, advice)
+    return memoryview(mapping)
+
+def load_numpy(file_path, dtype=None, shape=None, offset=0, readonly=True, advice=None):
+    """
+    Memory-map a local file as a NumPy array.
+
+    ``.npy`` files are opened with ``np.load(mmap_mode=...)`` (dtype and shape come from the
+    header); any other file is mapped as a raw ``np.memmap`` of `dtype` (default uint8).
+    With ``readonly=False`` the array is copy-on-write (mode 'c'), so the cached file is
+    never modified.
+
+    Args:
+        file_path: Path to the local (cached) file.
+        dtype: Element type for raw files.
+        shape: Shape for raw files (default: 1-d, as many elements as fit).
+        offset: Byte offset of the data in raw files.
+        readonly: Map read-only (default) or copy-on-write.
+        advice: Optional access hint: 'normal', 'sequential', 'random' or 'willneed'.
+
+    Returns:
+        np.memmap
+    """
+    import numpy as np
+    mode = 'r' if readonly else 'c'
+    if file_path.endswith('.npy') and dtype is None and shape is None:
+        array = np.load(file_path, mmap_mode=mode)
+    else:
+        array = np.memmap(file_path, dtype=dtype or np.uint8, mode=mode, offset=offset, shape=shape)
+    mapping = getattr(array, '_mmap', None)
+    if mapping is not None:
+        _madvise(mapping, advice)
+    return array
+
+def load_tensor(file_path, dtype=None, shape=None, shared=False, readonly=True, advice=None, offset=0):
+    """
+    Memory-map a local file as a torch tensor.
+
+    The file is mapped with `load_numpy` and wrapped with ``torch.from_numpy`` without
+    copying, so `readonly` is honored: by default the mapping is read-only (the tensor is
+    not writable, and workers on a node share the page-cache pages); with
+    ``readonly=False`` it is copy-on-write, so in-place ops never reach the cached file.
+
+    ``shared=True`` (raw files only, and only with ``readonly=False``) instead maps with
+    ``torch.from_file(shared=True)``: MAP_SHARED and read-write, so in-place writes to the
+    tensor ARE written back to the cached file. Only use it for files you own.
+
+    Args:
+        file_path: Path to the local (cached) file.
+        dtype: torch dtype for raw files (default torch.uint8).
+        shape: Optional shape to view the raw data as.
+        shared: Write-through MAP_SHARED mapping of a raw file (requires ``readonly=False``).
+        readonly: Map read-only (default) or copy-on-write.
+        advice: Optional access hint: 'normal', 'sequential', 'random' or 'willneed'.
+        offset: Byte offset of the data in raw files.
+
+    Returns:
+        torch.Tensor
+    """
+    import torch
+    if shared and readonly:
+        raise ValueError("shared=True maps the cached file read-write; pass readonly=False to opt in")
+    raw = not (file_path.endswith('.npy') and dtype is None)
+    if not raw:
+        array = load_numpy(file_path, readonly=readonly, advice=advice)
+    else:
+        dtype = dtype or torch.uint8
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        numel = (os.path.getsize(file_path) - offset) // itemsize
+        if shared:
+            if offset:
+                raise ValueError("shared=True can't map from an offset")
+            tensor = torch.from_file(file_path, shared=True, size=numel, dtype=dtype)
+            return tensor.view(shape) if shape is not None else tensor
+        # map the bytes and reinterpret them in torch, which also covers dtypes numpy
+        # lacks (e.g. bfloat16)
+        array = load_numpy(file_path, shape=(numel * itemsize,), offset=offset,
+                           readonly=readonly, advice=advice) if numel else None
+    with warnings.catch_warnings():
+        # torch warns that read-only arrays yield non-writable tensors; that's the point
+        warnings.simplefilter('ignore', UserWarning)
+        if array is None:
+            tensor = torch.empty(0, dtype=dtype)
+        else:
+            tensor = torch.from_numpy(array)
+    if raw:
+        tensor = tensor.view(dtype)
+    if shape is not None:
+        tensor = tensor.view(shape)
+    return tensor
+
+def load_data_file(uri, kind='memoryview', readonly=True, advice=None,
+                   dtype=None, shape=None, offset=0, shared=False, **download_kwargs):
+    '''download (if needed) and memory-map a data file
+        Zero-copy alternative to reading the cached file into memory: with many DataLoader
+        workers on a node, every worker maps the same page-cache pages instead of holding
+        its own copy.
+
+        uri can be a local path, or anything `download_data_file` accepts
+        kind: 'memoryview' (mmap_file), 'numpy' (load_numpy) or 'torch' (load_tensor)
+    '''
+    if os.path.isfile(os.path.expanduser(uri)):
+        cached_file = os.path.expanduser(uri)
+    else:
+        cached_file, _ = download_data_file(uri, **download_kwargs)
+    logger.info(f"memory-mapping {cached_file} as {kind}")
+
+    if kind == 'memoryview':
+        return mmap_file(cached_file, readonly=readonly, advice=advice)
+    elif kind == 'numpy':
+        return load_numpy(cached_file, dtype=dtype, shape=shape, offset=offset,
+                          readonly=readonly, advice=advice)
+    elif kind == 'torch':
+        return load_tensor(cached_file, dtype=dtype, shape=shape, shared=shared,
+                           readonly=readonly, advice=advice, offset=offset)
+    else:
+        raise ValueError(f"Unsupported kind `{kind}`. Expected one of 'memoryview', 'numpy', 'torch'.")
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import atexit
+import logging
+import threading
+
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['endpoint_key', 'record_throughput', 'record_latency', 'get_endpoint_stats']
+
+_HISTORY_FILENAME = "endpoint_stats.json"
+# weight of the newest measurement in the moving averages
+_EWMA_ALPHA = 0.3
+# updates are written back at most this often (and at exit)
+_SAVE_INTERVAL = 5.0
+_history = None
+_history_lock = threading.Lock()
+_last_save = 0.0
+# endpoints updated by this process since the last save
+_changed = set()
+
+def endpoint_key(uri, endpoint_url=None):
+    """
+    Key under which transfers of `uri` are recorded: the host of `endpoint_url` (an
+    explicit s3 endpoint), of an http(s) uri, or of the provider's default endpoint.
+    """
+    if endpoint_url:
+        return urlparse(endpoint_url if '://' in endpoint_url else f"https://{endpoint_url}").netloc
+    parsed = urlparse(uri)
+    if parsed.scheme in ['http', 'https']:
+        return parsed.netloc
+    from visionlab.auth import S3_PROVIDER_ENDPOINT_URLS
+    default_url = S3_PROVIDER_ENDPOINT_URLS.get(parsed.scheme)
+    return urlparse(default_url).netloc if default_url else parsed.scheme
+
+def _history_path():
+    cache_home = os.path.expanduser(os.getenv('XDG_CACHE_HOME', '~/.cache'))
+    return os.path.join(cache_home, 'visionlab', 'remote_data', _HISTORY_FILENAME)
+
+def _load_history():
+    global _history
+    if _history is None:
+        try:
+            with open(_history_path()) as f:
+                _history = json.load(f)
+        except (OSError, ValueError):
+            _history = {}
+    return _history
+
+def _save_history(history, changed):
+    """
+    Write the `changed` endpoints of `history` back, under a lock and merged into what is
+    on disk, so concurrent processes don't drop each other's updates. Returns the merged
+    history (with the other processes' endpoints).
+    """
+    path = _history_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(path) as f:
+                    merged = json.load(f)
+            except (OSError, ValueError):
+                merged = {}
+            merged.update({endpoint: history[endpoint] for endpoint in changed if endpoint in history})
+            tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(merged, f)
+            os.replace(tmp_path, path)
+        return merged
+    except OSError as e:
+        logger.debug(f"Could not persist endpoint stats to {path}: {e}")
+        return history
+
+def _save_changed():
+    # caller holds _history_lock
+    global _history, _last_save
+    _history = _save_history(_history, _changed)
+    _changed.clear()
+    _last_save = time.monotonic()
+
+def _flush():
+    with _history_lock:
+        if _changed:
+            _save_changed()
+
+atexit.register(_flush)
+
+def _update(endpoint, **values):
+    with _history_lock:
+        history = _load_history()
+        entry = history.setdefault(endpoint, {})
+        for key, value in values.items():
+            entry[key] = value if key not in entry else _EWMA_ALPHA * value + (1 - _EWMA_ALPHA) * entry[key]
+        entry['updated'] = time.time()
+        _changed.add(endpoint)
+        if time.monotonic() - _last_save >= _SAVE_INTERVAL:
+            _save_changed()
+
+def record_throughput(endpoint, num_bytes, seconds, streams=1):
+    """Fold one measured transfer (over `streams` parallel connections) into `endpoint`'s averages."""
+    if not num_bytes or seconds <= 0:
+        return
+    throughput = num_bytes / seconds
+    _update(endpoint, throughput=throughput, per_stream=throughput / streams)
+
+def record_latency(endpoint, seconds):
+    """Fold one time-to-first-byte measurement into `endpoint`'s average latency."""
+    _update(endpoint, latency=seconds)
+
+def get_endpoint_stats(endpoint, max_age=7*24*3600):
+    """
+    Recent averages for `endpoint` (see `endpoint_key`), or None if unknown/stale.
+
+    Returns:
+        dict with any of throughput, per_stream (bytes/sec) and latency (seconds)
+    """
+    with _history_lock:
+        entry = _load_history().get(endpoint)
+    if not entry or time.time() - entry.get('updated', 0) > max_age:
+        return None
+    return dict(entry)
@@ -1,10 +1,9 @@
 import re
 import hashlib
-import fire
 from pathlib import Path
 from pdb import set_trace
 
-__all__ = ['compute_sha256', 'split_name', 'rename_file_with_hash']
+__all__ = ['compute_sha256', 'split_name', 'hashed_file_path', 'rename_file_with_hash']
 
 # matches bfd8deac from resnet18-bfd8deac.pth
 HASH_REGEX = re.compile(r'-([a-f0-9]*)\.')
@@ -37,6 +36,22 @@ def split_name(path: Path):
         stem = path.name
     return stem, ext
 
+def hashed_file_path(file_path, full_hash, hash_length: int = 8) -> Path:
+    """
+    The `-<hash>` name for file_path: {stem}-{full_hash[0:hash_length]}{ext}.
+
+    Args:
+        file_path (str or Path): The path to the file.
+        full_hash (str): The hexadecimal hash of the file contents.
+        hash_length (int): The number of characters to use from the hash (default: 8).
+
+    Returns:
+        Path: The new file path (nothing is renamed).
+    """
+    path = Path(file_path)
+    stem, ext = split_name(path)
+    return path.with_name(f"{stem}-{full_hash[:hash_length]}{ext}")
+
 def rename_file_with_hash(file_path: str, hash_length: int = 8, dry_run: bool = False) -> str:
     """
     Compute the sha256sum of a file and rename the file to include the hash.
@@ -60,12 +75,8 @@ def rename_file_with_hash(file_path: str, hash_length: int = 8, dry_run: bool =
     print(f"==> computing sha256 hash for file: {file_path}")
     full_hash = compute_sha256(path)
     
-    # Get the full stem and extension (handling multiple extensions)
-    stem, ext = split_name(path)
-    
-    # Construct the new file name.
-    new_filename = f"{stem}-{full_hash[:hash_length]}{ext}"
-    new_file_path = path.with_name(new_filename)
+    # Construct the new file name (handling multiple extensions)
+    new_file_path = hashed_file_path(path, full_hash, hash_length=hash_length)
     
     # Rename the file.
     if dry_run:
@@ -77,7 +88,8 @@ def rename_file_with_hash(file_path: str, hash_length: int = 8, dry_run: bool =
     return str(new_file_path)
 
 def main():
+    import fire
     fire.Fire(rename_file_with_hash)
 
 if __name__ == "__main__":
-    fire.Fire(rename_file_with_hash)  
\ No newline at end of file
+    main()  
\ No newline at end of file
@@ -1,30 +1,18 @@
 import os
 import re
 import hashlib
-import boto3
-import requests
 from pathlib import Path
 from urllib.parse import urlparse
-
-from botocore.exceptions import ClientError
-from botocore import UNSIGNED
-from botocore.client import Config
 from pdb import set_trace
 
-from visionlab.auth import (
-    get_aws_credentials_with_provider_hint, 
-    parse_uri,
-    normalize_uri, 
-    S3_PROVIDER_ENDPOINT_URLS, 
-    check_public_s3_object,
-    sign_url_if_needed
-)
-
-__all__ = ['get_file_metadata']
+__all__ = ['get_file_metadata', 'get_file_metadata_batch']
 
 # matches bfd8deac from resnet18-bfd8deac.pth.tar
 HASH_REGEX = re.compile(r'-([a-f0-9]*)\.(?:[^.]+(?:\.[^.]+)*)')
 
+# matches "bytes 0-1023/146515"
+CONTENT_RANGE_REGEX = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
 def split_name(path: Path):
     """Split a path into the stem and the complete extension (all suffixes)."""
     path = Path(path)
@@ -36,112 +24,97 @@ def split_name(path: Path):
         ext = ""
         stem = path.name
     return stem, ext
+
+def _is_s3_provider_scheme(scheme):
+    from visionlab.auth import S3_PROVIDER_ENDPOINT_URLS
+    return scheme in S3_PROVIDER_ENDPOINT_URLS
     
-def get_file_metadata(source, read_limit=8192*8, hash_length=32, s3_config=None):
+def _make_s3_client(source, s3_config=None, signed=None):
     """
-    Retrieve file metadata, including size and unique identifier (content hash) based on the source.
-    
-    Parameters:
-    source (str): The source URI, which can be an S3 URI, HTTP/HTTPS URL, or local file path.
-    read_limit (int): The number of bytes to read for generating the hash (64KB default)
-    profile_name (str): AWS profile name to use for private S3 access if needed.
-    region (str): AWS region for the S3 bucket.
-    
-    Returns:
-    dict: A dictionary containing 'size' (in bytes) and 'hash' (SHA-256 hash of content sample).
-    """    
-    if s3_config is None:
-        s3_config = {}
-    profile = s3_config.get('profile')
+    boto3 client for `source`: with the provider's credentials (``signed=True``) or
+    anonymous (``signed=False``); by default anonymous if `source` is public.
+    """
+    import boto3
+    from botocore import UNSIGNED
+    from botocore.client import Config
+    from visionlab.auth import (
+        get_aws_credentials_with_provider_hint,
+        parse_uri,
+        check_public_s3_object,
+    )
+    s3_config = s3_config or {}
     endpoint_url = s3_config.get('endpoint_url')
     region = s3_config.get('region')
-    
-    parsed = urlparse(source)
-    hasher = hashlib.sha256()
-    size = None
+    provider, bucket_name, key, endpoint_hint = parse_uri(source)
 
-    if os.path.isfile(os.path.expanduser(source)):
-        source = os.path.expanduser(source)
-        # For local files
-        size = os.path.getsize(source)
-        
-        # Open the file and read a limited range of bytes to compute the hash
-        with open(source, 'rb') as f:
-            hasher.update(f.read(read_limit))
-            
-    elif parsed.scheme in ["http", "https"]:
-        # For HTTP/HTTPS URLs
-        source = sign_url_if_needed(source, s3_config=s3_config)
-        head_response = requests.head(source)
-        
-        size = head_response.headers.get('Content-Length')
-
-        # If Content-Length is not provided, perform a full GET request to get the file size
-        if size is None:
-            # Fetch a limited range of bytes to compute the hash
-            range_response = requests.get(source, headers={'Range': f'bytes=0-{read_limit-1}'})
-            hasher.update(range_response.content)
-            
-            # Make a second request without range to get the full size
-            full_response = requests.get(source, stream=True)
-            size = int(full_response.headers.get('Content-Length', 0))
-            full_response.close()
-        else:
-            # If Content-Length is available, convert it to an integer
-            size = int(size)
-            
-            # Fetch limited data for the hash
-            range_response = requests.get(source, headers={'Range': f'bytes=0-{read_limit-1}'})
-            hasher.update(range_response.content)
-            
-    elif parsed.scheme in S3_PROVIDER_ENDPOINT_URLS:
-        # Assuming an S3_path (aws, or aws compatible)
-        s3_uri = normalize_uri(source)
-        provider, bucket_name, key, endpoint_hint = parse_uri(source)
+    # Check if the S3 object is public
+    is_public = not signed if signed is not None else check_public_s3_object(source)
 
-        # Check if the S3 object is public
-        is_public = check_public_s3_object(source)
-
-        if not is_public:   
-            creds = get_aws_credentials_with_provider_hint(provider,
-                                                           profile=profile,
-                                                           endpoint_url=endpoint_url,
-                                                           region=region)
-            if endpoint_url is None:
-                endpoint_url = creds.get("endpoint_url")
-            if region is None:
-                region = creds.get("region")
-            print(endpoint_url, region, bucket_name, key)
-            # Initialize the S3 client with credentials for private access
-            s3 = boto3.client(
-                's3',
-                region_name=region,
-                aws_access_key_id=creds["aws_access_key_id"],
-                aws_secret_access_key=creds["aws_secret_access_key"],
-                aws_session_token=creds.get("aws_session_token"),
-                endpoint_url=creds.get("endpoint_url")
-            )
-        else:
-            # Public access: Initialize the S3 client without credentials
-            s3 = boto3.client('s3', 
-                              region_name=region,
-                              endpoint_url=endpoint_url,
-                              config=Config(signature_version=UNSIGNED))
+    if not is_public:   
+        creds = get_aws_credentials_with_provider_hint(provider,
+                                                       profile=s3_config.get('profile'),
+                                                       endpoint_url=endpoint_url,
+                                                       region=region)
+        if region is None:
+            region = creds.get("region")
+        # Initialize the S3 client with credentials for private access
+        return boto3.client(
+            's3',
+            region_name=region,
+            aws_access_key_id=creds.get("aws_access_key_id"),
+            aws_secret_access_key=creds.get("aws_secret_access_key"),
+            aws_session_token=creds.get("aws_session_token"),
+            endpoint_url=creds.get("endpoint_url") or endpoint_url
+        )
+    # Public access: Initialize the S3 client without credentials
+    return boto3.client('s3', 
+                        region_name=region,
+                        endpoint_url=endpoint_url,
+                        config=Config(signature_version=UNSIGNED))
 
-        # Get object metadata and partial content
-        try:
-            response = s3.head_object(Bucket=bucket_name, Key=key)
-            size = response['ContentLength']
-            # Fetch a limited range of bytes to compute a consistent hash
-            range_response = s3.get_object(Bucket=bucket_name, Key=key, Range=f'bytes=0-{read_limit-1}')
-            hasher.update(range_response['Body'].read())
-        except ClientError as e:
-            print(f"Could not access object {key} in bucket {bucket_name}: {e}")
-            return
-    else:
-        raise ValueError("Unsupported source type. Must be S3 URI, URL, or local file path.")
+def _local_size_and_head(path, read_limit):
+    with open(path, 'rb') as f:
+        return os.path.getsize(path), f.read(read_limit)
+
+def _http_size_and_head(url, read_limit, session):
+    """(size, first `read_limit` bytes) of an http(s) object, from one ranged GET when possible."""
+    response = session.get(url, headers={'Range': f'bytes=0-{read_limit-1}'}, stream=True)
+    try:
+        if response.status_code == 416:
+            # empty object: nothing to range over ("bytes */0")
+            match = re.match(r'bytes\s+\*/(\d+)', response.headers.get('Content-Range', ''))
+            return int(match.group(1)) if match else 0, b''
+        response.raise_for_status()
+        head = response.raw.read(read_limit, decode_content=True)
+        match = CONTENT_RANGE_REGEX.match(response.headers.get('Content-Range', ''))
+        if response.status_code == 206 and match and match.group(3) != '*':
+            return int(match.group(3)), head
+        if response.status_code == 200 and response.headers.get('Content-Length') is not None:
+            # Range ignored: the full response length is the size
+            return int(response.headers['Content-Length']), head
+    finally:
+        response.close()
+    # no usable length in the ranged response: fall back to HEAD
+    size = session.head(url).headers.get('Content-Length')
+    return int(size or 0), head
 
-    unique_id = hasher.hexdigest()
+def _s3_size_and_head(bucket_name, key, read_limit, s3_client):
+    """(size, first `read_limit` bytes) of an s3 object, from one ranged GetObject when possible."""
+    from botocore.exceptions import ClientError
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=key, Range=f'bytes=0-{read_limit-1}')
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'InvalidRange':
+            raise
+        # empty object: nothing to range over
+        return s3_client.head_object(Bucket=bucket_name, Key=key)['ContentLength'], b''
+    match = CONTENT_RANGE_REGEX.match(response.get('ContentRange', ''))
+    head = response['Body'].read()
+    size = int(match.group(3)) if match else response['ContentLength']
+    return size, head
+
+def _metadata_record(source, parsed, size, head, read_limit, hash_length):
+    unique_id = hashlib.sha256(head).hexdigest()
     final_hash = unique_id[:hash_length] if hash_length else unique_id
     if size > 0:
         hash_id = final_hash
@@ -170,4 +143,143 @@ def get_file_metadata(source, read_limit=8192*8, hash_length=32, s3_config=None)
         'filename': filename,
         'stem': stem,
         'ext': ext
-    }
\ No newline at end of file
+    }
+
+def get_file_metadata(source, read_limit=8192*8, hash_length=32, s3_config=None):
+    """
+    Retrieve file metadata, including size and unique identifier (content hash) based on the source.
+    
+    Parameters:
+    source (str): The source URI, which can be an S3 URI, HTTP/HTTPS URL, or local file path.
+    read_limit (int): The number of bytes to read for generating the hash (64KB default)
+    s3_config (dict): Optional profile / endpoint_url / region for private S3 access.
+    
+    Returns:
+    dict: A dictionary containing 'size' (in bytes) and 'hash' (SHA-256 hash of content sample).
+    """    
+    parsed = urlparse(source)
+
+    if os.path.isfile(os.path.expanduser(source)):
+        # For local files
+        source = os.path.expanduser(source)
+        size, head = _local_size_and_head(source, read_limit)
+            
+    elif parsed.scheme in ["http", "https"]:
+        # For HTTP/HTTPS URLs
+        import requests
+        from visionlab.remote_data.presign import get_signed_url
+        source = get_signed_url(source, s3_config=s3_config)
+        with requests.Session() as session:
+            size, head = _http_size_and_head(source, read_limit, session)
+            
+    elif _is_s3_provider_scheme(parsed.scheme):
+        # Assuming an S3_path (aws, or aws compatible)
+        from botocore.exceptions import ClientError
+        from visionlab.auth import parse_uri
+        provider, bucket_name, key, endpoint_hint = parse_uri(source)
+        s3 = _make_s3_client(source, s3_config=s3_config)
+
+        # Get object metadata and partial content
+        try:
+            size, head = _s3_size_and_head(bucket_name, key, read_limit, s3)
+        except ClientError as e:
+            print(f"Could not access object {key} in bucket {bucket_name}: {e}")
+            return
+    else:
+        raise ValueError("Unsupported source type. Must be S3 URI, URL, or local file path.")
+
+    return _metadata_record(source, parsed, size, head, read_limit, hash_length)
+
+# string columns of the batch table, in order
+_BATCH_STRING_FIELDS = ['source', 'scheme', 'netloc', 'path', 'partial_hash', 'sha256_prefix',
+                        'signature', 'filename', 'stem', 'ext', 'error']
+
+def get_file_metadata_batch(sources, max_workers=32, read_limit=8192*8, hash_length=32, s3_config=None):
+    """
+    `get_file_metadata` for many sources at once, resolved concurrently by `max_workers`
+    threads. http(s) sources share one requests session per thread, s3-provider sources
+    share one client per (provider, bucket) (with credentials, and an anonymous one for
+    objects those credentials can't read), and each remote source
+    costs a single ranged GET (size comes from its Content-Range).
+
+    Returns a numpy structured array with one row per source (in input order) and the
+    fields of `get_file_metadata` plus `source` and `error`: 'size' is int64 (-1 when
+    the source could not be resolved) and string fields are fixed-width unicode ('' for
+    missing values), so totals and filters are vectorized, e.g.
+    ``table['size'][table['error'] == ''].sum()``.
+
+    Args:
+        sources: Iterable of local paths, http(s) urls and s3-provider uris.
+        max_workers: Number of concurrent requests.
+        read_limit, hash_length, s3_config: As for `get_file_metadata`.
+    """
+    import threading
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+
+    sources = list(sources)
+    local = threading.local()
+    clients = {}
+    clients_lock = threading.Lock()
+
+    def session():
+        if not hasattr(local, 'session'):
+            import requests
+            local.session = requests.Session()
+        return local.session
+
+    def s3_client(source, provider, bucket_name, signed):
+        # whether the first object of a bucket is public says nothing about the others,
+        # so anonymous and credentialed clients are cached separately
+        with clients_lock:
+            client_lock = clients.setdefault((provider, bucket_name, signed), [threading.Lock(), None])
+        with client_lock[0]:
+            if client_lock[1] is None:
+                client_lock[1] = _make_s3_client(source, s3_config=s3_config, signed=signed)
+            return client_lock[1]
+
+    def s3_size_and_head(source):
+        from botocore.exceptions import ClientError, NoCredentialsError
+        from visionlab.auth import parse_uri
+        provider, bucket_name, key, _ = parse_uri(source)
+        try:
+            return _s3_size_and_head(bucket_name, key, read_limit, s3_client(source, provider, bucket_name, True))
+        except NoCredentialsError:
+            pass
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('AccessDenied', '403', 'Forbidden'):
+                raise
+        # no credentials, or e.g. a public object in another account's bucket
+        return _s3_size_and_head(bucket_name, key, read_limit, s3_client(source, provider, bucket_name, False))
+
+    def resolve(source):
+        parsed = urlparse(source)
+        try:
+            if os.path.isfile(os.path.expanduser(source)):
+                size, head = _local_size_and_head(os.path.expanduser(source), read_limit)
+            elif parsed.scheme in ["http", "https"]:
+                from visionlab.remote_data.presign import get_signed_url
+                signed_url = get_signed_url(source, s3_config=s3_config)
+                size, head = _http_size_and_head(signed_url, read_limit, session())
+            elif _is_s3_provider_scheme(parsed.scheme):
+                size, head = s3_size_and_head(source)
+            else:
+                raise ValueError("Unsupported source type. Must be S3 URI, URL, or local file path.")
+        except Exception as e:
+            return dict(source=source, scheme=parsed.scheme, netloc=parsed.netloc, path=parsed.path,
+                        size=-1, error=f"{type(e).__name__}: {e}")
+        record = _metadata_record(source, parsed, size, head, read_limit, hash_length)
+        record.update(source=source, error='')
+        return record
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        records = list(executor.map(resolve, sources))
+
+    columns = {field: [record.get(field) or '' for record in records] for field in _BATCH_STRING_FIELDS}
+    dtype = [(field, f"U{max([len(value) for value in values] + [1])}") for field, values in columns.items()]
+    dtype.insert(4, ('size', np.int64))
+    table = np.empty(len(records), dtype=dtype)
+    for field, values in columns.items():
+        table[field] = values
+    table['size'] = [record['size'] for record in records]
+    return table
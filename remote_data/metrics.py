@@ -0,0 +1,264 @@
+import os
+import time
+import uuid
+import atexit
+import bisect
+import logging
+import threading
+
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = [
+    'Counter',
+    'Histogram',
+    'MetricsRegistry',
+    'registry',
+    'get_metrics_snapshot',
+    'add_metrics_callback',
+    'remove_metrics_callback',
+    'write_prometheus_textfile',
+    'start_prometheus_textfile_exporter',
+]
+
+# seconds; covers a cache hit (~ms) up to a multi-GB transfer
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(label_key, extra=()):
+    items = list(label_key) + list(extra)
+    if not items:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for k, v in items)
+    return '{' + body + '}'
+
+class Counter:
+    """Monotonic counter with labels, e.g. ``bytes.inc(n, backend='s5cmd', provider='wasabi')``."""
+    kind = 'counter'
+
+    def __init__(self, name, help, registry):
+        self.name = name
+        self.help = help
+        self._registry = registry
+        self._values = {}
+
+    def inc(self, value=1, **labels):
+        key = _label_key(labels)
+        with self._registry._lock:
+            self._values[key] = self._values.get(key, 0) + value
+        self._registry._notify(self.name, self.kind, value, labels)
+
+    def samples(self):
+        return [dict(labels=dict(key), value=value) for key, value in self._values.items()]
+
+    def _prometheus_lines(self, extra):
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(key, extra)} {value}"
+
+    def _reset(self):
+        self._values = {}
+
+class Histogram:
+    """Histogram with fixed buckets and labels, e.g. ``latency.observe(seconds, backend='http')``."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, registry, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._registry = registry
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._registry._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = dict(counts=[0] * (len(self.buckets) + 1), sum=0.0, count=0)
+            state['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            state['sum'] += value
+            state['count'] += 1
+        self._registry._notify(self.name, self.kind, value, labels)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        for key, state in self._values.items():
+            cumulative, buckets = 0, {}
+            for upper, count in zip(self.buckets + (float('inf'),), state['counts']):
+                cumulative += count
+                buckets[upper] = cumulative
+            samples.append(dict(labels=dict(key), count=state['count'], sum=state['sum'], buckets=buckets))
+        return samples
+
+    def _prometheus_lines(self, extra):
+        for sample in self.samples():
+            key = _label_key(sample['labels'])
+            for upper, count in sample['buckets'].items():
+                le = '+Inf' if upper == float('inf') else repr(float(upper))
+                yield f"{self.name}_bucket{_format_labels(key, tuple(extra) + (('le', le),))} {count}"
+            yield f"{self.name}_sum{_format_labels(key, extra)} {sample['sum']}"
+            yield f"{self.name}_count{_format_labels(key, extra)} {sample['count']}"
+
+    def _reset(self):
+        self._values = {}
+
+class MetricsRegistry:
+    """
+    Process-wide collection of counters and histograms.
+
+    - `snapshot` returns all current values as plain dicts
+    - callbacks registered with `add_callback` are called as ``fn(name, kind, value, labels)``
+      on every update (keep them cheap; they run on the download path)
+    - `write_prometheus_textfile` writes the Prometheus text format, for node-exporter's
+      textfile collector
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._metrics = {}
+        self._callbacks = []
+
+    def _get_or_create(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, self, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help=''):
+        return self._get_or_create(Counter, name, help)
+
+    def histogram(self, name, help='', buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def add_callback(self, fn):
+        self._callbacks.append(fn)
+
+    def remove_callback(self, fn):
+        self._callbacks.remove(fn)
+
+    def _notify(self, name, kind, value, labels):
+        for fn in list(self._callbacks):
+            try:
+                fn(name, kind, value, labels)
+            except Exception as e:
+                logger.warning(f"metrics callback {fn} failed: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(type=metric.kind, help=metric.help, samples=metric.samples())
+                    for name, metric in self._metrics.items()}
+
+    def reset(self):
+        with self._lock:
+            for metric in self._metrics.values():
+                metric._reset()
+
+    def to_prometheus_text(self, extra_labels=None):
+        extra = _label_key(extra_labels or {})
+        lines = []
+        with self._lock:
+            for name, metric in sorted(self._metrics.items()):
+                lines.append(f"# HELP {name} {metric.help}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+                lines.extend(metric._prometheus_lines(extra))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus_textfile(self, path, extra_labels=None):
+        """
+        Atomically write all metrics to `path` in the Prometheus text format.
+
+        Point node-exporter's ``--collector.textfile.directory`` at the directory. When
+        several processes on a node export, give each its own file and distinguishing
+        `extra_labels` (e.g. ``{'job': ..., 'rank': ...}``) so series don't collide.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus_text(extra_labels))
+        os.replace(tmp_path, path)
+
+# the process-wide registry used by all download paths
+registry = MetricsRegistry()
+
+bytes_transferred = registry.counter(
+    'remote_data_bytes_transferred_total', 'Bytes downloaded, by backend and provider')
+fetch_seconds = registry.histogram(
+    'remote_data_fetch_seconds', 'Latency of download calls, by backend, provider and cache result')
+cache_requests = registry.counter(
+    'remote_data_cache_requests_total', 'Cache lookups, by backend and result (hit, miss, wait, dedup)')
+lock_wait_seconds = registry.histogram(
+    'remote_data_lock_wait_seconds', 'Time spent waiting for another process to finish a download')
+verify_seconds = registry.histogram(
+    'remote_data_verify_seconds', 'Time spent verifying downloaded files, by algorithm')
+extract_seconds = registry.histogram(
+    'remote_data_extract_seconds', 'Time spent extracting archives, by format')
+bytes_uploaded = registry.counter(
+    'remote_data_bytes_uploaded_total', 'Bytes uploaded, by backend and provider')
+upload_seconds = registry.histogram(
+    'remote_data_upload_seconds', 'Latency of upload calls, by backend and provider')
+
+def record_fetch(backend, provider, fetch_record, seconds):
+    """Record one download call from its `track_fetch` record."""
+    if fetch_record['downloaded']:
+        result = 'miss'
+    elif fetch_record['waited']:
+        result = 'wait'
+    elif fetch_record.get('deduplicated'):
+        result = 'dedup'
+    else:
+        result = 'hit'
+    cache_requests.inc(backend=backend, result=result)
+    fetch_seconds.observe(seconds, backend=backend, provider=provider, result=result)
+    if fetch_record['bytes']:
+        bytes_transferred.inc(fetch_record['bytes'], backend=backend, provider=provider)
+
+def get_metrics_snapshot():
+    """All metrics of the process-wide registry as plain dicts."""
+    return registry.snapshot()
+
+def add_metrics_callback(fn):
+    """Call ``fn(name, kind, value, labels)`` on every metrics update."""
+    registry.add_callback(fn)
+
+def remove_metrics_callback(fn):
+    registry.remove_callback(fn)
+
+def write_prometheus_textfile(path, extra_labels=None):
+    registry.write_prometheus_textfile(path, extra_labels=extra_labels)
+
+def start_prometheus_textfile_exporter(path, interval=15, extra_labels=None):
+    """
+    Rewrite the Prometheus textfile every `interval` seconds (and at exit) in a daemon thread.
+
+    Returns a threading.Event; set it to stop the exporter.
+    """
+    stop = threading.Event()
+
+    def _export():
+        try:
+            write_prometheus_textfile(path, extra_labels=extra_labels)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {path}: {e}")
+
+    def _loop():
+        while not stop.wait(interval):
+            _export()
+
+    threading.Thread(target=_loop, name="remote-data-metrics-exporter", daemon=True).start()
+    atexit.register(_export)
+    return stop
@@ -0,0 +1,332 @@
+import os
+import mmap
+import fcntl
+import struct
+import hashlib
+import logging
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .progress import progress_bar
+from .tracing import span
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['PackReader', 'fetch_into_pack']
+
+# A pack is an append-only data file of records, each
+#     magic 'VLPR' | key_len u32 | etag_len u16 | data_len u64 | key | etag | data
+# plus an index file (<pack>.idx): an open-addressing hash table of
+#     magic 'VLPKIDX1' | num_slots u64 | num_entries u64 | data_end u64
+#     num_slots x (key_hash u64, record_offset + 1 u64)        (0: empty slot)
+# The index is replaced atomically after each batch of appends; data past its
+# data_end is an unfinished batch and is truncated by the next writer.
+RECORD_MAGIC = b'VLPR'
+RECORD_HEADER = struct.Struct('<4sIHQ')
+INDEX_MAGIC = b'VLPKIDX1'
+INDEX_HEADER = struct.Struct('<8sQQQ')
+SLOT = struct.Struct('<QQ')
+
+DEFAULT_MAX_CONCURRENT = 32
+DEFAULT_COMMIT_EVERY = 10000
+
+def _key_hash(key_bytes):
+    return int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), 'little')
+
+def _index_path(pack_path):
+    return f"{pack_path}.idx"
+
+def _read_record_header(buffer, offset):
+    """(key, etag, data_offset, data_len) of the record at `offset`, or None if it's incomplete."""
+    if offset + RECORD_HEADER.size > len(buffer):
+        return None
+    magic, key_len, etag_len, data_len = RECORD_HEADER.unpack_from(buffer, offset)
+    if magic != RECORD_MAGIC:
+        return None
+    key_offset = offset + RECORD_HEADER.size
+    data_offset = key_offset + key_len + etag_len
+    if data_offset + data_len > len(buffer):
+        return None
+    key = bytes(buffer[key_offset:key_offset + key_len]).decode('utf-8')
+    etag = bytes(buffer[key_offset + key_len:data_offset]).decode('ascii')
+    return key, etag, data_offset, data_len
+
+def _scan_records(buffer, start=0):
+    """Yield (record_offset, key, etag, data_len) for the complete records from `start` on."""
+    offset = start
+    while True:
+        header = _read_record_header(buffer, offset)
+        if header is None:
+            return
+        key, etag, data_offset, data_len = header
+        yield offset, key, etag, data_len
+        offset = data_offset + data_len
+
+def _write_index(pack_path, records, data_end):
+    """Atomically write the hash index for `records` (key -> record offset)."""
+    num_slots = 8
+    while num_slots < 2 * len(records):
+        num_slots *= 2
+    table = bytearray(INDEX_HEADER.size + num_slots * SLOT.size)
+    INDEX_HEADER.pack_into(table, 0, INDEX_MAGIC, num_slots, len(records), data_end)
+    mask = num_slots - 1
+    for key, offset in records.items():
+        key_hash = _key_hash(key.encode('utf-8'))
+        slot = key_hash & mask
+        while SLOT.unpack_from(table, INDEX_HEADER.size + slot * SLOT.size)[1]:
+            slot = (slot + 1) & mask
+        SLOT.pack_into(table, INDEX_HEADER.size + slot * SLOT.size, key_hash, offset + 1)
+    index_path = _index_path(pack_path)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(table)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, index_path)
+
+class PackReader:
+    """
+    Read-only view of a pack written by `fetch_into_pack`: O(1) lookup of a key through
+    the mmapped hash index, and zero-copy access to its bytes through the mmapped pack.
+
+    Readers never block the writer: an update appends to the pack and then replaces the
+    index, so an open reader keeps seeing the keys it had until `reload()`. Readers can
+    be pickled (e.g. into DataLoader workers); the files are re-mapped on first use.
+
+    Args:
+        pack_path: Pack file (its index is ``<pack_path>.idx``).
+    """
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        self._maps = None
+
+    def __getstate__(self):
+        return dict(pack_path=self.pack_path, _maps=None)
+
+    def _open(self):
+        if self._maps is None:
+            with open(_index_path(self.pack_path), 'rb') as f:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, num_slots, num_entries, data_end = INDEX_HEADER.unpack_from(index, 0)
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"{_index_path(self.pack_path)} is not a pack index")
+            data = None
+            if data_end:
+                with open(self.pack_path, 'rb') as f:
+                    data = mmap.mmap(f.fileno(), data_end, access=mmap.ACCESS_READ)
+            self._maps = (index, data, num_slots, num_entries)
+        return self._maps
+
+    def reload(self):
+        """Pick up keys appended since the reader was opened."""
+        self.close()
+        self._open()
+
+    def close(self):
+        if self._maps is not None:
+            index, data = self._maps[:2]
+            self._maps = None
+            index.close()
+            if data is not None:
+                try:
+                    data.close()
+                except BufferError:
+                    # views handed out by `view` are still alive; the map is freed with them
+                    pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _find(self, key):
+        index, data, num_slots, _ = self._open()
+        key_hash = _key_hash(key.encode('utf-8'))
+        mask = num_slots - 1
+        slot = key_hash & mask
+        while True:
+            slot_hash, offset = SLOT.unpack_from(index, INDEX_HEADER.size + slot * SLOT.size)
+            if not offset:
+                return None
+            if slot_hash == key_hash:
+                header = _read_record_header(data, offset - 1)
+                if header is not None and header[0] == key:
+                    return header
+            slot = (slot + 1) & mask
+
+    def view(self, key):
+        """Zero-copy memoryview of the object's bytes (valid until `close` / `reload`)."""
+        header = self._find(key)
+        if header is None:
+            raise KeyError(key)
+        _, _, data_offset, data_len = header
+        return memoryview(self._maps[1])[data_offset:data_offset + data_len]
+
+    def __getitem__(self, key):
+        return bytes(self.view(key))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def etag(self, key):
+        header = self._find(key)
+        if header is None:
+            raise KeyError(key)
+        return header[1]
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __len__(self):
+        return self._open()[3]
+
+    def items_info(self):
+        """Yield (key, etag, size) for every key, in pack order."""
+        index, data, num_slots, _ = self._open()
+        slots = (SLOT.unpack_from(index, INDEX_HEADER.size + slot * SLOT.size)[1] for slot in range(num_slots))
+        for offset in sorted(offset for offset in slots if offset):
+            key, etag, _, data_len = _read_record_header(data, offset - 1)
+            yield key, etag, data_len
+
+    def keys(self):
+        return [key for key, _, _ in self.items_info()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+def _load_records(pack_path):
+    """(key -> (record_offset, etag), data_end) of an existing pack; rebuilt by scanning if the index is lost."""
+    if not os.path.exists(pack_path) or os.path.getsize(pack_path) == 0:
+        return {}, 0
+    records = {}
+    with open(pack_path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if os.path.exists(_index_path(pack_path)):
+            with PackReader(pack_path) as reader:
+                data_end = INDEX_HEADER.unpack_from(reader._open()[0], 0)[3]
+            scan = _scan_records(memoryview(buffer)[:data_end])
+        else:
+            logger.warning(f"No index for {pack_path}: recovering it from the pack")
+            scan = _scan_records(buffer)
+            data_end = 0
+        for offset, key, etag, data_len in scan:
+            # later records replace earlier ones (an object that changed remotely)
+            records[key] = (offset, etag)
+            data_end = max(data_end, offset + RECORD_HEADER.size + len(key.encode('utf-8')) + len(etag) + data_len)
+    finally:
+        buffer.close()
+    return records, data_end
+
+def _fetch_object(s3_client, bucket_name, key, etag, check_hash):
+    data = s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read()
+    if check_hash and '-' not in etag and len(etag) == 32:
+        local_etag = hashlib.md5(data).hexdigest()
+        if local_etag != etag:
+            raise ValueError(f"ETag {etag} of s3://{bucket_name}/{key} does not match downloaded bytes ({local_etag})")
+    return data
+
+def fetch_into_pack(prefix, pack_path=None, s3_config=None, max_concurrent=DEFAULT_MAX_CONCURRENT,
+                    check_hash=True, show_progress=True, commit_every=DEFAULT_COMMIT_EVERY):
+    """
+    Fetch every object below an s3 prefix into one append-only pack file with a hash
+    index, instead of one local file (inode) per object. Read it with `PackReader`.
+
+    Incremental: on a re-run only keys that are new in the listing (or whose ETag
+    changed) are fetched and appended; the index is rewritten after every
+    `commit_every` objects, so an interrupted fetch keeps what it committed. Objects are
+    fetched concurrently and written by one thread; one writer per pack at a time
+    (flock on ``<pack_path>.lock``), any number of readers.
+
+    Args:
+        prefix: s3-provider prefix, e.g. ``s3://bucket/dataset/train/``.
+        pack_path: Pack file (default: ``get_cache_dir(prefix) + '.pack'``).
+        s3_config: Credentials / endpoint, as elsewhere.
+        max_concurrent: Concurrent GETs.
+        check_hash: Check each object's md5 against its (single-part) ETag.
+        show_progress: Show a progress bar.
+        commit_every: Objects appended between index commits.
+
+    Returns:
+        pack_path
+    """
+    from visionlab.auth import create_s3_client, parse_uri
+    from .bulk_sync import list_prefix
+    from .metrics import bytes_transferred
+    s3_config = s3_config or {}
+    if pack_path is None:
+        from .cache_dir import get_cache_dir
+        pack_path = get_cache_dir(prefix.rstrip('/')) + '.pack'
+    os.makedirs(os.path.dirname(os.path.abspath(pack_path)), exist_ok=True)
+    provider, bucket_name, key_prefix, _ = parse_uri(prefix)
+    key_prefix = key_prefix.rstrip('/') + '/' if key_prefix else ''
+
+    with span("fetch_into_pack", uri=prefix) as call_span, open(f"{pack_path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        records, data_end = _load_records(pack_path)
+        with span("list_prefix", uri=prefix):
+            objects = list_prefix(prefix, s3_config)
+        todo = [obj for obj in objects if obj['key'] not in records or records[obj['key']][1] != obj['etag']]
+        todo_bytes = sum(obj['size'] for obj in todo)
+        call_span.set(objects=len(objects), fetched=len(todo), bytes=todo_bytes)
+        logger.info(f"{pack_path}: {len(records)} keys packed, fetching {len(todo)} of {len(objects)} listed")
+        if not todo:
+            if not os.path.exists(_index_path(pack_path)):
+                _write_index(pack_path, {key: offset for key, (offset, _) in records.items()}, data_end)
+            return pack_path
+
+        s3_client = create_s3_client(prefix, s3_config=s3_config)
+        pbar = progress_bar(total=todo_bytes, unit="B", unit_scale=True, unit_divisor=1024,
+                            desc=os.path.basename(pack_path), disable=not show_progress)
+        # drop an unfinished batch left by an interrupted writer
+        with open(pack_path, 'ab') as f:
+            f.truncate(data_end)
+        pack_file = open(pack_path, 'ab')
+        offset, uncommitted = data_end, 0
+
+        def commit():
+            pack_file.flush()
+            os.fsync(pack_file.fileno())
+            _write_index(pack_path, {key: record_offset for key, (record_offset, _) in records.items()}, offset)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+                pending = {}
+                objects_iter = iter(todo)
+                while True:
+                    # bounded in-flight, so at most ~2 x max_concurrent objects are held in memory
+                    for obj in objects_iter:
+                        future = executor.submit(_fetch_object, s3_client, bucket_name, key_prefix + obj['key'],
+                                                 obj['etag'], check_hash)
+                        pending[future] = obj
+                        if len(pending) >= 2 * max_concurrent:
+                            break
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        obj = pending.pop(future)
+                        data = future.result()
+                        key_bytes, etag_bytes = obj['key'].encode('utf-8'), obj['etag'].encode('ascii')
+                        pack_file.write(RECORD_HEADER.pack(RECORD_MAGIC, len(key_bytes), len(etag_bytes), len(data)))
+                        pack_file.write(key_bytes)
+                        pack_file.write(etag_bytes)
+                        pack_file.write(data)
+                        records[obj['key']] = (offset, obj['etag'])
+                        offset += RECORD_HEADER.size + len(key_bytes) + len(etag_bytes) + len(data)
+                        uncommitted += 1
+                        pbar.update(len(data))
+                        bytes_transferred.inc(len(data), backend='pack', provider=provider)
+                    if uncommitted >= commit_every:
+                        commit()
+                        uncommitted = 0
+            commit()
+        finally:
+            pack_file.close()
+            pbar.close()
+    logger.info(f"Packed {len(todo)} objects ({todo_bytes} bytes) into {pack_path} ({len(records)} keys)")
+    return pack_path
@@ -0,0 +1,207 @@
+import os
+import queue
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from visionlab.remote_data.download import download_data_file
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['Prefetcher']
+
+class _Done:
+    """Sentinel put on the results queue once every uri has been submitted."""
+    def __init__(self, num_submitted):
+        self.num_submitted = num_submitted
+
+class Prefetcher:
+    """
+    Download remote files ahead of use in background threads.
+
+    Iterating yields ``(uri, cached_file, extracted_dir)`` tuples (the return value of
+    `download_data_file`), either in input order (``ordered=True``) or as downloads
+    complete. Downloads are only started while the prefetch window has room: at most
+    `max_files` files (and, if set, `max_bytes` bytes) may be downloaded-or-in-flight
+    but not yet consumed. A file counts as consumed once the consumer asks for the
+    next one, so the window never grows beyond what the training loop keeps up with.
+
+    Sizes are only known once a file lands, so files still in flight are counted at the
+    mean size of the files downloaded so far (and only one download is started until a
+    first size is known).
+
+    Example:
+        with Prefetcher(uris, max_files=8, max_bytes=20 * 2**30) as prefetcher:
+            for uri, cached_file, extracted_dir in prefetcher:
+                train_on(cached_file)
+
+    Args:
+        uris: Iterable of remote uris (consumed lazily, so it can be a generator).
+        max_files: Maximum number of unconsumed files in the window.
+        max_bytes: Maximum number of unconsumed bytes in the window (None for no limit).
+        num_workers: Number of concurrent downloads.
+        ordered: If True, yield in input order; otherwise yield as downloads complete.
+        fetch_fn: Optional callable ``fetch_fn(uri) -> (cached_file, extracted_dir)`` used
+            instead of ``download_data_file(uri, **download_kwargs)``.
+        **download_kwargs: Passed through to `download_data_file`.
+    """
+    def __init__(self, uris, max_files=4, max_bytes=None, num_workers=4, ordered=True,
+                 fetch_fn=None, **download_kwargs):
+        if max_files < 1:
+            raise ValueError(f"max_files must be >= 1, got {max_files}")
+        self.uris = uris
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.num_workers = num_workers
+        self.ordered = ordered
+        self.fetch_fn = fetch_fn
+        self.download_kwargs = download_kwargs
+
+        self._cond = threading.Condition()
+        self._window_files = 0
+        self._window_bytes = 0
+        self._inflight = 0
+        self._downloaded_files = 0
+        self._downloaded_bytes = 0
+        # failed fetches (kept out of the mean file size)
+        self._failed_files = 0
+        self._closed = False
+        self._started = False
+        self._iterated = False
+        self._results = queue.Queue()
+        self._executor = None
+        self._dispatcher = None
+
+    # ---- window accounting ----
+
+    def _has_room(self):
+        if self._window_files >= self.max_files:
+            return False
+        if self.max_bytes is not None:
+            if self._downloaded_files == 0:
+                return self._inflight == 0 and self._window_bytes < self.max_bytes
+            mean_size = self._downloaded_bytes / self._downloaded_files
+            if self._window_bytes + (self._inflight + 1) * mean_size > self.max_bytes:
+                # always allow one file in the window, however large
+                return self._window_files == 0
+        return True
+
+    def _release(self, num_bytes):
+        with self._cond:
+            self._window_files -= 1
+            self._window_bytes -= num_bytes
+            self._cond.notify_all()
+
+    # ---- background work ----
+
+    def _fetch(self, uri):
+        num_bytes = 0
+        fetched = False
+        try:
+            if self.fetch_fn is not None:
+                cached_file, extracted_dir = self.fetch_fn(uri)
+            else:
+                cached_file, extracted_dir = download_data_file(uri, **self.download_kwargs)
+            num_bytes = os.path.getsize(cached_file) if os.path.isfile(cached_file) else 0
+            fetched = True
+        finally:
+            with self._cond:
+                self._inflight -= 1
+                if fetched:
+                    self._window_bytes += num_bytes
+                    self._downloaded_files += 1
+                    self._downloaded_bytes += num_bytes
+                else:
+                    self._failed_files += 1
+                self._cond.notify_all()
+        return uri, cached_file, extracted_dir, num_bytes
+
+    def _dispatch(self):
+        num_submitted = 0
+        try:
+            for uri in self.uris:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._closed or self._has_room())
+                    if self._closed:
+                        break
+                    self._window_files += 1
+                    self._inflight += 1
+                future = self._executor.submit(self._fetch, uri)
+                if self.ordered:
+                    self._results.put(future)
+                else:
+                    future.add_done_callback(self._results.put)
+                num_submitted += 1
+        except BaseException as e:
+            # surface errors from the uri iterable to the consumer
+            logger.error(f"Prefetcher stopped reading uris: {e}")
+            self._results.put(e)
+        finally:
+            self._results.put(_Done(num_submitted))
+
+    def start(self):
+        """Start prefetching before the first iteration (idempotent; iterating starts it too)."""
+        if self._started:
+            return self
+        self._started = True
+        self._executor = ThreadPoolExecutor(max_workers=self.num_workers,
+                                            thread_name_prefix="remote-data-prefetch")
+        self._dispatcher = threading.Thread(target=self._dispatch, name="remote-data-prefetch-dispatch",
+                                            daemon=True)
+        self._dispatcher.start()
+        return self
+
+    def close(self):
+        """Stop prefetching; downloads already in flight are allowed to finish."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # ---- consumer side ----
+
+    def __iter__(self):
+        # an explicit start() only warms the window up; the first iteration consumes it
+        if self._iterated:
+            raise RuntimeError("Prefetcher can only be iterated once")
+        self._iterated = True
+        self.start()
+        return self._iterate()
+
+    def _iterate(self):
+        num_received = 0
+        num_submitted = None
+        prev_bytes = None
+        try:
+            while num_submitted is None or num_received < num_submitted:
+                # the consumer is done with the previous file once it asks for the next
+                if prev_bytes is not None:
+                    self._release(prev_bytes)
+                    prev_bytes = None
+
+                item = self._results.get()
+                if isinstance(item, _Done):
+                    num_submitted = item.num_submitted
+                    continue
+                if isinstance(item, BaseException):
+                    raise item
+                num_received += 1
+
+                try:
+                    uri, cached_file, extracted_dir, num_bytes = item.result()
+                except BaseException:
+                    self._release(0)
+                    raise
+                prev_bytes = num_bytes
+                yield uri, cached_file, extracted_dir
+        finally:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
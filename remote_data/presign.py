@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import hashlib
+import calendar
+import logging
+import threading
+
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['get_signed_url', 'clear_signed_url_cache']
+
+DEFAULT_EXPIRES_IN_SECONDS = 3600
+# re-sign once less than this fraction of a url's lifetime is left...
+_REFRESH_FRACTION = 0.1
+# ...but never with less than this many seconds left
+_MIN_REFRESH_SECONDS = 60
+_MAX_ENTRIES = 65536
+# env vars that change which credentials sign_url_if_needed picks up
+_CREDENTIAL_ENV_VARS = ('AWS_PROFILE', 'AWS_ACCESS_KEY_ID', 'S3_ENDPOINT_URL', 'AWS_REGION')
+
+class _Entry:
+    __slots__ = ('lock', 'signed_url', 'expires_at', 'refresh_at')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.signed_url = None
+        self.expires_at = 0.0
+        self.refresh_at = 0.0
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _credential_identity(s3_config):
+    """Digest of everything that selects the signing credentials (never stores secrets)."""
+    identity = [sorted((key, str(value)) for key, value in (s3_config or {}).items()),
+                [os.environ.get(var) for var in _CREDENTIAL_ENV_VARS]]
+    return hashlib.sha1(json.dumps(identity).encode('utf-8')).hexdigest()
+
+def _parse_expiry(signed_url):
+    """Wall-clock expiry encoded in a presigned url (SigV4 or SigV2), or None."""
+    query = parse_qs(urlparse(signed_url).query)
+    try:
+        if 'X-Amz-Date' in query and 'X-Amz-Expires' in query:
+            signed_at = calendar.timegm(time.strptime(query['X-Amz-Date'][0], '%Y%m%dT%H%M%SZ'))
+            return signed_at + int(query['X-Amz-Expires'][0])
+        if 'Expires' in query:
+            return int(query['Expires'][0])
+    except ValueError:
+        pass
+    return None
+
+def get_signed_url(url, s3_config=None, expires_in_seconds=DEFAULT_EXPIRES_IN_SECONDS):
+    """
+    `sign_url_if_needed(url)`, memoized per (url, credentials, expires_in_seconds).
+
+    A cached url is reused until it is close to expiring (the last 10% of its lifetime,
+    at least 60s): it is then re-signed by the first caller that needs it while other
+    threads asking for the same url wait for the result instead of signing it too. The
+    expiry is read from the signed url when present, else taken as `expires_in_seconds`
+    from signing. Urls that need no signing are cached the same way.
+
+    Args:
+        url: http(s) url (possibly of a private s3-backed object).
+        s3_config: Credentials / endpoint, as elsewhere; part of the cache key.
+        expires_in_seconds: Lifetime requested for the presigned url.
+    """
+    key = (url, _credential_identity(s3_config), expires_in_seconds)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            entry = _cache[key] = _Entry()
+            if len(_cache) > _MAX_ENTRIES:
+                _cache.popitem(last=False)
+        else:
+            _cache.move_to_end(key)
+
+    now = time.time()
+    if entry.signed_url is not None and now < entry.refresh_at:
+        return entry.signed_url
+
+    with entry.lock:
+        now = time.time()
+        if entry.signed_url is None or now >= entry.refresh_at:
+            from visionlab.auth import sign_url_if_needed
+            signed_url = sign_url_if_needed(url, s3_config=s3_config, expires_in_seconds=expires_in_seconds)
+            expires_at = _parse_expiry(signed_url) or now + expires_in_seconds
+            lifetime = max(0.0, expires_at - now)
+            margin = min(max(_REFRESH_FRACTION * lifetime, _MIN_REFRESH_SECONDS), lifetime / 2)
+            entry.signed_url, entry.expires_at, entry.refresh_at = signed_url, expires_at, expires_at - margin
+            logger.debug(f"Signed {url} (expires in {lifetime:.0f}s)")
+        return entry.signed_url
+
+def clear_signed_url_cache():
+    """Forget all cached signed urls (e.g. after rotating credentials)."""
+    with _cache_lock:
+        _cache.clear()
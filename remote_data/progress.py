@@ -0,0 +1,26 @@
+__all__ = ['progress_bar']
+
+class _NullProgressBar:
+    """Stand-in for tqdm when progress is disabled (avoids importing tqdm)."""
+    def __init__(self, *args, **kwargs):
+        self.n = 0
+
+    def update(self, n=1):
+        self.n += n
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def progress_bar(total=None, disable=False, **kwargs):
+    """Return a tqdm progress bar, importing tqdm only when it will be shown."""
+    if disable:
+        return _NullProgressBar()
+    from tqdm.auto import tqdm
+    return tqdm(total=total, **kwargs)
@@ -0,0 +1,341 @@
+import io
+import os
+import re
+import uuid
+import hashlib
+import logging
+import threading
+
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['RemoteFile', 'open_remote']
+
+# matches "bytes 0-1023/146515"
+CONTENT_RANGE_REGEX = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+# matches "bytes */0", sent with the 416 for a ranged GET of an empty object
+UNSATISFIED_RANGE_REGEX = re.compile(r'bytes\s+\*/(\d+)')
+
+# piece size yielded by the `stream` methods
+STREAM_PIECE_SIZE = 256 * 1024
+
+def _is_empty_object_response(status_code, headers):
+    """True for the 416 a server answers a `bytes=0-N` GET of an empty object with."""
+    if status_code != 416:
+        return False
+    match = UNSATISFIED_RANGE_REGEX.match(headers.get('Content-Range') or '')
+    return match is None or int(match.group(1)) == 0
+
+class _HttpRangeSource:
+    """
+    Ranged GETs against an http(s) url. Private urls are signed through the shared
+    presigned-url cache on every request, so a long-lived reader outlives any one signature.
+    """
+    def __init__(self, url, s3_config=None):
+        import requests
+        self.unsigned_url = url
+        self.s3_config = s3_config
+        self.session = requests.Session()
+        self.endpoint_url = None
+        self.size = None
+        self.etag = None
+        self.whole_body = None
+
+    @property
+    def url(self):
+        from visionlab.remote_data.presign import get_signed_url
+        return get_signed_url(self.unsigned_url, s3_config=self.s3_config)
+
+    def probe(self, length):
+        """Fetch the first `length` bytes, learning size/etag from the response headers."""
+        # GET (not HEAD): presigned urls are only valid for the method they were signed for
+        response = self.session.get(self.url, headers={'Range': f'bytes=0-{length-1}'})
+        if _is_empty_object_response(response.status_code, response.headers):
+            self.etag = response.headers.get('ETag', '').strip('"') or None
+            self.size = 0
+            return b''
+        response.raise_for_status()
+        self.etag = response.headers.get('ETag', '').strip('"') or None
+        if response.status_code == 206:
+            match = CONTENT_RANGE_REGEX.match(response.headers.get('Content-Range', ''))
+            if match and match.group(3) != '*':
+                self.size = int(match.group(3))
+        if self.size is None:
+            # server ignored the Range header and sent everything
+            self.whole_body = response.content
+            self.size = len(self.whole_body)
+            return self.whole_body[:length]
+        return response.content
+
+    def fetch(self, start, end):
+        """Bytes [start, end) of the object."""
+        if self.whole_body is not None:
+            return self.whole_body[start:end]
+        response = self.session.get(self.url, headers={'Range': f'bytes={start}-{end-1}'})
+        response.raise_for_status()
+        if response.status_code != 206:
+            return response.content[start:end]
+        return response.content
+
+    def stream(self, start, end, timeout=None):
+        """
+        Stream bytes [start, end) as pieces. Returns (iterator, close); `close` may be called
+        from another thread to abort a stalled transfer. `timeout` bounds each socket read.
+        """
+        if self.whole_body is not None:
+            return iter([self.whole_body[start:end]]), lambda: None
+        response = self.session.get(self.url, headers={'Range': f'bytes={start}-{end-1}'},
+                                    stream=True, timeout=timeout)
+        response.raise_for_status()
+        if response.status_code != 206:
+            content = response.content[start:end]
+            return iter([content]), response.close
+        return response.iter_content(STREAM_PIECE_SIZE), response.close
+
+    def close(self):
+        self.session.close()
+
+class _S3RangeSource:
+    """Ranged GetObject calls against an s3-provider uri (aws://, wasabi://, s3://, ...)."""
+    def __init__(self, uri, s3_config=None):
+        from visionlab.auth import create_s3_client, parse_uri
+        _, self.bucket_name, self.key, _ = parse_uri(uri)
+        self.client = create_s3_client(uri, s3_config=s3_config)
+        self.endpoint_url = self.client.meta.endpoint_url
+        self.size = None
+        self.etag = None
+
+    def probe(self, length):
+        response = self.client.head_object(Bucket=self.bucket_name, Key=self.key)
+        self.size = response['ContentLength']
+        self.etag = response['ETag'].strip('"')
+        if self.size == 0:
+            return b''
+        return self.fetch(0, min(length, self.size))
+
+    def fetch(self, start, end):
+        response = self.client.get_object(Bucket=self.bucket_name, Key=self.key,
+                                          Range=f'bytes={start}-{end-1}')
+        return response['Body'].read()
+
+    def stream(self, start, end, timeout=None):
+        """Stream bytes [start, end) as pieces. Returns (iterator, close), as for http."""
+        response = self.client.get_object(Bucket=self.bucket_name, Key=self.key,
+                                          Range=f'bytes={start}-{end-1}')
+        body = response['Body']
+        return body.iter_chunks(STREAM_PIECE_SIZE), body.close
+
+    def close(self):
+        pass
+
+def _open_range_source(uri, s3_config=None):
+    """Ranged-read source for an s3-provider uri or http(s) url."""
+    from visionlab.auth import check_is_s3_uri
+    if check_is_s3_uri(uri):
+        return _S3RangeSource(uri, s3_config=s3_config)
+    elif urlparse(uri).scheme in ['http', 'https']:
+        return _HttpRangeSource(uri, s3_config=s3_config)
+    raise ValueError(f"Expected an s3-provider uri or http(s) url, got {uri}")
+
+class RemoteFile(io.RawIOBase):
+    """
+    Seekable, read-only file object for a remote object, served by ranged reads.
+
+    Reads are split into fixed-size blocks held in an in-memory LRU cache (and optionally
+    an on-disk block cache keyed by uri and ETag, so a changed object never serves stale
+    blocks). Missing blocks that are adjacent are fetched with a single range request.
+    Once two consecutive sequential reads (each starting where the previous one stopped)
+    have had to fetch, a sequential read that reaches the end of what is cached also
+    fetches the next `readahead_blocks` blocks.
+
+    Only the bytes that are actually read are transferred, e.g. the header of a
+    safetensors file, or a few records from a large shard:
+
+        with open_remote("wasabi://bucket/model.safetensors") as f:
+            header_size = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_size))
+
+    Args:
+        uri: s3-provider uri (s3://, aws://, wasabi://, ...) or http(s) url.
+        block_size: Size of each cached block in bytes.
+        cache_blocks: Number of blocks kept in the in-memory LRU cache.
+        readahead_blocks: Blocks fetched ahead when reads are sequential (0 disables).
+        disk_cache_dir: Optional directory for a persistent block cache.
+        s3_config: Credentials/endpoint overrides (profile, endpoint_url, region).
+    """
+    def __init__(self, uri, block_size=1024*1024, cache_blocks=64, readahead_blocks=4,
+                 disk_cache_dir=None, s3_config=None):
+        super().__init__()
+
+        self.uri = uri
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.readahead_blocks = readahead_blocks
+        self._blocks = OrderedDict()
+        self._lock = threading.RLock()
+        self._pos = 0
+        # where the last read stopped, and how many sequential reads in a row had to fetch
+        self._read_end = None
+        self._sequential_misses = 0
+        self.num_requests = 0
+        self.bytes_fetched = 0
+
+        self._source = _open_range_source(uri, s3_config=s3_config)
+
+        first = self._source.probe(block_size)
+        self.num_requests += 1
+        self.bytes_fetched += len(first)
+        self.size = self._source.size
+        self.etag = self._source.etag
+
+        self.disk_cache_dir = None
+        if disk_cache_dir is not None:
+            key = hashlib.sha256(f"{uri}|{self.etag}|{block_size}".encode()).hexdigest()[:32]
+            self.disk_cache_dir = os.path.join(disk_cache_dir, key)
+            os.makedirs(self.disk_cache_dir, exist_ok=True)
+
+        if self.size:
+            self._store(0, first)
+
+    @property
+    def num_blocks(self):
+        return (self.size + self.block_size - 1) // self.block_size
+
+    # ---- block cache ----
+
+    def _disk_path(self, index):
+        return os.path.join(self.disk_cache_dir, f"{index}.blk")
+
+    def _store(self, index, data):
+        self._blocks[index] = data
+        self._blocks.move_to_end(index)
+        while len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+        if self.disk_cache_dir is not None:
+            path = self._disk_path(index)
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+
+    def _lookup(self, index):
+        data = self._blocks.get(index)
+        if data is not None:
+            self._blocks.move_to_end(index)
+            return data
+        if self.disk_cache_dir is not None:
+            path = self._disk_path(index)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                self._store(index, data)
+                return data
+        return None
+
+    def _get_blocks(self, first, last, sequential=False):
+        """Return {index: bytes} for blocks first..last, fetching what's missing."""
+        found = {}
+        missing = []
+        for index in range(first, last + 1):
+            data = self._lookup(index)
+            if data is None:
+                missing.append(index)
+            else:
+                found[index] = data
+
+        if not sequential:
+            self._sequential_misses = 0
+        elif missing:
+            self._sequential_misses += 1
+        # read ahead only for a stream of reads, not e.g. a header read in two steps, and
+        # only once the stream has used up what was read ahead (so it's fetched in batches)
+        if (self.readahead_blocks and sequential and self._sequential_misses >= 2
+                and last + 1 < self.num_blocks and self._lookup(last + 1) is None):
+            for index in range(last + 1, min(last + 1 + self.readahead_blocks, self.num_blocks)):
+                if self._lookup(index) is None:
+                    missing.append(index)
+
+        # coalesce adjacent missing blocks into a single range request per run
+        runs = []
+        for index in missing:
+            if runs and runs[-1][-1] == index - 1:
+                runs[-1].append(index)
+            else:
+                runs.append([index])
+        for run in runs:
+            start = run[0] * self.block_size
+            end = min((run[-1] + 1) * self.block_size, self.size)
+            data = self._source.fetch(start, end)
+            self.num_requests += 1
+            self.bytes_fetched += len(data)
+            for index in run:
+                offset = index * self.block_size - start
+                block = data[offset:offset + self.block_size]
+                found[index] = block
+                self._store(index, block)
+        return found
+
+    # ---- file api ----
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence}, should be 0, 1 or 2)")
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+        self._pos = pos
+        return self._pos
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        with self._lock:
+            end = self.size if size is None or size < 0 else min(self._pos + size, self.size)
+            if self._pos >= end:
+                return b''
+            first = self._pos // self.block_size
+            last = (end - 1) // self.block_size
+            blocks = self._get_blocks(first, last, sequential=self._pos == self._read_end)
+            data = b''.join(blocks[index] for index in range(first, last + 1))
+            offset = self._pos - first * self.block_size
+            data = data[offset:offset + (end - self._pos)]
+            self._pos = self._read_end = end
+            return data
+
+    def readall(self):
+        return self.read(-1)
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._source.close()
+            self._blocks.clear()
+        super().close()
+
+def open_remote(uri, mode='rb', **kwargs):
+    """Open a remote object for reading as a seekable file object (see `RemoteFile`)."""
+    if mode not in ('r', 'rb'):
+        raise ValueError(f"open_remote only supports read-only binary mode, got mode={mode!r}")
+    return RemoteFile(uri, **kwargs)
@@ -3,28 +3,41 @@ import math
 import os
 import logging
 
-from visionlab.auth import create_s3_client, parse_uri
-
 logger = logging.getLogger(__name__) # Use module name for clarity
 
-def _get_etag_from_s3(bucket_name, object_key, s3_client):
-    """Gets the ETag from an S3 object."""
+__all__ = ['get_etag_from_s3_uri', 'get_etag_and_size_from_s3_uri', 'calculate_s3_etag']
+
+def _head_s3_object(bucket_name, object_key, s3_client):
+    """Gets (ETag, ContentLength) from an S3 object, or (None, None) on error."""
     try:
         response = s3_client.head_object(Bucket=bucket_name, Key=object_key)
         logger.info(f"ETag: {response['ETag']}")
-        return response['ETag'].strip('"')  # Remove surrounding quotes
+        return response['ETag'].strip('"'), response.get('ContentLength')  # Remove surrounding quotes
     except Exception as e:
         logger.error(f"Error getting ETag: {e}")
-        return None
+        return None, None
+
+def _get_etag_from_s3(bucket_name, object_key, s3_client):
+    """Gets the ETag from an S3 object."""
+    return _head_s3_object(bucket_name, object_key, s3_client)[0]
         
 def get_etag_from_s3_uri(s3_uri, s3_config=None):
     """Gets the Etag from an S3 object. Guesses credentials from s3_uri, 
     e.g., wasabi://visionlab-datasets/imagenetV2/class_info.json will trigger
     the use of wasabi credentials"""    
+    from visionlab.auth import create_s3_client, parse_uri
     provider, bucket_name, object_key, _ = parse_uri(s3_uri)
     s3_client = create_s3_client(s3_uri, s3_config=s3_config)
 
     return _get_etag_from_s3(bucket_name, object_key, s3_client)
+
+def get_etag_and_size_from_s3_uri(s3_uri, s3_config=None):
+    """Like `get_etag_from_s3_uri`, but returns (etag, size_in_bytes) from the same HEAD request."""
+    from visionlab.auth import create_s3_client, parse_uri
+    provider, bucket_name, object_key, _ = parse_uri(s3_uri)
+    s3_client = create_s3_client(s3_uri, s3_config=s3_config)
+
+    return _head_s3_object(bucket_name, object_key, s3_client)
      
 def calculate_s3_etag(file_path, chunk_size=8*1024*1024):
     """
@@ -42,10 +55,12 @@ def calculate_s3_etag(file_path, chunk_size=8*1024*1024):
     
     # For small files that would be uploaded in a single part
     if file_size <= chunk_size:
-        # Simply return the MD5 hash for small files
+        # Simply return the MD5 hash for small files (read in pieces: chunk_size may be large)
+        file_hash = hashlib.md5()
         with open(file_path, 'rb') as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()
-        return f'"{file_hash}"'
+            for data in iter(lambda: f.read(1024 * 1024), b''):
+                file_hash.update(data)
+        return f'"{file_hash.hexdigest()}"'
     
     # For larger files that would be multipart uploads
     md5s = []
@@ -1,4 +1,6 @@
 from .s5cmd_cp import *
 from .s5cmd_list_bucket import list_bucket
 from .s5cmd_options import *
-from .s5cmd_sync import *
\ No newline at end of file
+from .s5cmd_progress import S5cmdProgress, parse_s5cmd_progress
+from .s5cmd_sync import *
+from .s5cmd_tuning import tune_s5cmd_transfer
\ No newline at end of file
@@ -1,23 +1,34 @@
 import os
 import pty
+import codecs
 import sys
 import re
+import time
 import subprocess
 import logging
 import threading
 
-from typing import Optional, Dict, Any # Added Optional, Dict, Any
-from filelock import FileLock, Timeout # Added FileLock, Timeout
+from typing import Optional, Dict, Any, Callable # Added Optional, Dict, Any
 
 from pdb import set_trace
 
 from visionlab.auth import normalize_uri
+from visionlab.remote_data.endpoint_stats import endpoint_key
+from visionlab.remote_data.progress import progress_bar
+from visionlab.remote_data.single_flight import single_flight_download
 from .s5cmd_options import get_s5cmd_options_for_uri
+from .s5cmd_progress import S5cmdProgress, S5cmdOutputParser
+from .s5cmd_tuning import get_transfer_options, record_throughput, MIN_RECORDED_BYTES
 
 logger = logging.getLogger(__name__) # Use module name for clarity
 
 __all__ = ['s5cmd_download_file', 's5cmd_cp']
 
+# default progress display for s5cmd_cp: 'tqdm', 'echo' or 'quiet'
+PROGRESS_DISPLAY_ENV_VAR = 'VISIONLAB_REMOTE_DATA_PROGRESS'
+
+READ_CHUNK_SIZE = 64 * 1024
+
 # def s5cmd_download_file(remote_filepath: str, local_filepath: str,
 #                         profile: str=None, endpoint_url: str=None, region: str=None, 
 #                         dry_run: bool=False, show_progress: bool=True,
@@ -45,9 +56,16 @@ def s5cmd_download_file(remote_filepath: str, local_filepath: str,
                         dry_run: bool = False, show_progress: bool = True,
                         no_signed_option: Optional[bool] = None, # Changed to Optional[bool] for clarity
                         endpoint_option: Optional[str] = None, # Changed to Optional[str]
-                        lock_timeout: int = 600) -> None: # Added lock_timeout parameter (e.g., 10 minutes)
+                        lock_timeout: int = 600, # Added lock_timeout parameter (e.g., 10 minutes)
+                        progress_callback: Optional[Callable[[S5cmdProgress], None]] = None,
+                        display: Optional[str] = None,
+                        object_size: Optional[int] = None) -> None:
     """
-    Downloads a file using s5cmd, ensuring atomicity with a file lock.
+    Downloads a file using s5cmd, at most once across concurrent processes.
+
+    One process downloads into a temp file and atomically renames it into place;
+    concurrent callers wait for it (showing its progress) instead of re-downloading.
+    See `single_flight_download`.
 
     Args:
         remote_filepath: The source URI (e.g., s3://bucket/key, wasabi://bucket/key).
@@ -56,104 +74,107 @@ def s5cmd_download_file(remote_filepath: str, local_filepath: str,
             profile: AWS profile name (or equivalent).
             endpoint_url: Custom S3 endpoint URL.
             region: AWS region (or equivalent).
+            numworkers: s5cmd --numworkers (size of the global worker pool).
+            concurrency: s5cmd cp --concurrency (parallel parts per object).
+            part_size: s5cmd cp --part-size, in MiB.
+            auto_tune: If True, pick any of the three above that aren't set from the
+                object size, CPU count and recent throughput to this endpoint
+                (see `tune_s5cmd_transfer`).
         dry_run: If True, simulate the command without actual transfer.
         show_progress: If True, display s5cmd progress.
         no_signed_option: If True, use --no-sign-request (for public buckets).
         endpoint_option: Explicit endpoint option string (overrides endpoint_url).
-        lock_timeout: Maximum time in seconds to wait for the lock.
+        lock_timeout: Maximum time in seconds to wait for another process' download.
+        progress_callback: Called with each parsed `S5cmdProgress` event.
+        display: Progress display: 'tqdm', 'echo' or 'quiet' (see `s5cmd_cp`).
+        object_size: Size of the remote object in bytes, if known (e.g. from the ETag
+            HEAD request); used for auto-tuning and for waiters' progress bars.
     """
     if s3_config is None:
         s3_config = {}
     profile = s3_config.get('profile')
     endpoint_url = s3_config.get('endpoint_url')
     region = s3_config.get('region')
-    
-    lock_filepath = local_filepath + ".lock"
-    # Ensure the directory for the lock file exists
-    os.makedirs(os.path.dirname(lock_filepath), exist_ok=True)
-    lock = FileLock(lock_filepath, timeout=lock_timeout)
 
-    try:
-        logger.info(f"Acquiring lock for {local_filepath}...")
-        with lock:
-            logger.info(f"Lock acquired for {local_filepath}.")
-            # Check if file exists *after* acquiring the lock
-            if os.path.isfile(local_filepath) and os.path.getsize(local_filepath) > 0:
-                logger.info(f"File {local_filepath} already exists and is non-empty. Skipping download.")
-                return # Exit early if file exists
-
-            logger.info(f"File {local_filepath} does not exist or is empty. Proceeding with download.")
-
-            # Ensure the directory for the target file exists
-            os.makedirs(os.path.dirname(local_filepath), exist_ok=True)
-
-            # Get s5cmd_options needed for the command line call:
-            s5cmd_options = get_s5cmd_options_for_uri(remote_filepath,
-                                                      profile=profile,
-                                                      endpoint_url=endpoint_url,
-                                                      region=region,
-                                                      no_signed_option=no_signed_option,
-                                                      endpoint_option=endpoint_option)
-
-            # Add command-specific options
-            s5cmd_options['dry_run_option'] = '--dry-run' if dry_run else None
-            # Note: s5cmd default is to show progress, explicitly disable if needed
-            s5cmd_options['show_progress_option'] = '--show-progress' if show_progress else None
-
-            # Normalize the remote path (e.g., ensure s3:// prefix)
-            normalized_remote_filepath = normalize_uri(remote_filepath)
-
-            # Call s5cmd_cp *within* the lock context
-            s5cmd_cp(normalized_remote_filepath, local_filepath, s5cmd_options)
-
-        logger.info(f"Lock released for {local_filepath}.")
-
-    except Timeout:
-        logger.error(f"Timeout occurred while waiting for lock on {lock_filepath}. Another process might be holding it.")
-        raise # Re-raise the timeout error
-    except Exception as e:
-        logger.error(f"An error occurred during download for {local_filepath}: {e}")
-         # Attempt to clean up potentially incomplete file on error
-        if os.path.exists(local_filepath):
-            try:
-                # Check size again, maybe it finished despite error signal? Unlikely but possible.
-                # Or maybe it's better to always remove on error? Depends on desired behavior.
-                # For now, let's remove if it exists after an error during the s5cmd_cp call.
-                if not (os.path.isfile(local_filepath) and os.path.getsize(local_filepath) > 0):
-                     logger.warning(f"Removing potentially incomplete file: {local_filepath}")
-                     os.remove(local_filepath)
-            except OSError as rm_err:
-                logger.error(f"Could not remove incomplete file {local_filepath}: {rm_err}")
-        raise # Re-raise the original exception
-    finally:
-        # Clean up the lock file itself if it still exists
-        # FileLock usually handles this, but manual cleanup can be a fallback
-        if os.path.exists(lock_filepath):
-            try:
-                # Ensure the lock is released before trying to remove the file
-                if lock.is_locked:
-                     lock.release(force=True) # Force release if needed
-                os.remove(lock_filepath)
-                logger.debug(f"Removed lock file: {lock_filepath}")
-            except OSError as e:
-                # This might happen if another process cleaned it up first
-                logger.warning(f"Could not remove lock file {lock_filepath} (might be gone already): {e}")
+    def _download(dst_filepath):
+        # Get s5cmd_options needed for the command line call:
+        s5cmd_options = get_s5cmd_options_for_uri(remote_filepath,
+                                                  profile=profile,
+                                                  endpoint_url=endpoint_url,
+                                                  region=region,
+                                                  no_signed_option=no_signed_option,
+                                                  endpoint_option=endpoint_option)
+
+        # Add command-specific options
+        s5cmd_options['dry_run_option'] = '--dry-run' if dry_run else None
+        # Note: s5cmd default is to show progress, explicitly disable if needed
+        s5cmd_options['show_progress_option'] = '--show-progress' if show_progress else None
+
+        # numworkers / concurrency / part size (explicit or auto-tuned)
+        endpoint_option_value = s5cmd_options.get('endpoint_option')
+        endpoint = endpoint_key(remote_filepath, endpoint_url=endpoint_option_value.split()[-1] if endpoint_option_value else None)
+        transfer_options = get_transfer_options(s3_config, object_size=object_size, endpoint=endpoint)
+        concurrency = transfer_options.pop('concurrency')
+        s5cmd_options.update(transfer_options)
+
+        # Normalize the remote path (e.g., ensure s3:// prefix)
+        normalized_remote_filepath = normalize_uri(remote_filepath)
+        start = time.perf_counter()
+        s5cmd_cp(normalized_remote_filepath, dst_filepath, s5cmd_options,
+                 progress_callback=progress_callback, display=display)
+        # the history only feeds auto-tuning, so don't touch it otherwise
+        if not dry_run and s3_config.get('auto_tune') and os.path.isfile(dst_filepath) \
+                and os.path.getsize(dst_filepath) >= MIN_RECORDED_BYTES:
+            record_throughput(endpoint, os.path.getsize(dst_filepath), time.perf_counter() - start,
+                              concurrency=concurrency)
+
+    if dry_run:
+        # nothing is written, so there is nothing to coordinate
+        _download(local_filepath)
+        return
+
+    single_flight_download(local_filepath, _download,
+                           lock_timeout=lock_timeout,
+                           show_progress=show_progress and _resolve_display(display) != 'quiet',
+                           total_bytes=object_size)
                 
-def s5cmd_cp(src_filepath: str, dst_filepath: str, s5cmd_options=None) -> None:
+def _resolve_display(display):
+    if display is None:
+        display = os.environ.get(PROGRESS_DISPLAY_ENV_VAR, 'tqdm')
+    if display not in ('tqdm', 'echo', 'quiet'):
+        raise ValueError(f"Unsupported progress display `{display}`. Expected 'tqdm', 'echo' or 'quiet'.")
+    return display
+
+def s5cmd_cp(src_filepath: str, dst_filepath: str, s5cmd_options=None,
+             progress_callback: Optional[Callable[[S5cmdProgress], None]] = None,
+             display: Optional[str] = None) -> None:
     """
     Execute s5cmd cp command to download a file from S3 with real-time progress, with less redundant errors.
+
+    s5cmd's progress bar (``--show-progress``) is parsed into `S5cmdProgress` events
+    (bytes done/total, rate, ETA) that are passed to `progress_callback` and displayed
+    according to `display`:
+        'tqdm': a tqdm progress bar (default)
+        'echo': the raw s5cmd terminal output
+        'quiet': nothing (for batch jobs; other output is logged at INFO)
+    The default can be set with the VISIONLAB_REMOTE_DATA_PROGRESS env var. Only a bounded
+    tail of the output is kept, for the error message if s5cmd fails.
     """
     if os.path.isfile(dst_filepath):
         return
 
+    display = _resolve_display(display)
     s5cmd_options = s5cmd_options or {}
     cmd_parts = [
         "s5cmd",
         s5cmd_options.get('dry_run_option'),
         s5cmd_options.get('no_signed_option'),
         s5cmd_options.get('endpoint_option'),
+        s5cmd_options.get('numworkers_option'),
         "cp",
         s5cmd_options.get('show_progress_option'),
+        s5cmd_options.get('concurrency_option'),
+        s5cmd_options.get('part_size_option'),
         src_filepath,
         dst_filepath
     ]
@@ -161,8 +182,11 @@ def s5cmd_cp(src_filepath: str, dst_filepath: str, s5cmd_options=None) -> None:
     cmd = " ".join(part for part in cmd_parts if part)
     logger.info(f"Executing command: {cmd}")
 
+    parser = S5cmdOutputParser()
+    # a multi-byte character can be split across reads
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pbar = None
     master_fd, slave_fd = pty.openpty()
-    pty_output = ""  # Capture pty output
     try:
         proc = subprocess.Popen(
             cmd,
@@ -174,33 +198,49 @@ def s5cmd_cp(src_filepath: str, dst_filepath: str, s5cmd_options=None) -> None:
         )
         os.close(slave_fd)
 
+        def _handle(items):
+            nonlocal pbar
+            for item in items:
+                if isinstance(item, S5cmdProgress):
+                    if progress_callback is not None:
+                        progress_callback(item)
+                    if display == 'tqdm':
+                        if pbar is None:
+                            pbar = progress_bar(total=item.bytes_total, unit="B", unit_scale=True,
+                                                unit_divisor=1024, desc=os.path.basename(dst_filepath))
+                        pbar.update(item.bytes_done - pbar.n)
+                elif display == 'tqdm':
+                    (pbar.write if pbar is not None else print)(item)
+                elif display == 'quiet':
+                    logger.info(f"s5cmd: {item}")
+
         while True:
             try:
-                output = os.read(master_fd, 1024)
+                output = os.read(master_fd, READ_CHUNK_SIZE)
             except OSError:
                 break
             if not output:
                 break
-            decoded_output = output.decode('utf-8', errors='replace')
-            pty_output += decoded_output
-            sys.stdout.write(decoded_output)
-            sys.stdout.flush()
+            decoded_output = decoder.decode(output)
+            if display == 'echo':
+                sys.stdout.write(decoded_output)
+                sys.stdout.flush()
+            _handle(parser.feed(decoded_output))
+        _handle(parser.feed(decoder.decode(b'', final=True)))
+        _handle(parser.flush())
 
         proc.wait()
-        stdout, stderr = proc.communicate() #get any final errors
 
     finally:
         os.close(master_fd)
+        if pbar is not None:
+            pbar.close()
 
     return_code = proc.returncode
     logger.info(f"s5cmd cp completed with return code: {return_code}")
 
     if return_code != 0:
         error_message = f"s5cmd failed with return code {return_code}\n{cmd}"
-
-        # Check if pty_output contains error-level information
-        if "ERROR" not in pty_output and stderr:            
-            error_message += f"\nstderr: {stderr.decode()}"
-
+        if parser.tail.strip():
+            error_message += f"\noutput (tail):\n{parser.tail.strip()}"
         raise RuntimeError(error_message)
-
@@ -1,6 +1,8 @@
 import os
 from pdb import set_trace
 
+from visionlab.remote_data.tracing import span
+
 from visionlab.auth import (
     normalize_uri, 
     parse_uri, 
@@ -45,9 +47,11 @@ def get_s5cmd_options(profile=None, endpoint_url=None, region=None):
     return env, endpoint_url
 
 def get_s5cmd_options_for_uri(uri, profile=None, endpoint_url=None, region=None,
-                              endpoint_option=None, no_signed_option=None, storage_options=None):
+                              endpoint_option=None, no_signed_option=None, storage_options=None,
+                              check_public=True):
     """
         Sets env, endpoint_url, and no_signed_option for the given uri
+        (check_public=False skips the public-object check, e.g. for uploads, which are always signed)
 
         uri can be any s3-like uri
         s3://visionlab-datasets/
@@ -62,12 +66,13 @@ def get_s5cmd_options_for_uri(uri, profile=None, endpoint_url=None, region=None,
     env = os.environ.copy()
 
     # profile credentials can override env variables & endpoint_url
-    if profile is not None:
-        # use the provided profile
-        aws_env,endpoint_url = get_s5cmd_options(profile=profile)            
-    else:
-        # no profile provided; check default profile names for this provider
-        aws_env,endpoint_url = get_s5cmd_options_with_provider_hint(provider)
+    with span("credentials", uri=uri, provider=provider):
+        if profile is not None:
+            # use the provided profile
+            aws_env,endpoint_url = get_s5cmd_options(profile=profile)            
+        else:
+            # no profile provided; check default profile names for this provider
+            aws_env,endpoint_url = get_s5cmd_options_with_provider_hint(provider)
 
     # update env variables
     if aws_env:
@@ -84,8 +89,9 @@ def get_s5cmd_options_for_uri(uri, profile=None, endpoint_url=None, region=None,
         env.update(storage_options)        
 
     # prepare the s5cmd command
-    if no_signed_option or check_public_s3_object(s3_uri, endpoint_url=endpoint_url):
-        no_signed_option = "--no-sign-request"
+    with span("public_check", uri=s3_uri):
+        if no_signed_option or (check_public and check_public_s3_object(s3_uri, endpoint_url=endpoint_url)):
+            no_signed_option = "--no-sign-request"
 
     if endpoint_url:
         endpoint_option = f"--endpoint-url {endpoint_url}"
@@ -0,0 +1,103 @@
+import re
+import logging
+
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['S5cmdProgress', 'parse_s5cmd_progress', 'S5cmdOutputParser']
+
+ANSI_ESCAPE_REGEX = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+
+_NUMBER = r'\d+(?:\.\d+)?'
+_UNIT = r'[KMGTP]?i?B'
+
+# e.g. "45.00% ━━━━━━────── 4.50 MiB / 10.00 MiB (2.25 MiB/s) 3s left (0/1)"
+PROGRESS_REGEX = re.compile(
+    rf'(?P<percent>{_NUMBER})%.*?'
+    rf'(?P<done>{_NUMBER})\s*(?P<done_unit>{_UNIT})\s*/\s*(?P<total>{_NUMBER})\s*(?P<total_unit>{_UNIT})'
+    rf'(?:\s*\((?P<rate>{_NUMBER})\s*(?P<rate_unit>{_UNIT})/s\))?'
+    rf'(?:\s*(?P<eta>[0-9hms.]+)\s+left)?'
+    rf'(?:\s*\((?P<objects_done>\d+)/(?P<objects_total>\d+)\))?'
+)
+
+GO_DURATION_REGEX = re.compile(r'(\d+(?:\.\d+)?)(h|ms|m|s)')
+
+_UNIT_BYTES = {
+    'B': 1,
+    'KB': 1000, 'MB': 1000**2, 'GB': 1000**3, 'TB': 1000**4, 'PB': 1000**5,
+    'KiB': 1024, 'MiB': 1024**2, 'GiB': 1024**3, 'TiB': 1024**4, 'PiB': 1024**5,
+}
+
+_DURATION_SECONDS = {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+
+class S5cmdProgress(NamedTuple):
+    """One progress update parsed from `s5cmd cp --show-progress` output."""
+    bytes_done: int
+    bytes_total: int
+    percent: float
+    rate: Optional[float] = None            # bytes/second
+    eta_seconds: Optional[float] = None
+    objects_done: Optional[int] = None
+    objects_total: Optional[int] = None
+
+def _to_bytes(value, unit):
+    return int(float(value) * _UNIT_BYTES.get(unit, 1))
+
+def _parse_duration(text):
+    """Parse a Go duration string (e.g. '1m2s', '3.5s') to seconds."""
+    parts = GO_DURATION_REGEX.findall(text)
+    if not parts:
+        return None
+    return sum(float(value) * _DURATION_SECONDS[unit] for value, unit in parts)
+
+def parse_s5cmd_progress(line):
+    """Parse one s5cmd progress-bar line into an S5cmdProgress, or None if it isn't one."""
+    match = PROGRESS_REGEX.search(ANSI_ESCAPE_REGEX.sub('', line))
+    if match is None:
+        return None
+    groups = match.groupdict()
+    return S5cmdProgress(
+        bytes_done=_to_bytes(groups['done'], groups['done_unit']),
+        bytes_total=_to_bytes(groups['total'], groups['total_unit']),
+        percent=float(groups['percent']),
+        rate=_to_bytes(groups['rate'], groups['rate_unit']) if groups['rate'] else None,
+        eta_seconds=_parse_duration(groups['eta']) if groups['eta'] else None,
+        objects_done=int(groups['objects_done']) if groups['objects_done'] else None,
+        objects_total=int(groups['objects_total']) if groups['objects_total'] else None,
+    )
+
+class S5cmdOutputParser:
+    """
+    Incrementally split s5cmd terminal output into progress events and other lines.
+
+    The progress bar redraws itself with carriage returns, so output is split on both
+    '\\r' and '\\n'. Only a bounded tail of the raw output (`tail_bytes`) is retained,
+    for error reporting, so memory stays constant however long the transfer runs.
+    """
+    def __init__(self, tail_bytes=16 * 1024):
+        self.tail_bytes = tail_bytes
+        self.tail = ''
+        self._partial = ''
+
+    def feed(self, text):
+        """Consume output text; returns a list of S5cmdProgress events and str lines."""
+        self.tail = (self.tail + text)[-self.tail_bytes:]
+        segments = re.split(r'[\r\n]', self._partial + text)
+        # the last segment may be incomplete; keep it for the next chunk
+        self._partial = segments.pop()[-self.tail_bytes:]
+        return self._parse(segments)
+
+    def flush(self):
+        """Parse whatever is left once the process has exited."""
+        segments, self._partial = [self._partial], ''
+        return self._parse(segments)
+
+    def _parse(self, segments):
+        items = []
+        for segment in segments:
+            if not segment.strip():
+                continue
+            event = parse_s5cmd_progress(segment)
+            items.append(event if event is not None else ANSI_ESCAPE_REGEX.sub('', segment).strip())
+        return items
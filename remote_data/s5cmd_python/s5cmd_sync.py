@@ -2,7 +2,6 @@ import os
 import re
 import subprocess
 import logging
-from tqdm.auto import tqdm
 
 from pdb import set_trace
 
@@ -0,0 +1,112 @@
+import os
+import math
+import logging
+
+from visionlab.remote_data import endpoint_stats
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = [
+    'get_transfer_options',
+    'tune_s5cmd_transfer',
+    'record_throughput',
+    'get_recent_throughput',
+]
+
+MiB = 1024 * 1024
+
+# s5cmd defaults (numworkers is global, concurrency/part-size are per `cp`)
+S5CMD_DEFAULT_NUMWORKERS = 256
+S5CMD_DEFAULT_CONCURRENCY = 5
+S5CMD_DEFAULT_PART_SIZE_MB = 50
+
+# objects below this are fetched in a single request; multipart only adds overhead
+SINGLE_PART_THRESHOLD = 16 * MiB
+MIN_PART_SIZE_MB = 8
+MAX_PART_SIZE_MB = 512
+MAX_CONCURRENCY = 64
+# aim for a few parts per connection so stragglers don't dominate the transfer
+PARTS_PER_CONNECTION = 4
+
+# only transfers at least this large are recorded: smaller ones measure latency, not bandwidth
+MIN_RECORDED_BYTES = 64 * MiB
+
+# per-connection throughput bounds used to scale concurrency from measured history
+SLOW_STREAM_BYTES_PER_SEC = 20 * MiB
+FAST_STREAM_BYTES_PER_SEC = 200 * MiB
+
+def record_throughput(endpoint, num_bytes, seconds, concurrency=None):
+    """Fold one measured s5cmd transfer into the moving averages for `endpoint`."""
+    endpoint_stats.record_throughput(endpoint, num_bytes, seconds,
+                                     streams=concurrency or S5CMD_DEFAULT_CONCURRENCY)
+
+def get_recent_throughput(endpoint, max_age=7*24*3600):
+    """(throughput, per_stream_throughput) in bytes/sec for `endpoint`, or None if unknown/stale."""
+    stats = endpoint_stats.get_endpoint_stats(endpoint, max_age=max_age)
+    if not stats or 'throughput' not in stats:
+        return None
+    return stats['throughput'], stats['per_stream']
+
+def tune_s5cmd_transfer(object_size, endpoint=None, cpu_count=None, part_size=None):
+    """
+    Pick s5cmd numworkers / concurrency / part size (MiB) for downloading one object.
+
+    - small objects (< 16 MiB) are fetched with a single request
+    - otherwise the part size is chosen so each connection gets a few parts (bounded to
+      8-512 MiB), and concurrency scales with the CPU count, capped by the number of parts
+    - when recent transfers to `endpoint` were slow per connection (high latency links),
+      concurrency is doubled; when they were very fast, fewer connections suffice
+
+    An explicit `part_size` (MiB) is kept and only concurrency is fitted to it.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    numworkers = min(S5CMD_DEFAULT_NUMWORKERS, max(8, 4 * cpu_count))
+
+    if object_size is None:
+        return dict(numworkers=numworkers, concurrency=S5CMD_DEFAULT_CONCURRENCY,
+                    part_size=S5CMD_DEFAULT_PART_SIZE_MB)
+    if object_size < SINGLE_PART_THRESHOLD:
+        return dict(numworkers=numworkers, concurrency=1,
+                    part_size=max(MIN_PART_SIZE_MB, math.ceil(object_size / MiB)))
+
+    concurrency = min(MAX_CONCURRENCY, max(4, 2 * cpu_count))
+    recent = get_recent_throughput(endpoint) if endpoint else None
+    if recent is not None:
+        _, per_stream = recent
+        if per_stream < SLOW_STREAM_BYTES_PER_SEC:
+            concurrency = min(MAX_CONCURRENCY, concurrency * 2)
+        elif per_stream > FAST_STREAM_BYTES_PER_SEC:
+            concurrency = max(2, concurrency // 2)
+
+    if part_size is None:
+        part_size = object_size / (concurrency * PARTS_PER_CONNECTION) / MiB
+        part_size = int(min(MAX_PART_SIZE_MB, max(MIN_PART_SIZE_MB, part_size)))
+    num_parts = math.ceil(object_size / (part_size * MiB))
+    concurrency = max(1, min(concurrency, num_parts))
+    return dict(numworkers=numworkers, concurrency=concurrency, part_size=part_size)
+
+def get_transfer_options(s3_config=None, object_size=None, endpoint=None):
+    """
+    s5cmd command-line options for numworkers, concurrency and part size.
+
+    Values come from s3_config ('numworkers', 'concurrency', 'part_size' in MiB); with
+    ``s3_config['auto_tune'] = True`` anything not set explicitly is picked by
+    `tune_s5cmd_transfer` from the object size, CPU count and recent throughput to the
+    endpoint. Unset options are left to s5cmd's defaults.
+
+    Returns:
+        dict with numworkers_option, concurrency_option, part_size_option (str or None),
+        and the resolved `concurrency` (for throughput bookkeeping)
+    """
+    s3_config = s3_config or {}
+    values = {key: s3_config.get(key) for key in ('numworkers', 'concurrency', 'part_size')}
+    if s3_config.get('auto_tune'):
+        tuned = tune_s5cmd_transfer(object_size, endpoint=endpoint, part_size=values['part_size'])
+        values = {key: tuned[key] if value is None else value for key, value in values.items()}
+        logger.info(f"s5cmd transfer options for {object_size} bytes from {endpoint}: {values}")
+    return dict(
+        numworkers_option=f"--numworkers {values['numworkers']}" if values['numworkers'] else None,
+        concurrency_option=f"--concurrency {values['concurrency']}" if values['concurrency'] else None,
+        part_size_option=f"--part-size {values['part_size']}" if values['part_size'] else None,
+        concurrency=values['concurrency'],
+    )
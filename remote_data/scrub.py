@@ -0,0 +1,265 @@
+import os
+import re
+import math
+import time
+import shutil
+import logging
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['scrub_cache', 'verify_file']
+
+MiB = 1024 * 1024
+S3_ETAG_REGEX = re.compile(r'^[0-9a-f]{32}(-(\d+))?$')
+SHA256_PREFIX_REGEX = re.compile(r'^[0-9a-f]{8,64}$')
+# multipart upload part sizes to try for "<md5>-<parts>" ETags (aws cli / boto3: 8MiB,
+# s5cmd: 50MiB, others), after the part size implied by the size and number of parts
+COMMON_PART_SIZES = [8 * MiB, 16 * MiB, 5 * MiB, 50 * MiB, 64 * MiB, 100 * MiB, 128 * MiB,
+                     256 * MiB, 512 * MiB, 1024 * MiB]
+DEFAULT_NICENESS = 10
+
+def _part_sizes(size, num_parts):
+    """Candidate part sizes that split `size` bytes into exactly `num_parts` parts, most likely first."""
+    implied = math.ceil(math.ceil(size / num_parts) / MiB) * MiB
+    candidates = []
+    for part_size in [implied] + COMMON_PART_SIZES:
+        if part_size > 0 and math.ceil(size / part_size) == num_parts and part_size not in candidates:
+            candidates.append(part_size)
+    return candidates
+
+def verify_file(path, etag=None, sha256=None, trust_etag=False):
+    """
+    Check the file at `path` against a sha256 (or a prefix of one) and/or an S3-style
+    ETag (md5, or md5 of part md5s).
+
+    An ETag looks the same whether or not it is a hash of the content (SSE-KMS / SSE-C
+    objects and many http servers use other ETags), so an ETag mismatch only counts as a
+    failure with ``trust_etag=True``, i.e. when this ETag is known to be the content's.
+
+    Returns:
+        (status, detail): status is 'ok' (detail: 'sha256' or 'etag', what was checked),
+        'failed', or 'unverifiable' (nothing to check against, an untrusted ETag that
+        doesn't match, or a multipart ETag whose part size can't be inferred).
+    """
+    from .s3_etag import calculate_s3_etag
+    from .hash_id import compute_sha256
+    if sha256 and SHA256_PREFIX_REGEX.match(sha256):
+        digest = compute_sha256(Path(path))
+        if not digest.startswith(sha256):
+            return 'failed', f"sha256 {digest} does not match {sha256}"
+        return 'ok', 'sha256'
+    etag = etag.strip('"') if etag else None
+    match = S3_ETAG_REGEX.match(etag) if etag else None
+    if not match:
+        return 'unverifiable', "no ETag or sha256 recorded"
+    size = os.path.getsize(path)
+    if match.group(2) is None:
+        part_sizes = [max(size, 1)]
+    else:
+        part_sizes = _part_sizes(size, int(match.group(2)))
+        if not part_sizes:
+            # e.g. 9MiB uploaded as 4 x 2.5MiB parts: none of our candidate sizes fits
+            return 'unverifiable', f"no known part size splits {size} bytes into {match.group(2)} parts (ETag {etag})"
+    local_etags = []
+    for part_size in part_sizes:
+        local_etag = calculate_s3_etag(path, chunk_size=part_size).strip('"')
+        if local_etag == etag:
+            return 'ok', 'etag'
+        local_etags.append(local_etag)
+    if match.group(2) is None and trust_etag:
+        return 'failed', f"ETag {local_etags[0]} does not match {etag}"
+    if match.group(2) is None:
+        return 'unverifiable', f"ETag {local_etags[0]} does not match {etag}, which may not be an md5 of the content"
+    # the upload may have used a part size we didn't try
+    return 'unverifiable', f"no part size reproduces ETag {etag}"
+
+def _init_worker(niceness):
+    if niceness:
+        try:
+            # also lowers the I/O priority under the CFQ / BFQ schedulers
+            os.nice(niceness)
+        except OSError:
+            pass
+
+def _check(path, etag, sha256, trust_etag):
+    start = time.perf_counter()
+    try:
+        status, detail = verify_file(path, etag=etag, sha256=sha256, trust_etag=trust_etag)
+    except FileNotFoundError:
+        status, detail = 'missing', None
+    except OSError as e:
+        status, detail = 'failed', f"{type(e).__name__}: {e}"
+    return path, status, detail, time.perf_counter() - start
+
+def _etag_is_trusted(entry):
+    """
+    An ETag mismatch proves corruption only for an s3 object whose ETag matched the
+    content before (so it is an md5, not an SSE-KMS / SSE-C ETag); never for http entries.
+    """
+    return bool(entry['etag_verified']) and entry['provider'] not in (None, 'http', 'https', 'mnt')
+
+def _quarantine(path, entry, catalog, cache_root, quarantine_dir):
+    """
+    Move a corrupt cache file out of the cache, so that the next access downloads it
+    again, and drop everything that would hand out the same bytes: its catalog entry,
+    its content-store links and its tar index.
+    """
+    from .content_store import get_content_store
+    relpath = os.path.relpath(path, cache_root) if path.startswith(cache_root + os.sep) else path.lstrip(os.sep)
+    dst = os.path.join(quarantine_dir, relpath)
+    if os.path.exists(dst):
+        dst = f"{dst}.{int(time.time())}"
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+
+    content_store = get_content_store(root=os.path.join(cache_root, 'cas'), dedup=True)
+    sizes = {entry['size'], os.path.getsize(path)}
+    for size in sizes:
+        for key in content_store.keys(etag=entry['etag'], size=size, sha256=entry['sha256']):
+            stored = os.path.join(content_store.root, key)
+            try:
+                if os.path.samefile(stored, path):
+                    os.remove(stored)
+            except OSError:
+                continue
+
+    shutil.move(path, dst)
+    index_path = f"{path}.index.json"
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    catalog.remove(path)
+    extracted = catalog.extractions(path)
+    if extracted:
+        logger.warning(f"{path} was extracted to {extracted}; its contents may be corrupt too")
+    logger.warning(f"Quarantined {path} -> {dst}")
+    return dst
+
+def scrub_cache(cache_root=None, num_workers=None, max_mbps=None, quarantine=True, force=False,
+                rebuild=None, niceness=DEFAULT_NICENESS, catalog=None):
+    """
+    Re-check cached files against their recorded ETag or sha256 (from the cache catalog)
+    with `calculate_s3_etag` / `compute_sha256` in a process pool.
+
+    The scrub is incremental: a file that passed a check and whose size and mtime have
+    not changed since is skipped (unless `force`). Reads are throttled to `max_mbps`
+    (files are handed to the pool no faster than that, so a single large file can still
+    burst) and the workers run at a lower CPU / I/O priority. A file that fails is moved
+    to ``<cache_root>/quarantine/`` (and unlinked from the content store and catalog),
+    so the next `download_data_file` fetches it again. An ETag mismatch alone only fails
+    an s3 entry whose ETag matched its content before (`verify_file`'s ``trust_etag``):
+    otherwise it is reported as unverifiable and the file is left alone.
+
+    Args:
+        cache_root: Cache to scrub (default: `get_cache_root()`).
+        num_workers: Processes hashing files (default: half the CPUs).
+        max_mbps: Read budget in MB/s across all workers (default: unlimited).
+        quarantine: Move failures out of the cache (False: only report them).
+        force: Re-check files that passed before.
+        rebuild: Rebuild the catalog from disk first (default: only if it is empty).
+        niceness: Added to the workers' nice value.
+        catalog: `CacheCatalog` to use (default: `get_catalog()`, even if disabled).
+
+    Returns:
+        dict with counts (checked, ok, failed, unverifiable, missing, skipped, bytes)
+        and the list of failures (path, detail, quarantined_to).
+    """
+    from .cache_dir import get_cache_root
+    from .catalog import get_catalog
+    from . import metrics
+    if cache_root is None:
+        cache_root = get_cache_root()
+    cache_root = os.path.abspath(cache_root)
+    if catalog is None:
+        catalog = get_catalog(enabled=True)
+    if rebuild or (rebuild is None and len(catalog) == 0):
+        catalog.rebuild(cache_root)
+
+    # hardlinked entries (content-store dedup across uris) share one inode: check it once,
+    # against any hash recorded for it, and apply the result to every path
+    groups = {}
+    for entry in catalog.entries(under=cache_root):
+        try:
+            st = os.stat(entry['path'])
+        except FileNotFoundError:
+            catalog.remove(entry['path'])
+            continue
+        group = groups.setdefault((st.st_dev, st.st_ino), dict(entries=[], size=st.st_size, etag=None,
+                                                               sha256=None, verified=False, trust_etag=False))
+        group['entries'].append(entry)
+        if _etag_is_trusted(entry) and not group['trust_etag']:
+            group['etag'], group['trust_etag'] = entry['etag'], True
+        group['etag'] = group['etag'] or entry['etag']
+        group['sha256'] = group['sha256'] or entry['sha256']
+        if entry['verified'] is not None and st.st_size == entry['size'] and st.st_mtime == entry['mtime']:
+            group['verified'] = True
+    skipped = 0
+    entries = {}
+    for group in groups.values():
+        if group['verified'] and not force:
+            skipped += len(group['entries'])
+        else:
+            entries[group['entries'][0]['path']] = group
+
+    num_workers = num_workers or max(1, (os.cpu_count() or 2) // 2)
+    max_in_flight = 2 * num_workers
+    bytes_per_sec = max_mbps * 1e6 if max_mbps else None
+    counts = dict(checked=0, ok=0, failed=0, unverifiable=0, missing=0, skipped=skipped, bytes=0)
+    failures = []
+    quarantine_dir = os.path.join(cache_root, 'quarantine')
+    logger.info(f"Scrubbing {len(entries)} files in {cache_root} ({skipped} unchanged since their last check)")
+
+    def handle(result):
+        path, status, detail, seconds = result
+        group = entries[path]
+        paths = [entry['path'] for entry in group['entries']]
+        counts['checked'] += len(paths)
+        counts[status] += len(paths)
+        if status == 'missing':
+            for path in paths:
+                catalog.remove(path)
+            return
+        counts['bytes'] += group['size']
+        metrics.verify_seconds.observe(seconds, algorithm='scrub')
+        if status == 'ok':
+            for path in paths:
+                catalog.mark_verified(path, etag_verified=detail == 'etag')
+        elif status == 'unverifiable':
+            logger.debug(f"Can't verify {path}: {detail}")
+        else:
+            logger.error(f"Integrity check failed for {paths}: {detail}")
+            for entry in group['entries']:
+                quarantined_to = None
+                if quarantine:
+                    quarantined_to = _quarantine(entry['path'], dict(entry, etag=group['etag'], sha256=group['sha256']),
+                                                 catalog, cache_root, quarantine_dir)
+                failures.append(dict(path=entry['path'], detail=detail, quarantined_to=quarantined_to))
+
+    start = time.monotonic()
+    submitted_bytes = 0
+    with ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(niceness,)) as pool:
+        pending = set()
+        for path, group in entries.items():
+            while len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    handle(future.result())
+            if bytes_per_sec:
+                delay = submitted_bytes / bytes_per_sec - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            pending.add(pool.submit(_check, path, group['etag'], group['sha256'], group['trust_etag']))
+            submitted_bytes += group['size']
+        for future in pending:
+            handle(future.result())
+
+    logger.info(f"Scrubbed {cache_root}: {counts}")
+    return dict(counts, failures=failures)
+
+def main():
+    import fire
+    fire.Fire(scrub_cache)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+import os
+import mmap
+import time
+import uuid
+import fcntl
+import shutil
+import hashlib
+import logging
+import tempfile
+
+from urllib.parse import urlparse, urlunparse
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['ShmObjectStore', 'fetch_small_file']
+
+_DEFAULT_SHM_ROOT = "/dev/shm"
+
+def _normalize_key_uri(uri):
+    """Normalize a uri for use in a store key (drop presigned-url query strings)."""
+    parsed = urlparse(uri)
+    if parsed.scheme in ['http', 'https']:
+        if 'X-Amz-Signature' in parsed.query or 'Signature=' in parsed.query:
+            parsed = parsed._replace(query='')
+        return urlunparse(parsed)
+    from visionlab.auth import check_is_s3_uri, normalize_uri
+    if check_is_s3_uri(uri):
+        return normalize_uri(uri)
+    return uri
+
+def _get_http_etag_and_size(url, s3_config=None):
+    """
+    (etag, size) of an http(s) object. The ETag falls back to size + Last-Modified, and is
+    None if it has neither; the size is None if the server doesn't say.
+    """
+    import requests
+    from visionlab.remote_data.presign import get_signed_url
+    from visionlab.remote_data.range_reader import _is_empty_object_response
+    signed_url = get_signed_url(url, s3_config=s3_config)
+    # 1-byte ranged GET rather than HEAD, which presigned GET urls don't allow
+    response = requests.get(signed_url, headers={'Range': 'bytes=0-0'}, stream=True)
+    response.close()
+    if _is_empty_object_response(response.status_code, response.headers):
+        size = 0
+    else:
+        response.raise_for_status()
+        total = (response.headers.get('Content-Range') or '').rpartition('/')[2]
+        size = int(total) if total.isdigit() else None
+    etag = response.headers.get('ETag')
+    if etag:
+        return etag.strip('"'), size
+    if not response.headers.get('Last-Modified'):
+        # nothing that changes with the content: the object can't be keyed by version
+        return None, size
+    return f"{response.headers.get('Content-Range')}|{response.headers.get('Last-Modified')}", size
+
+def _matches(file_path, etag, size):
+    """
+    Whether a cached file holds the object version with `etag` (and `size`, if known). Only
+    S3-style md5 ETags can be checked against the content; any other ETag can't be, so the
+    file is not trusted.
+    """
+    from visionlab.remote_data.content_store import S3_ETAG_REGEX
+    from visionlab.remote_data.s3_etag import calculate_s3_etag
+    if size is not None and os.path.getsize(file_path) != size:
+        return False
+    if not S3_ETAG_REGEX.match(etag):
+        return False
+    return calculate_s3_etag(file_path).strip('"') == etag
+
+class ShmObjectStore:
+    """
+    Node-local store of small objects in shared memory (``/dev/shm``).
+
+    Objects are keyed by normalized uri and ETag, so a changed remote object is never
+    served stale. Each object is a file under `root`; `get` memory-maps it read-only, so
+    every process on the node reads the same physical pages (no per-worker copy, and no
+    metadata traffic to the shared filesystem after the first fetch).
+
+    Objects without a known ETag are never stored. `remember` / `recall` keep the ETag a
+    uri was last validated against, so callers can skip revalidation for a while.
+
+    The store is capped at `max_bytes`; when a `put` pushes it over the cap, the least
+    recently used objects are evicted (last use is tracked through the file mtime, which
+    `get` refreshes). Eviction is safe while other processes still have an object mapped.
+
+    Args:
+        root: Store directory (default ``/dev/shm/visionlab-remote-data-<uid>``).
+        max_bytes: Total size cap for the store.
+        max_object_bytes: Objects larger than this are not stored.
+    """
+    def __init__(self, root=None, max_bytes=1024**3, max_object_bytes=16*1024**2):
+        if root is None:
+            root = os.path.join(_DEFAULT_SHM_ROOT, f"visionlab-remote-data-{os.getuid()}")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        os.makedirs(self.root, mode=0o700, exist_ok=True)
+        self._lock_filepath = os.path.join(self.root, ".lock")
+
+    def key(self, uri, etag):
+        return hashlib.sha256(f"{_normalize_key_uri(uri)}|{etag}".encode('utf-8')).hexdigest()[:40]
+
+    def path(self, uri, etag):
+        return os.path.join(self.root, self.key(uri, etag))
+
+    def _validated_path(self, uri):
+        key = hashlib.sha256(_normalize_key_uri(uri).encode('utf-8')).hexdigest()[:40]
+        return os.path.join(self.root, f".validated-{key}")
+
+    def remember(self, uri, etag):
+        """Record that `uri` was just validated to have `etag` (see `recall`)."""
+        path = self._validated_path(uri)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}"
+        with open(tmp_path, 'w') as f:
+            f.write(etag)
+        os.replace(tmp_path, path)
+
+    def recall(self, uri, ttl):
+        """The ETag `uri` was validated against less than `ttl` seconds ago, or None."""
+        path = self._validated_path(uri)
+        try:
+            if time.time() - os.path.getmtime(path) >= ttl:
+                return None
+            with open(path) as f:
+                return f.read() or None
+        except FileNotFoundError:
+            return None
+
+    def get(self, uri, etag):
+        """Zero-copy read-only memoryview of the stored object, or None if it isn't stored."""
+        if etag is None:
+            return None
+        path = self.path(uri, etag)
+        try:
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)) if size else memoryview(b'')
+        except FileNotFoundError:
+            return None
+        try:
+            # mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return view
+
+    def put(self, uri, etag, data=None, file_path=None):
+        """
+        Store an object given as bytes (`data`) or a local file (`file_path`).
+
+        Returns the stored object as a memoryview, or None if it exceeds `max_object_bytes`
+        or its ETag is unknown (None).
+        """
+        if (data is None) == (file_path is None):
+            raise ValueError("Expected exactly one of `data` or `file_path`")
+        if etag is None:
+            return None
+        size = len(data) if data is not None else os.path.getsize(file_path)
+        if size > self.max_object_bytes:
+            logger.info(f"Not storing {uri} in shm: {size} bytes > max_object_bytes={self.max_object_bytes}")
+            return None
+
+        path = self.path(uri, etag)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    if data is not None:
+                        f.write(data)
+                    else:
+                        with open(file_path, 'rb') as src:
+                            while True:
+                                chunk = src.read(1024 * 1024)
+                                if not chunk:
+                                    break
+                                f.write(chunk)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self.evict(keep=os.path.basename(path))
+        return self.get(uri, etag)
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.startswith('.') or entry.name.endswith('.part'):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.name))
+        return entries
+
+    def usage(self):
+        """(num_objects, total_bytes) currently in the store."""
+        entries = self._entries()
+        return len(entries), sum(size for _, size, _ in entries)
+
+    def evict(self, keep=None):
+        """Remove least recently used objects until the store fits in `max_bytes`."""
+        with open(self._lock_filepath, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                if name == keep:
+                    continue
+                try:
+                    os.remove(os.path.join(self.root, name))
+                    total -= size
+                    logger.debug(f"Evicted {name} ({size} bytes) from {self.root}")
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        names = [name for _, _, name in self._entries()]
+        names += [name for name in os.listdir(self.root) if name.startswith('.validated-')]
+        for name in names:
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+
+def fetch_small_file(uri, store=None, etag=None, s3_config=None, ttl=0, **download_kwargs):
+    """
+    Fetch a small remote object through the node-local shared-memory store.
+
+    On a store hit the object is served straight from ``/dev/shm`` (zero-copy, no cache
+    filesystem access). On a miss it is fetched with `download_data_file` and placed in
+    the store for every other process on the node; if the cache file doesn't match the
+    remote ETag and size (e.g. it predates a change of the object, or its ETag can't be
+    checked against the content), a fresh copy is downloaded for the store instead.
+
+    Unless `etag` is given, the remote ETag is looked up first, so a changed object is
+    never served stale. That costs one small request per call (a HEAD for s3, a 1-byte
+    ranged GET for http); with `ttl`, a uri validated less than `ttl` seconds ago (by any
+    process on the node) is served without it. An object whose ETag can't be determined
+    bypasses the store (it is mapped from the cache file instead).
+
+    Args:
+        uri: Remote uri (s3-provider uri or http(s) url).
+        store: ShmObjectStore to use (default: a store with default settings).
+        etag: ETag of the object, if already known (saves one request).
+        s3_config: Credentials/endpoint overrides.
+        ttl: Seconds during which a validated ETag is reused without a request (default 0:
+            revalidate on every call).
+        **download_kwargs: Passed through to `download_data_file`.
+
+    Returns:
+        memoryview (read-only) of the object's bytes
+    """
+    from visionlab.auth import check_is_s3_uri
+    store = ShmObjectStore() if store is None else store
+
+    if etag is None and ttl:
+        etag = store.recall(uri, ttl)
+        view = store.get(uri, etag)
+        if view is not None:
+            return view
+        etag = None
+    size = None
+    if etag is None:
+        if check_is_s3_uri(uri):
+            from visionlab.remote_data.s3_etag import get_etag_and_size_from_s3_uri
+            etag, size = get_etag_and_size_from_s3_uri(uri, s3_config=s3_config)
+        else:
+            etag, size = _get_http_etag_and_size(uri, s3_config=s3_config)
+        if etag is not None and ttl:
+            store.remember(uri, etag)
+
+    view = store.get(uri, etag)
+    if view is not None:
+        return view
+
+    from visionlab.remote_data.download import download_data_file
+    download_kwargs.setdefault('progress', False)
+    cached_file, _ = download_data_file(uri, s3_config=s3_config, **download_kwargs)
+    if etag is None or os.path.getsize(cached_file) > store.max_object_bytes \
+            or (size is not None and size > store.max_object_bytes):
+        view = None
+    elif _matches(cached_file, etag, size):
+        view = store.put(uri, etag, file_path=cached_file)
+    else:
+        # the cache file may be an older version: store a fresh download (kept in the
+        # store's tmpfs, and out of the cache, which other processes may be reading)
+        logger.info(f"Cache file {cached_file} doesn't match ETag {etag} of {uri}; fetching a fresh copy")
+        fresh_dir = tempfile.mkdtemp(prefix='.fresh-', dir=store.root)
+        try:
+            fresh_file, _ = download_data_file(uri, s3_config=s3_config,
+                                               **dict(download_kwargs, cache_dir=fresh_dir, use_broker=False))
+            if size is None or os.path.getsize(fresh_file) == size:
+                view = store.put(uri, etag, file_path=fresh_file)
+            else:
+                # changed again since the probe: serve these bytes, but don't store them
+                with open(fresh_file, 'rb') as f:
+                    view = memoryview(f.read())
+        finally:
+            shutil.rmtree(fresh_dir, ignore_errors=True)
+    if view is None:
+        # too large for the store; map the cached file instead
+        from visionlab.remote_data.download import mmap_file
+        view = mmap_file(cached_file)
+    return view
@@ -0,0 +1,228 @@
+import os
+import json
+import uuid
+import fcntl
+import time
+import socket
+import logging
+import threading
+
+from contextlib import contextmanager
+
+from .progress import progress_bar
+from .metrics import lock_wait_seconds
+from .tracing import span
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['single_flight_download', 'track_fetch']
+
+# how often a waiting process refreshes its view of the leader's progress
+_PROGRESS_REFRESH_SECONDS = 0.5
+
+_local = threading.local()
+
+@contextmanager
+def track_fetch():
+    """
+    Record what `single_flight_download` did for downloads made in this block (this thread).
+
+    Yields a dict with
+        downloaded: files this process downloaded
+        waited: files another process was already downloading (we waited for it)
+        deduplicated: files linked from the content store instead of downloaded
+        bytes: bytes this process downloaded
+    All counts stay 0 when everything was already in the cache.
+
+    Example:
+        with track_fetch() as record:
+            download_data_file(uri)
+        cache_hit = record['downloaded'] == 0 and record['waited'] == 0
+    """
+    record = dict(downloaded=0, waited=0, deduplicated=0, bytes=0)
+    parent = getattr(_local, 'record', None)
+    _local.record = record
+    try:
+        yield record
+    finally:
+        _local.record = parent
+        if parent is not None:
+            for key, value in record.items():
+                parent[key] += value
+
+def _record(key, value=1):
+    record = getattr(_local, 'record', None)
+    if record is not None:
+        record[key] += value
+
+def _read_state(fd):
+    """Read the leader's state ({pid, host, tmp_filepath, total_bytes}) from the lock file."""
+    try:
+        data = os.pread(fd, 4096, 0)
+        return json.loads(data.decode('utf-8')) if data else {}
+    except (OSError, ValueError):
+        # empty, or caught mid-write; the caller just retries on its next refresh
+        return {}
+
+def _write_state(fd, state):
+    data = json.dumps(state).encode('utf-8')
+    os.ftruncate(fd, 0)
+    os.pwrite(fd, data, 0)
+
+def _clear_state(fd):
+    try:
+        os.ftruncate(fd, 0)
+    except OSError:
+        pass
+
+def _wait_for_leader(fd, lock_filepath, lock_timeout, show_progress):
+    """
+    Block until the exclusive lock on `fd` is acquired, or raise TimeoutError.
+
+    The blocking flock runs in a helper thread so the kernel wakes us the moment the
+    leader releases the lock (no polling for completion). While waiting, the main thread
+    optionally mirrors the leader's progress by watching its temp file grow.
+
+    If this raises (timeout, KeyboardInterrupt, ...), `fd` no longer belongs to the
+    caller: the helper thread, which may still be blocked in flock on it, closes it once
+    it gets the lock (closing it here could let the number be reused and locked by mistake).
+    """
+    acquired = threading.Event()
+    mutex = threading.Lock()
+    abandoned = [False]
+
+    def _block():
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        with mutex:
+            if abandoned[0]:
+                # we gave up waiting; hand the lock straight back
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+            else:
+                acquired.set()
+
+    threading.Thread(target=_block, name=f"single-flight-wait:{lock_filepath}", daemon=True).start()
+
+    state = _read_state(fd)
+    logger.info(f"Waiting on pid {state.get('pid')}@{state.get('host')} downloading {state.get('tmp_filepath')}")
+    refresh = _PROGRESS_REFRESH_SECONDS if show_progress else lock_timeout
+    waited = 0.0
+    try:
+        with progress_bar(total=state.get('total_bytes'), disable=not show_progress,
+                          unit="B", unit_scale=True, unit_divisor=1024,
+                          desc=f"waiting for pid {state.get('pid')}") as pbar:
+            while not acquired.wait(timeout=min(refresh, max(lock_timeout - waited, 0))):
+                waited += refresh
+                state = _read_state(fd) or state
+                try:
+                    pbar.update(os.path.getsize(state['tmp_filepath']) - pbar.n)
+                except (KeyError, TypeError, OSError):
+                    pass
+                if waited >= lock_timeout:
+                    if acquired.is_set():
+                        break
+                    msg = f"Timeout occurred while waiting for lock on {lock_filepath}. Another process might be holding it."
+                    logger.error(msg)
+                    raise TimeoutError(msg)
+    except BaseException:
+        with mutex:
+            if not acquired.is_set():
+                # the helper thread owns fd from here on
+                abandoned[0] = True
+                raise
+        # the lock arrived meanwhile: hand it straight back
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+        raise
+
+def single_flight_download(local_filepath, download_fn, lock_timeout=600, show_progress=True,
+                           total_bytes=None):
+    """
+    Produce `local_filepath` at most once across concurrent processes (and threads).
+
+    The first caller (the leader) takes an exclusive flock on ``<local_filepath>.lock``,
+    records its temp file in the lock file, calls ``download_fn(tmp_filepath)`` and then
+    atomically renames the temp file into place, so `local_filepath` either doesn't exist
+    or is complete. Other callers block on the same lock, optionally showing the leader's
+    progress, and return as soon as the leader is done. If the leader fails (or dies), the
+    next waiter takes over the download.
+
+    The lock file is intentionally never deleted: removing it while others are waiting on
+    it would let a later process lock a fresh inode and download concurrently.
+
+    Args:
+        local_filepath: The destination local file path.
+        download_fn: Callable that downloads the object to the path it is given.
+        lock_timeout: Maximum time in seconds to wait for another process' download.
+        show_progress: If True, display the leader's progress while waiting.
+        total_bytes: Size of the object if known (used for progress display only).
+
+    Returns:
+        local_filepath
+    """
+    if os.path.isfile(local_filepath):
+        return local_filepath
+
+    os.makedirs(os.path.dirname(local_filepath) or '.', exist_ok=True)
+    lock_filepath = local_filepath + ".lock"
+    fd = os.open(lock_filepath, os.O_RDWR | os.O_CREAT, 0o666)
+
+    waited = False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        waited = True
+        wait_start = time.perf_counter()
+        try:
+            with span("lock_wait", file=local_filepath):
+                _wait_for_leader(fd, lock_filepath, lock_timeout, show_progress)
+        except TimeoutError:
+            # (_wait_for_leader has taken care of fd on any error)
+            lock_wait_seconds.observe(time.perf_counter() - wait_start, result='timeout')
+            raise
+        lock_wait_seconds.observe(time.perf_counter() - wait_start, result='acquired')
+
+    # we hold the lock from here on
+    tmp_filepath = None
+    try:
+        if os.path.isfile(local_filepath):
+            logger.info(f"File {local_filepath} was downloaded by another process.")
+            if waited:
+                # (if the lock was free, the other process finished before we got here: a plain hit)
+                _record('waited')
+            return local_filepath
+
+        # a previous leader may have died mid-download; remove its leftovers
+        stale_tmp = _read_state(fd).get('tmp_filepath')
+        if stale_tmp and os.path.exists(stale_tmp):
+            logger.warning(f"Removing incomplete download from a previous attempt: {stale_tmp}")
+            os.remove(stale_tmp)
+
+        tmp_filepath = f"{local_filepath}.{socket.gethostname()}.{os.getpid()}.{uuid.uuid4().hex[:8]}.part"
+        _write_state(fd, dict(pid=os.getpid(), host=socket.gethostname(),
+                              tmp_filepath=tmp_filepath, total_bytes=total_bytes))
+
+        logger.info(f"Downloading {local_filepath} via {tmp_filepath}")
+        with span("transfer", file=local_filepath) as transfer_span:
+            download_fn(tmp_filepath)
+            if not os.path.isfile(tmp_filepath):
+                raise RuntimeError(f"Download did not produce a file at {tmp_filepath}")
+            num_bytes = os.path.getsize(tmp_filepath)
+            transfer_span.set(bytes=num_bytes)
+        os.replace(tmp_filepath, local_filepath)
+        _record('downloaded')
+        _record('bytes', num_bytes)
+        logger.info(f"Download complete: {local_filepath}")
+        return local_filepath
+    except BaseException:
+        if tmp_filepath is not None and os.path.exists(tmp_filepath):
+            logger.warning(f"Removing incomplete file: {tmp_filepath}")
+            try:
+                os.remove(tmp_filepath)
+            except OSError as rm_err:
+                logger.error(f"Could not remove incomplete file {tmp_filepath}: {rm_err}")
+        raise
+    finally:
+        _clear_state(fd)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
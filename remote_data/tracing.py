@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import atexit
+import itertools
+import threading
+
+from contextlib import contextmanager
+
+__all__ = [
+    'enable_tracing',
+    'disable_tracing',
+    'is_tracing_enabled',
+    'span',
+    'tracing',
+    'get_trace_events',
+    'clear_trace_events',
+    'export_chrome_trace',
+    'export_trace_jsonl',
+]
+
+# set to a file path (.json for Chrome trace format, .jsonl for one span per line) to
+# trace the whole process and write the trace at exit; "{pid}" in the path is replaced
+# with the process id so concurrent processes don't overwrite each other
+TRACE_ENV_VAR = 'VISIONLAB_REMOTE_DATA_TRACE'
+
+_enabled = False
+_events = []
+_events_lock = threading.Lock()
+_local = threading.local()
+_span_ids = itertools.count(1)
+
+class Span:
+    """A timed phase; set attributes (e.g. byte counts) with ``span.set(bytes=n)``."""
+    __slots__ = ('name', 'attrs', 'id', 'parent_id', 'start', 'end')
+
+    def __init__(self, name, attrs, parent_id):
+        self.name = name
+        self.attrs = attrs
+        self.id = next(_span_ids)
+        self.parent_id = parent_id
+        self.start = None
+        self.end = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+def enable_tracing():
+    global _enabled
+    _enabled = True
+
+def disable_tracing():
+    global _enabled
+    _enabled = False
+
+def is_tracing_enabled():
+    return _enabled
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Record a timed, nested span while tracing is enabled (a cheap no-op otherwise).
+
+    Example:
+        with span("etag_head", uri=uri) as s:
+            etag = get_etag_from_s3_uri(uri)
+            s.set(etag=etag)
+    """
+    if not _enabled:
+        yield _NULL_SPAN
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    current = Span(name, attrs, stack[-1].id if stack else None)
+    stack.append(current)
+    current.start = time.perf_counter_ns()
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end = time.perf_counter_ns()
+        stack.pop()
+        event = dict(name=current.name, id=current.id, parent_id=current.parent_id,
+                     start_us=current.start / 1000, duration_us=(current.end - current.start) / 1000,
+                     pid=os.getpid(), tid=threading.get_ident(), attrs=current.attrs)
+        with _events_lock:
+            _events.append(event)
+
+@contextmanager
+def tracing(path=None):
+    """Enable tracing for the block; if `path` is given, export the trace there afterwards."""
+    was_enabled = _enabled
+    enable_tracing()
+    try:
+        yield
+    finally:
+        if not was_enabled:
+            disable_tracing()
+        if path is not None:
+            _export(path)
+
+def get_trace_events():
+    """Recorded spans (in completion order) as plain dicts."""
+    with _events_lock:
+        return list(_events)
+
+def clear_trace_events():
+    with _events_lock:
+        _events.clear()
+
+def _json_safe(attrs):
+    return {k: v if isinstance(v, (str, int, float, bool, type(None))) else str(v) for k, v in attrs.items()}
+
+def export_chrome_trace(path, clear=False):
+    """
+    Write recorded spans in Chrome trace-event format (load in Perfetto or chrome://tracing).
+
+    Each span becomes a complete ('X') event; nesting is shown per thread.
+    """
+    events = get_trace_events()
+    trace_events = [dict(name=e['name'], cat='remote_data', ph='X', ts=e['start_us'], dur=e['duration_us'],
+                         pid=e['pid'], tid=e['tid'], args=_json_safe(e['attrs']))
+                    for e in sorted(events, key=lambda e: e['start_us'])]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(dict(traceEvents=trace_events, displayTimeUnit='ms'), f)
+    if clear:
+        clear_trace_events()
+    return path
+
+def export_trace_jsonl(path, clear=False):
+    """Append recorded spans to `path`, one json object per line."""
+    events = get_trace_events()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as f:
+        for event in events:
+            f.write(json.dumps(dict(event, attrs=_json_safe(event['attrs']))) + '\n')
+    if clear:
+        clear_trace_events()
+    return path
+
+def _export(path):
+    if path.endswith('.jsonl'):
+        return export_trace_jsonl(path, clear=True)
+    return export_chrome_trace(path, clear=True)
+
+def _export_from_env():
+    _export(os.path.expanduser(os.getenv(TRACE_ENV_VAR)).replace('{pid}', str(os.getpid())))
+
+if os.getenv(TRACE_ENV_VAR):
+    enable_tracing()
+    atexit.register(_export_from_env)
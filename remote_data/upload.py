@@ -0,0 +1,244 @@
+import os
+import math
+import time
+import shutil
+import hashlib
+import logging
+
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from visionlab.remote_data import metrics
+from visionlab.remote_data.hash_id import hashed_file_path, split_name
+from visionlab.remote_data.progress import progress_bar
+from visionlab.remote_data.tracing import span
+
+logger = logging.getLogger(__name__) # Use module name for clarity
+
+__all__ = ['upload_data_file', 'publish']
+
+MiB = 1024 * 1024
+
+# calculate_s3_etag's default chunk size (and boto3's default part size)
+DEFAULT_PART_SIZE_MB = 8
+# S3 rejects multipart uploads with more parts than this
+MAX_PARTS = 10000
+# boto3 TransferConfig default
+DEFAULT_BOTO3_CONCURRENCY = 10
+
+HASH_READ_SIZE = 1 * MiB
+
+def _resolve_part_size(s3_config, size):
+    """Part size in MiB: s3_config['part_size'], auto-tuned, or 8 MiB; raised to stay under 10000 parts."""
+    part_size = s3_config.get('part_size')
+    if part_size is None and s3_config.get('auto_tune'):
+        from visionlab.remote_data.s5cmd_python.s5cmd_tuning import tune_s5cmd_transfer
+        part_size = tune_s5cmd_transfer(size)['part_size']
+    part_size = part_size or DEFAULT_PART_SIZE_MB
+    return max(part_size, math.ceil(size / MAX_PARTS / MiB))
+
+def _hash_file(file_path, part_size):
+    """
+    Read the file once, computing its sha256 and the S3 ETag it gets when uploaded in
+    `part_size`-byte parts (identical to ``calculate_s3_etag(file_path, chunk_size=part_size)``,
+    without the quotes that function adds for single-part files).
+    """
+    sha256 = hashlib.sha256()
+    part_md5s = []
+    part_md5, part_filled = hashlib.md5(), 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_READ_SIZE), b''):
+            sha256.update(chunk)
+            view = memoryview(chunk)
+            while view:
+                take = min(len(view), part_size - part_filled)
+                part_md5.update(view[:take])
+                part_filled += take
+                view = view[take:]
+                if part_filled == part_size:
+                    part_md5s.append(part_md5)
+                    part_md5, part_filled = hashlib.md5(), 0
+    if part_filled:
+        part_md5s.append(part_md5)
+
+    if len(part_md5s) <= 1:
+        etag = (part_md5s[0] if part_md5s else hashlib.md5()).hexdigest()
+    else:
+        etag = hashlib.md5(b''.join(m.digest() for m in part_md5s)).hexdigest() + f"-{len(part_md5s)}"
+    return sha256.hexdigest(), etag
+
+def _default_backend():
+    return 's5cmd' if shutil.which('s5cmd') else 'boto3'
+
+def _upload_s5cmd(file_path, uri, s3_config, part_size, show_progress, display):
+    from visionlab.auth import normalize_uri
+    from visionlab.remote_data.s5cmd_python import s5cmd_cp, get_s5cmd_options_for_uri
+    from visionlab.remote_data.s5cmd_python.s5cmd_tuning import get_transfer_options
+
+    # writes are always signed, even into a public bucket, so don't ask whether it is public
+    s5cmd_options = get_s5cmd_options_for_uri(uri,
+                                              profile=s3_config.get('profile'),
+                                              endpoint_url=s3_config.get('endpoint_url'),
+                                              region=s3_config.get('region'),
+                                              check_public=False)
+    s5cmd_options['show_progress_option'] = '--show-progress' if show_progress else None
+    transfer_options = get_transfer_options(dict(s3_config, part_size=part_size),
+                                            object_size=os.path.getsize(file_path))
+    transfer_options.pop('concurrency')
+    s5cmd_options.update(transfer_options)
+    s5cmd_cp(str(file_path), normalize_uri(uri), s5cmd_options, display=display if show_progress else 'quiet')
+
+def _upload_boto3(file_path, uri, s3_config, part_size, show_progress):
+    from boto3.s3.transfer import TransferConfig
+    from visionlab.auth import create_s3_client, parse_uri
+
+    _, bucket_name, object_key, _ = parse_uri(uri)
+    s3_client = create_s3_client(uri, s3_config=s3_config)
+    part_bytes = part_size * MiB
+    config = TransferConfig(
+        # boto3 goes multipart at size >= threshold; calculate_s3_etag only above one part
+        multipart_threshold=part_bytes + 1,
+        multipart_chunksize=part_bytes,
+        max_concurrency=s3_config.get('concurrency') or DEFAULT_BOTO3_CONCURRENCY,
+        use_threads=True,
+    )
+    pbar = progress_bar(total=os.path.getsize(file_path), unit="B", unit_scale=True, unit_divisor=1024,
+                        desc=os.path.basename(file_path), disable=not show_progress)
+    try:
+        s3_client.upload_file(str(file_path), bucket_name, object_key, Config=config, Callback=pbar.update)
+    finally:
+        pbar.close()
+
+def upload_data_file(file_path, uri, s3_config=None, backend=None, hash_rename=False, hash_length=8,
+                     verify=True, show_progress=True, display=None):
+    """
+    Upload a local file to an s3-like uri with concurrent multipart parts.
+
+    The file is read once to compute both its sha256 (for `hash_rename`) and the S3 ETag
+    the upload will produce, then uploaded in `part_size` parts, and finally the remote
+    ETag is checked against the local one.
+
+    Args:
+        file_path: Local file to upload.
+        uri: Destination (e.g. s3://bucket/key, wasabi://bucket/key). If it ends with '/',
+            the (possibly renamed) file name is appended.
+        s3_config: profile, endpoint_url, region, plus the transfer settings used for
+            downloads: part_size (MiB, default 8), concurrency, numworkers, auto_tune.
+        backend: 's5cmd' or 'boto3' (in-process); default s5cmd if it is on PATH.
+        hash_rename: If True, rename the local file to `{stem}-{sha256[:hash_length]}{ext}`
+            before uploading (skipped if it already has that name).
+        hash_length: Number of sha256 hex characters used by `hash_rename`.
+        verify: If True, compare the remote ETag (and size) with the local one.
+        show_progress: If True, show upload progress.
+        display: Progress display for the s5cmd backend (see `s5cmd_cp`).
+
+    Returns:
+        dict with uri, file_path, size, sha256 and etag.
+    """
+    from visionlab.auth import parse_uri
+    from visionlab.remote_data.s3_etag import get_etag_and_size_from_s3_uri
+
+    s3_config = s3_config or {}
+    backend = backend or _default_backend()
+    if backend not in ('s5cmd', 'boto3'):
+        raise ValueError(f"Unsupported upload backend `{backend}`. Expected 's5cmd' or 'boto3'.")
+
+    path = Path(file_path)
+    if not path.is_file():
+        raise ValueError(f"'{file_path}' is not a valid file.")
+    size = path.stat().st_size
+    part_size = _resolve_part_size(s3_config, size)
+
+    with span("upload_data_file", file=str(path), uri=uri) as call_span:
+        hash_start = time.perf_counter()
+        with span("hash", file=str(path), bytes=size):
+            sha256, etag = _hash_file(path, part_size * MiB)
+        hash_seconds = time.perf_counter() - hash_start
+
+        if hash_rename and not split_name(path)[0].endswith(f"-{sha256[:hash_length]}"):
+            new_path = hashed_file_path(path, sha256, hash_length=hash_length)
+            path.rename(new_path)
+            logger.info(f"Renamed file: {path} -> {new_path}")
+            path = new_path
+
+        if uri.endswith('/'):
+            uri = uri + path.name
+        logger.info(f"Uploading {path} to {uri} ({backend}, {part_size} MiB parts, etag {etag})")
+
+        provider = parse_uri(uri)[0]
+        start = time.perf_counter()
+        with span("transfer", backend=backend, bytes=size):
+            if backend == 's5cmd':
+                _upload_s5cmd(path, uri, s3_config, part_size, show_progress, display)
+            else:
+                _upload_boto3(path, uri, s3_config, part_size, show_progress)
+        metrics.upload_seconds.observe(time.perf_counter() - start, backend=backend, provider=provider)
+        metrics.bytes_uploaded.inc(size, backend=backend, provider=provider)
+
+        if verify:
+            verify_start = time.perf_counter()
+            with span("verify_etag", uri=uri):
+                remote_etag, remote_size = get_etag_and_size_from_s3_uri(uri, s3_config=s3_config)
+            # the local ETag was computed up front (in the same pass as the sha256)
+            metrics.verify_seconds.observe(hash_seconds + time.perf_counter() - verify_start, algorithm='s3_etag')
+            if remote_etag != etag or (remote_size is not None and remote_size != size):
+                msg = (f'Remote File ETag {remote_etag} ({remote_size} bytes) does not match Local File '
+                       f'ETag {etag} ({size} bytes) for {uri}; note that server-side encryption (SSE-KMS) '
+                       'also changes ETags')
+                logger.error(msg)
+                raise ValueError(msg)
+        call_span.set(uri=uri, etag=etag)
+
+    return dict(uri=uri, file_path=str(path), size=size, sha256=sha256, etag=etag)
+
+def publish(path, remote_prefix, s3_config=None, backend=None, hash_rename=True, hash_length=8,
+            verify=True, max_workers=4, show_progress=True):
+    """
+    Hash, rename and upload a file or a whole directory.
+
+    A file is uploaded to `remote_prefix` (a full uri, or a prefix ending with '/').
+    For a directory, every file below it is uploaded to `remote_prefix/<relative path>`
+    by a pool of `max_workers` threads (each upload still uses concurrent parts, so keep
+    this small); a single progress bar counts finished files.
+
+    Args:
+        path: Local file or directory.
+        remote_prefix: Destination uri or prefix.
+        s3_config, backend, verify: See `upload_data_file`.
+        hash_rename: If True (default), files get the `-<hash>` naming convention.
+        hash_length: Number of sha256 hex characters in the new name.
+        max_workers: Number of files uploaded at once.
+        show_progress: If True, show progress.
+
+    Returns:
+        dict (for a file) or list of dicts (for a directory), as in `upload_data_file`.
+    """
+    path = Path(path)
+    kwargs = dict(s3_config=s3_config, backend=backend, hash_rename=hash_rename,
+                  hash_length=hash_length, verify=verify)
+    if path.is_file():
+        return upload_data_file(path, remote_prefix, show_progress=show_progress, **kwargs)
+    if not path.is_dir():
+        raise ValueError(f"'{path}' is not a file or directory.")
+
+    files = sorted(p for p in path.rglob('*') if p.is_file())
+    remote_prefix = remote_prefix.rstrip('/') + '/'
+    results = []
+    pbar = progress_bar(total=len(files), unit="file", desc=f"publish {path.name}", disable=not show_progress)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for file in files:
+            relative_dir = file.parent.relative_to(path).as_posix()
+            file_prefix = remote_prefix if relative_dir == '.' else f"{remote_prefix}{relative_dir}/"
+            futures[executor.submit(upload_data_file, file, file_prefix, show_progress=False, **kwargs)] = file
+        try:
+            for future in as_completed(futures):
+                results.append(future.result())
+                pbar.update(1)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            pbar.close()
+    return sorted(results, key=lambda result: result['uri'])
@@ -0,0 +1,83 @@
+"""
+Shared fixtures. Everything runs offline against the local http and S3 stand-ins in
+``benchmarks/servers.py`` (and the fake `s5cmd` in ``benchmarks/fake_s5cmd.py``).
+"""
+import os
+import re
+import sys
+import hashlib
+from collections import OrderedDict
+
+import pytest
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from servers import serve_http, serve_s3
+from fake_s5cmd import install_fake_s5cmd
+
+BUCKET = 'test-bucket'
+
+# job / launcher variables that change sync ids, worker layouts and cache locations
+_JOB_ENV_VARS = ['SLURM_JOB_ID', 'SLURM_STEP_ID', 'SLURM_CLUSTER_NAME', 'SLURM_ARRAY_JOB_ID',
+                 'SLURM_ARRAY_TASK_ID', 'SLURM_ARRAY_TASK_MIN', 'SLURM_ARRAY_TASK_MAX',
+                 'SLURM_ARRAY_TASK_COUNT', 'TORCHELASTIC_RUN_ID', 'MASTER_ADDR', 'MASTER_PORT',
+                 'RANK', 'WORLD_SIZE', 'LOCAL_RANK', 'LOCAL_WORLD_SIZE']
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def md5(data):
+    return hashlib.md5(data).hexdigest()
+
+@pytest.fixture(autouse=True)
+def cache_root(tmp_path, monkeypatch):
+    """A fresh cache root per test (instead of netscratch / ~/work/DataLocal/cache)."""
+    from visionlab.remote_data import cache_dir
+    root = str(tmp_path / 'cache')
+    os.makedirs(root)
+    monkeypatch.setattr(cache_dir, '_DEFAULT_DIRS', OrderedDict([('SHARED_DATASET_DIR', root)]))
+    for name in _JOB_ENV_VARS:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('VISIONLAB_REMOTE_DATA_BROKER', '0')
+    monkeypatch.setenv('VISIONLAB_REMOTE_DATA_CATALOG', '0')
+    return root
+
+@pytest.fixture(scope='session')
+def server_root(tmp_path_factory):
+    return str(tmp_path_factory.mktemp('served'))
+
+@pytest.fixture(scope='session')
+def http_server(server_root):
+    server = serve_http(server_root)
+    yield server
+    server.stop()
+
+@pytest.fixture(scope='session')
+def s3_server(server_root):
+    server = serve_s3(server_root)
+    yield server
+    server.stop()
+
+@pytest.fixture
+def remote_prefix(server_root, request):
+    """A key prefix of its own for this test's served objects: ``<bucket>/<test name>``."""
+    return f"{BUCKET}/{re.sub(r'[^A-Za-z0-9_.-]', '_', request.node.name)}"
+
+@pytest.fixture
+def s3_config(s3_server, monkeypatch):
+    """s3_config for the S3 stand-in (also exported, since s5cmd's environment is built from os.environ)."""
+    monkeypatch.setenv('S3_ENDPOINT_URL', s3_server.url)
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'test')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'test')
+    return dict(endpoint_url=s3_server.url)
+
+@pytest.fixture
+def fake_s5cmd(tmp_path, monkeypatch):
+    bin_dir = str(tmp_path / 'bin')
+    install_fake_s5cmd(bin_dir)
+    monkeypatch.setenv('PATH', bin_dir + os.pathsep + os.environ.get('PATH', ''))
+    return bin_dir
@@ -0,0 +1,151 @@
+import os
+import threading
+
+import pytest
+
+from visionlab.remote_data import bulk_sync
+from visionlab.remote_data.bulk_sync import assign_objects, partitioned_sync, wait_for_sync
+
+from conftest import write_file
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(bulk_sync, '_POLL_INTERVAL', 0.05)
+
+@pytest.fixture
+def remote_objects(server_root, remote_prefix):
+    """Objects of assorted sizes below `s3://<remote_prefix>/data/`."""
+    objects = {f"{split}/{i:02d}.bin": os.urandom(100 * (i + 1)) for split in ['train', 'val'] for i in range(6)}
+    for key, data in objects.items():
+        write_file(os.path.join(server_root, remote_prefix, 'data', key), data)
+    return f"s3://{remote_prefix}/data/", objects
+
+def _run_workers(fn, num_workers):
+    results, errors = [None] * num_workers, []
+
+    def run(worker_id):
+        try:
+            results[worker_id] = fn(worker_id)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(worker_id,)) for worker_id in range(num_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+    return results, errors
+
+def _assert_synced(local_dir, objects):
+    for key, data in objects.items():
+        with open(os.path.join(local_dir, key), 'rb') as f:
+            assert f.read() == data
+
+def _objects(sizes):
+    return [dict(key=f"{i:03d}", size=size, etag=f"etag{i}") for i, size in enumerate(sizes)]
+
+def test_size_strategy_balances_bytes():
+    objects = _objects([100, 90, 50, 40, 30, 20, 10, 10])
+    shares = assign_objects(objects, 3)
+    assert sorted(obj['key'] for share in shares for obj in share) == [obj['key'] for obj in objects]
+    loads = [sum(obj['size'] for obj in share) for share in shares]
+    assert max(loads) - min(loads) <= 10
+    # deterministic, whatever order the listing comes in
+    assert assign_objects(list(reversed(objects)), 3) == shares
+
+def test_hash_strategy_keeps_shares_stable_as_the_prefix_grows():
+    objects = _objects([10] * 50)
+    shares = assign_objects(objects, 4, strategy='hash')
+    grown = assign_objects(objects + _objects([10] * 80)[50:], 4, strategy='hash')
+    for share, grown_share in zip(shares, grown):
+        assert all(obj in grown_share for obj in share)
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        assign_objects(_objects([1]), 2, strategy='round-robin')
+
+@pytest.mark.parametrize('backend', ['boto3', 's5cmd'])
+def test_workers_split_the_sync(backend, remote_objects, s3_config, fake_s5cmd, tmp_path):
+    prefix, objects = remote_objects
+    local_dir = str(tmp_path / 'synced')
+
+    def worker(worker_id):
+        return partitioned_sync(prefix, local_dir, s3_config=s3_config, worker_id=worker_id, num_workers=3,
+                                backend=backend, timeout=30, show_progress=False)
+
+    manifests, errors = _run_workers(worker, 3)
+    assert not errors
+    _assert_synced(local_dir, objects)
+    manifest = manifests[0]
+    assert all(m['run'] == manifest['run'] for m in manifests)
+    assert manifest['num_workers'] == 3
+    assert manifest['num_objects'] == len(objects)
+    assert manifest['total_bytes'] == sum(len(data) for data in objects.values())
+
+    # each worker fetched only its own share
+    records = [bulk_sync._read_json(os.path.join(bulk_sync._state_dir(local_dir, prefix), f"done-{worker_id}.json"))
+               for worker_id in range(3)]
+    assert sum(record['fetched'] for record in records) == len(objects)
+    assert all(0 < record['fetched'] < len(objects) for record in records)
+
+def test_rerun_fetches_only_missing_objects(remote_objects, s3_config, tmp_path):
+    prefix, objects = remote_objects
+    local_dir = str(tmp_path / 'synced')
+    partitioned_sync(prefix, local_dir, s3_config=s3_config, worker_id=0, num_workers=1, backend='boto3',
+                     timeout=30, show_progress=False)
+    os.remove(os.path.join(local_dir, 'val/03.bin'))
+    record = partitioned_sync(prefix, local_dir, s3_config=s3_config, worker_id=0, num_workers=1, backend='boto3',
+                              wait=False, show_progress=False)
+    assert record['objects'] == len(objects)
+    assert record['fetched'] == 1
+    _assert_synced(local_dir, objects)
+
+def test_other_job_waits_for_the_sync(remote_objects, s3_config, tmp_path, monkeypatch):
+    prefix, objects = remote_objects
+    local_dir = str(tmp_path / 'synced')
+
+    # a consumer that starts waiting before any worker has started
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(wait_for_sync(local_dir, prefix, timeout=30)))
+    waiter.start()
+    manifest = partitioned_sync(prefix, local_dir, s3_config=s3_config, worker_id=0, num_workers=1,
+                                backend='boto3', timeout=30, show_progress=False)
+    waiter.join(timeout=30)
+    assert waited and waited[0]['run'] == manifest['run']
+
+    # a later job (another SLURM array) finds the completed sync
+    monkeypatch.setenv('SLURM_ARRAY_JOB_ID', '4242')
+    assert wait_for_sync(local_dir, prefix, timeout=5)['run'] == manifest['run']
+    # ... but not when it asks for a run of its own that never happened
+    with pytest.raises(TimeoutError):
+        wait_for_sync(local_dir, prefix, timeout=0.2, sync_id='slurm-array-4242')
+
+def test_listing_failure_is_reported_to_waiters(tmp_path, monkeypatch):
+    local_dir = str(tmp_path / 'synced')
+    prefix = 's3://test-bucket/missing/'
+
+    def fail(prefix, s3_config=None):
+        raise PermissionError("AccessDenied")
+
+    monkeypatch.setattr(bulk_sync, 'list_prefix', fail)
+    with pytest.raises(PermissionError):
+        partitioned_sync(prefix, local_dir, worker_id=0, num_workers=2, backend='boto3', show_progress=False)
+    with pytest.raises(RuntimeError, match="AccessDenied"):
+        partitioned_sync(prefix, local_dir, worker_id=1, num_workers=2, backend='boto3', timeout=5,
+                         show_progress=False)
+    with pytest.raises(RuntimeError, match="AccessDenied"):
+        wait_for_sync(local_dir, prefix, timeout=5)
+
+@pytest.mark.parametrize('key', ['../outside.bin', 'a/../../outside.bin', '/etc/outside.bin'])
+def test_keys_outside_the_local_dir_are_refused(key, tmp_path, monkeypatch):
+    local_dir = str(tmp_path / 'synced')
+    monkeypatch.setattr(bulk_sync, 'list_prefix', lambda prefix, s3_config=None: [dict(key=key, size=1, etag='x')])
+
+    def fetch(*args):
+        raise AssertionError("nothing may be fetched")
+
+    monkeypatch.setattr(bulk_sync, '_fetch_boto3', fetch)
+    with pytest.raises(ValueError, match="outside"):
+        partitioned_sync('s3://test-bucket/evil/', local_dir, worker_id=0, num_workers=1, backend='boto3',
+                         show_progress=False)
+    assert not os.path.exists(tmp_path / 'outside.bin')
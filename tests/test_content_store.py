@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from visionlab.remote_data.download import download_data_file
+from visionlab.remote_data.content_store import ContentStore, get_content_store, probe_http_content
+from visionlab.remote_data.single_flight import track_fetch
+
+from conftest import write_file, md5
+
+SHA256 = 'ab' * 32
+
+@pytest.fixture
+def store(tmp_path):
+    return ContentStore(str(tmp_path / 'cas'))
+
+def test_keys_only_use_content_identifiers(store):
+    etag = md5(b'data')
+    assert store.keys(etag=f'"{etag}"', size=4, sha256=SHA256) == [
+        os.path.join('sha256', 'ab', SHA256), os.path.join('etag', etag[:2], f"{etag}-4")]
+    assert store.keys(etag=f"{etag}-3", size=4) == [os.path.join('etag', etag[:2], f"{etag}-3-4")]
+    # opaque (non-S3) ETags, ETags without a size and malformed hashes identify nothing
+    assert store.keys(etag='5f1e-1a2b', size=4) == []
+    assert store.keys(etag=etag) == []
+    assert store.keys(sha256='not-a-hash') == []
+
+def test_add_then_materialize_links_the_stored_object(store, tmp_path):
+    data = b'checkpoint bytes'
+    etag = md5(data)
+    src = write_file(str(tmp_path / 'cache' / 's3' / 'aws' / 'bucket' / 'model.bin'), data)
+    assert not store.has_etag_entries()
+    store.add(src, etag=etag, size=len(data))
+    assert store.has_etag_entries()
+    assert store.lookup(etag=etag, size=len(data)) is not None
+
+    dst = str(tmp_path / 'cache' / 's3' / 'wasabi' / 'bucket' / 'model.bin')
+    with track_fetch() as record:
+        assert store.materialize(dst, etag=etag, size=len(data))
+    assert record['deduplicated'] == 1
+    assert os.path.samefile(src, dst)
+    with open(dst, 'rb') as f:
+        assert f.read() == data
+    # no temp links left behind
+    assert os.listdir(os.path.dirname(dst)) == ['model.bin']
+
+def test_materialize_misses(store, tmp_path):
+    data = b'checkpoint bytes'
+    src = write_file(str(tmp_path / 'a.bin'), data)
+    store.add(src, etag=md5(data), size=len(data))
+    dst = str(tmp_path / 'b.bin')
+    assert not store.materialize(dst, etag=md5(b'other'), size=len(data))
+    # same ETag, other size: a different object
+    assert not store.materialize(dst, etag=md5(data), size=len(data) + 1)
+    assert not os.path.exists(dst)
+
+def test_add_replaces_a_duplicate_copy_with_a_link(store, tmp_path):
+    data = b'same content'
+    first = write_file(str(tmp_path / 'first.bin'), data)
+    second = write_file(str(tmp_path / 'second.bin'), data)
+    store.add(first, sha256=SHA256)
+    store.add(second, sha256=SHA256)
+    assert os.path.samefile(first, second)
+    assert os.stat(first).st_nlink == 3
+
+def test_get_content_store_honors_the_dedup_setting(cache_root, monkeypatch):
+    assert get_content_store(dedup=False) is None
+    monkeypatch.setenv('VISIONLAB_REMOTE_DATA_DEDUP', '0')
+    assert get_content_store() is None
+    monkeypatch.setenv('VISIONLAB_REMOTE_DATA_DEDUP', '1')
+    assert get_content_store().root == os.path.join(cache_root, 'cas')
+
+def test_probe_http_content(http_server, server_root, remote_prefix):
+    data = os.urandom(1000)
+    write_file(os.path.join(server_root, remote_prefix, 'object.bin'), data)
+    write_file(os.path.join(server_root, remote_prefix, 'empty.bin'), b'')
+    assert probe_http_content(f"{http_server.url}/{remote_prefix}/object.bin") == (md5(data), len(data))
+    assert probe_http_content(f"{http_server.url}/{remote_prefix}/empty.bin") == (None, 0)
+
+def test_same_content_under_two_urls_is_downloaded_once(http_server, server_root, remote_prefix):
+    data = os.urandom(4096)
+    for mirror in ['mirror-a', 'mirror-b']:
+        write_file(os.path.join(server_root, remote_prefix, mirror, 'model.bin'), data)
+    with track_fetch() as first:
+        first_file, _ = download_data_file(f"{http_server.url}/{remote_prefix}/mirror-a/model.bin", progress=False)
+    with track_fetch() as second:
+        second_file, _ = download_data_file(f"{http_server.url}/{remote_prefix}/mirror-b/model.bin", progress=False)
+    assert first['downloaded'] == 1
+    assert second['downloaded'] == 0 and second['deduplicated'] == 1
+    assert first_file != second_file and os.path.samefile(first_file, second_file)
@@ -0,0 +1,108 @@
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from visionlab.remote_data.decompress import decompress_if_needed, _member_selector
+
+CONTENTS = {
+    'imagenet/train/n01/a.jpg': b'train a',
+    'imagenet/train/n02/b.jpg': b'train b',
+    'imagenet/val/n01/c.jpg': b'val c',
+    'imagenet/val/n02/d.jpg': b'val d',
+    'imagenet/meta/labels.json': b'{"n01": 0, "n02": 1}',
+    'imagenet/meta/README.txt': b'readme',
+}
+
+def _write_tar(path, mode):
+    source_dir = os.path.join(os.path.dirname(path), 'source')
+    for name, data in CONTENTS.items():
+        os.makedirs(os.path.join(source_dir, os.path.dirname(name)), exist_ok=True)
+        with open(os.path.join(source_dir, name), 'wb') as f:
+            f.write(data)
+    with tarfile.open(path, mode) as tar:
+        tar.add(os.path.join(source_dir, 'imagenet'), arcname='imagenet')
+    return path
+
+def _write_zip(path):
+    with zipfile.ZipFile(path, 'w') as zf:
+        for name, data in CONTENTS.items():
+            zf.writestr(name, data)
+    return path
+
+@pytest.fixture(params=['tar', 'tar.gz', 'zip'])
+def archive(request, tmp_path):
+    os.makedirs(tmp_path / 'archives')
+    path = str(tmp_path / 'archives' / f"imagenet.{request.param}")
+    if request.param == 'zip':
+        return _write_zip(path)
+    return _write_tar(path, 'w:gz' if request.param == 'tar.gz' else 'w')
+
+def _extracted_files(output_dir):
+    found = set()
+    for dirpath, _, filenames in os.walk(output_dir):
+        for filename in filenames:
+            found.add(os.path.relpath(os.path.join(dirpath, filename), output_dir))
+    return found
+
+def test_member_selector():
+    assert _member_selector() is None
+    select = _member_selector(include='*/val/*', exclude='*/n02/*')
+    assert select('imagenet/val/n01/c.jpg')
+    assert not select('imagenet/val/n02/d.jpg')
+    assert not select('imagenet/train/n01/a.jpg')
+    # a directory member selects everything below it
+    select = _member_selector(members=['imagenet/meta/'])
+    assert select('imagenet/meta/labels.json') and select('imagenet/meta')
+    assert not select('imagenet/metadata.json')
+
+def test_include_extracts_only_matching_members(archive, tmp_path):
+    output_dir = str(tmp_path / 'out')
+    extracted = decompress_if_needed(archive, output_dir, include='*/val/*')
+    assert extracted == os.path.join(output_dir, 'imagenet')
+    assert _extracted_files(output_dir) == {'imagenet/val/n01/c.jpg', 'imagenet/val/n02/d.jpg'}
+    with open(os.path.join(output_dir, 'imagenet/val/n02/d.jpg'), 'rb') as f:
+        assert f.read() == b'val d'
+
+def test_members_and_exclude(archive, tmp_path):
+    output_dir = str(tmp_path / 'out')
+    decompress_if_needed(archive, output_dir, members=['imagenet/meta/labels.json'])
+    assert _extracted_files(output_dir) == {'imagenet/meta/labels.json'}
+    # a later selection is merged into the earlier one
+    decompress_if_needed(archive, output_dir, include='imagenet/train', exclude='*/n01/*')
+    assert _extracted_files(output_dir) == {'imagenet/meta/labels.json', 'imagenet/train/n02/b.jpg'}
+
+def test_repeated_selection_is_not_extracted_again(archive, tmp_path, capsys):
+    output_dir = str(tmp_path / 'out')
+    decompress_if_needed(archive, output_dir, include='*/val/*')
+    # (a tar's member index is written by the first full scan)
+    decompress_if_needed(archive, output_dir, include='*/val/*')
+    capsys.readouterr()
+    decompress_if_needed(archive, output_dir, include='*/val/*')
+    assert "already been extracted" in capsys.readouterr().out
+
+    # a missing member is extracted again
+    os.remove(os.path.join(output_dir, 'imagenet/val/n01/c.jpg'))
+    decompress_if_needed(archive, output_dir, include='*/val/*')
+    assert _extracted_files(output_dir) == {'imagenet/val/n01/c.jpg', 'imagenet/val/n02/d.jpg'}
+
+def test_tar_member_index_allows_selection_without_a_scan(tmp_path):
+    archive = _write_tar(str(tmp_path / 'imagenet.tar'), 'w')
+    decompress_if_needed(archive, str(tmp_path / 'full'))
+    assert os.path.exists(f"{archive}.index.json")
+    output_dir = str(tmp_path / 'out')
+    decompress_if_needed(archive, output_dir, members=['imagenet/val/n02/d.jpg', 'imagenet/meta'])
+    assert _extracted_files(output_dir) == {'imagenet/val/n02/d.jpg', 'imagenet/meta/labels.json',
+                                            'imagenet/meta/README.txt'}
+
+def test_no_match_raises(archive, tmp_path):
+    with pytest.raises(ValueError, match="No members"):
+        decompress_if_needed(archive, str(tmp_path / 'out'), include='*/test/*')
+
+def test_full_extraction(archive, tmp_path):
+    output_dir = str(tmp_path / 'out')
+    assert decompress_if_needed(archive, output_dir) == os.path.join(output_dir, 'imagenet')
+    assert _extracted_files(output_dir) == set(CONTENTS)
+    # no staging directories are left behind
+    assert os.listdir(output_dir) == ['imagenet']
@@ -0,0 +1,86 @@
+import os
+import pickle
+
+import pytest
+
+from visionlab.remote_data.pack import PackReader, fetch_into_pack, _index_path
+
+from conftest import write_file, md5
+
+@pytest.fixture
+def remote_objects(server_root, remote_prefix):
+    objects = {f"shard-{i:03d}/{j}.jpg": os.urandom(50 + 37 * i + j) for i in range(20) for j in range(3)}
+    objects['empty.txt'] = b''
+    for key, data in objects.items():
+        write_file(os.path.join(server_root, remote_prefix, 'images', key), data)
+    return f"s3://{remote_prefix}/images/", objects
+
+def _fetch(prefix, pack_path, s3_config, **kwargs):
+    return fetch_into_pack(prefix, pack_path=pack_path, s3_config=s3_config, max_concurrent=4,
+                           show_progress=False, **kwargs)
+
+def test_pack_round_trip(remote_objects, s3_config, tmp_path):
+    prefix, objects = remote_objects
+    pack_path = _fetch(prefix, str(tmp_path / 'images.pack'), s3_config, commit_every=7)
+    with PackReader(pack_path) as reader:
+        assert len(reader) == len(objects)
+        assert sorted(reader.keys()) == sorted(objects)
+        for key, data in objects.items():
+            assert key in reader
+            assert reader[key] == data
+            assert bytes(reader.view(key)) == data
+            assert reader.etag(key) == md5(data)
+        assert 'missing.jpg' not in reader
+        assert reader.get('missing.jpg') is None
+        with pytest.raises(KeyError):
+            reader['missing.jpg']
+        assert {key: size for key, _, size in reader.items_info()} == {key: len(data) for key, data in objects.items()}
+
+def test_default_pack_path_is_in_the_cache(remote_objects, s3_config, cache_root):
+    prefix, objects = remote_objects
+    pack_path = _fetch(prefix, None, s3_config)
+    assert pack_path.startswith(cache_root) and pack_path.endswith('.pack')
+    with PackReader(pack_path) as reader:
+        assert len(reader) == len(objects)
+
+def test_refetch_appends_only_new_and_changed_objects(remote_objects, s3_config, server_root, remote_prefix, tmp_path):
+    prefix, objects = remote_objects
+    pack_path = _fetch(prefix, str(tmp_path / 'images.pack'), s3_config)
+    reader = PackReader(pack_path)
+    assert len(reader) == len(objects)
+    old_size = os.path.getsize(pack_path)
+
+    changed, added = 'shard-003/1.jpg', 'shard-999/0.jpg'
+    objects[changed] = b'changed'
+    objects[added] = b'added'
+    for key in [changed, added]:
+        write_file(os.path.join(server_root, remote_prefix, 'images', key), objects[key])
+    _fetch(prefix, pack_path, s3_config)
+    # only the two records were appended
+    assert os.path.getsize(pack_path) - old_size < 200
+
+    # an open reader keeps its view until it reloads
+    assert added not in reader
+    reader.reload()
+    assert reader[changed] == b'changed'
+    assert reader[added] == b'added'
+    assert len(reader) == len(objects)
+    reader.close()
+
+def test_lost_index_is_recovered_from_the_pack(remote_objects, s3_config, tmp_path):
+    prefix, objects = remote_objects
+    pack_path = _fetch(prefix, str(tmp_path / 'images.pack'), s3_config)
+    os.remove(_index_path(pack_path))
+    _fetch(prefix, pack_path, s3_config)
+    with PackReader(pack_path) as reader:
+        assert {key: reader[key] for key in reader} == objects
+
+def test_reader_pickles_without_its_maps(remote_objects, s3_config, tmp_path):
+    prefix, objects = remote_objects
+    pack_path = _fetch(prefix, str(tmp_path / 'images.pack'), s3_config)
+    with PackReader(pack_path) as reader:
+        key = next(iter(objects))
+        reader[key]
+        copy = pickle.loads(pickle.dumps(reader))
+    assert copy[key] == objects[key]
+    copy.close()
@@ -0,0 +1,86 @@
+import time
+import threading
+
+import pytest
+
+from visionlab.remote_data.prefetch import Prefetcher
+
+from conftest import write_file
+
+def _settle(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # give a dispatcher that ignores the window the chance to overshoot
+    time.sleep(0.2)
+
+class _Fetcher:
+    """fetch_fn over local files, recording which uris were fetched."""
+    def __init__(self, paths, fail=()):
+        self.paths = paths
+        self.fail = set(fail)
+        self.fetched = []
+        self.lock = threading.Lock()
+
+    def __call__(self, uri):
+        with self.lock:
+            self.fetched.append(uri)
+        if uri in self.fail:
+            raise OSError(f"could not fetch {uri}")
+        return self.paths[uri], None
+
+def _make_files(tmp_path, num_files, size):
+    return {f"s3://bucket/{i}.bin": write_file(str(tmp_path / 'files' / f"{i}.bin"), b'x' * size)
+            for i in range(num_files)}
+
+def test_window_limits_unconsumed_files(tmp_path):
+    paths = _make_files(tmp_path, 12, 10)
+    fetcher = _Fetcher(paths)
+    with Prefetcher(list(paths), max_files=3, num_workers=4, fetch_fn=fetcher) as prefetcher:
+        prefetcher.start()
+        _settle(lambda: len(fetcher.fetched) >= 3)
+        # backpressure: nothing has been consumed, so the window stays full at 3 files
+        assert len(fetcher.fetched) == 3
+
+        consumed = []
+        for uri, cached_file, extracted_dir in prefetcher:
+            consumed.append(uri)
+            # the file being handed out is not consumed until the next one is requested
+            assert len(fetcher.fetched) <= len(consumed) - 1 + 3
+            assert cached_file == paths[uri] and extracted_dir is None
+    assert consumed == list(paths)
+
+def test_byte_window_uses_mean_file_size(tmp_path):
+    paths = _make_files(tmp_path, 6, 100)
+    fetcher = _Fetcher(paths)
+    with Prefetcher(list(paths), max_files=10, max_bytes=250, num_workers=4, fetch_fn=fetcher) as prefetcher:
+        prefetcher.start()
+        _settle(lambda: len(fetcher.fetched) >= 2)
+        # one file until a size is known, then as many as fit in 250 bytes at 100 bytes each
+        assert len(fetcher.fetched) == 2
+        assert [uri for uri, _, _ in prefetcher] == list(paths)
+
+def test_unordered_yields_every_file(tmp_path):
+    paths = _make_files(tmp_path, 8, 10)
+    with Prefetcher(list(paths), max_files=2, ordered=False, fetch_fn=_Fetcher(paths)) as prefetcher:
+        assert sorted(uri for uri, _, _ in prefetcher) == sorted(paths)
+
+def test_failed_fetch_is_raised_and_not_counted_as_download(tmp_path):
+    paths = _make_files(tmp_path, 4, 10)
+    uris = list(paths)
+    prefetcher = Prefetcher(uris, max_files=1, num_workers=1, fetch_fn=_Fetcher(paths, fail=[uris[1]]))
+    received = []
+    with pytest.raises(OSError, match="could not fetch"):
+        for uri, _, _ in prefetcher:
+            received.append(uri)
+    assert received == uris[:1]
+    assert prefetcher._failed_files == 1
+    # the failure is kept out of the mean file size
+    assert prefetcher._downloaded_files >= 1
+    assert prefetcher._downloaded_bytes == 10 * prefetcher._downloaded_files
+
+def test_iterates_once():
+    prefetcher = Prefetcher([], fetch_fn=lambda uri: (uri, None))
+    assert list(prefetcher) == []
+    with pytest.raises(RuntimeError):
+        iter(prefetcher)
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from visionlab.remote_data.range_reader import RemoteFile, open_remote
+
+from conftest import write_file
+
+BLOCK = 1024
+
+@pytest.fixture
+def payload():
+    return os.urandom(64 * BLOCK + 100)
+
+@pytest.fixture(params=['http', 's3'])
+def remote_uri(request, server_root, remote_prefix, payload):
+    write_file(os.path.join(server_root, remote_prefix, 'object.bin'), payload)
+    if request.param == 'http':
+        return f"{request.getfixturevalue('http_server').url}/{remote_prefix}/object.bin", None
+    return f"s3://{remote_prefix}/object.bin", request.getfixturevalue('s3_config')
+
+def test_header_read_costs_one_request(remote_uri, payload):
+    uri, s3_config = remote_uri
+    with open_remote(uri, block_size=BLOCK, s3_config=s3_config) as f:
+        header = f.read(8)
+        rest_of_header = f.read(100)
+        assert header + rest_of_header == payload[:108]
+        assert f.size == len(payload)
+        # the probe fetched the first block; reading a header in two steps doesn't read ahead
+        assert f.num_requests == 1
+        assert f.bytes_fetched == BLOCK
+
+def test_random_reads_fetch_only_missing_blocks(remote_uri, payload):
+    uri, s3_config = remote_uri
+    with RemoteFile(uri, block_size=BLOCK, s3_config=s3_config) as f:
+        f.seek(10 * BLOCK + 5)
+        assert f.read(10) == payload[10 * BLOCK + 5:10 * BLOCK + 15]
+        assert f.num_requests == 2
+
+        # three adjacent missing blocks are one range request
+        f.seek(20 * BLOCK)
+        assert f.read(3 * BLOCK) == payload[20 * BLOCK:23 * BLOCK]
+        assert f.num_requests == 3
+
+        # cached blocks cost nothing
+        f.seek(10 * BLOCK)
+        assert f.read(BLOCK) == payload[10 * BLOCK:11 * BLOCK]
+        assert f.num_requests == 3
+
+        f.seek(-50, os.SEEK_END)
+        assert f.read() == payload[-50:]
+        assert f.num_requests == 4
+
+def test_sequential_reads_read_ahead(remote_uri, payload):
+    uri, s3_config = remote_uri
+    with RemoteFile(uri, block_size=BLOCK, readahead_blocks=4, s3_config=s3_config) as f:
+        chunks = iter(lambda: f.read(700), b'')
+        assert b''.join(chunks) == payload
+        # without read-ahead this would be one request per block
+        assert f.num_requests < f.num_blocks / 3
+        assert f.bytes_fetched == len(payload)
+
+def test_disk_cache_serves_blocks_of_a_reopened_file(remote_uri, payload, tmp_path):
+    uri, s3_config = remote_uri
+    disk_cache_dir = str(tmp_path / 'blocks')
+    with RemoteFile(uri, block_size=BLOCK, disk_cache_dir=disk_cache_dir, s3_config=s3_config) as f:
+        f.seek(30 * BLOCK)
+        f.read(2 * BLOCK)
+    with RemoteFile(uri, block_size=BLOCK, disk_cache_dir=disk_cache_dir, s3_config=s3_config) as f:
+        f.seek(30 * BLOCK)
+        assert f.read(2 * BLOCK) == payload[30 * BLOCK:32 * BLOCK]
+        assert f.num_requests == 1
+
+@pytest.mark.parametrize('scheme', ['http', 's3'])
+def test_empty_object(scheme, request, server_root, remote_prefix):
+    write_file(os.path.join(server_root, remote_prefix, 'empty.bin'), b'')
+    if scheme == 'http':
+        uri, s3_config = f"{request.getfixturevalue('http_server').url}/{remote_prefix}/empty.bin", None
+    else:
+        uri, s3_config = f"s3://{remote_prefix}/empty.bin", request.getfixturevalue('s3_config')
+    with open_remote(uri, s3_config=s3_config) as f:
+        assert f.size == 0
+        assert f.read() == b''
+        assert f.num_requests == 1
@@ -0,0 +1,100 @@
+import os
+import hashlib
+
+import pytest
+
+from visionlab.remote_data.catalog import CacheCatalog
+from visionlab.remote_data.content_store import get_content_store
+from visionlab.remote_data.scrub import scrub_cache, verify_file
+
+from conftest import write_file, md5
+
+@pytest.fixture
+def catalog(tmp_path):
+    return CacheCatalog(str(tmp_path / 'catalog.sqlite'))
+
+def _cache_file(cache_root, catalog, relpath, data, uri, etag=None, sha256=None, etag_verified=False):
+    path = write_file(os.path.join(cache_root, relpath), data)
+    catalog.record_file(path, uri=uri, etag=etag, sha256=sha256, etag_verified=etag_verified)
+    return path
+
+def _corrupt(path):
+    with open(path, 'r+b') as f:
+        first = f.read(1)
+        f.seek(0)
+        f.write(bytes([first[0] ^ 0xff]))
+    # make sure the scrub sees a changed file even on coarse mtime filesystems
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+def _scrub(cache_root, catalog, **kwargs):
+    return scrub_cache(cache_root, catalog=catalog, num_workers=1, rebuild=False, niceness=0, **kwargs)
+
+def test_verify_file(tmp_path):
+    data = os.urandom(3000)
+    path = write_file(str(tmp_path / 'file.bin'), data)
+    sha256 = hashlib.sha256(data).hexdigest()
+    assert verify_file(path, sha256=sha256) == ('ok', 'sha256')
+    assert verify_file(path, sha256=sha256[:8]) == ('ok', 'sha256')
+    assert verify_file(path, etag=f'"{md5(data)}"') == ('ok', 'etag')
+    assert verify_file(path, sha256='0' * 64)[0] == 'failed'
+    # an ETag mismatch only proves corruption when the ETag is known to be an md5 of the content
+    assert verify_file(path, etag=md5(b'other'))[0] == 'unverifiable'
+    assert verify_file(path, etag=md5(b'other'), trust_etag=True)[0] == 'failed'
+    assert verify_file(path)[0] == 'unverifiable'
+
+def test_corrupt_file_is_quarantined(cache_root, catalog):
+    data = os.urandom(5000)
+    relpath = os.path.join('s3', 'aws', 'bucket', 'model.bin')
+    path = _cache_file(cache_root, catalog, relpath, data, 's3://bucket/model.bin', etag=md5(data),
+                       etag_verified=True)
+    content_store = get_content_store(root=os.path.join(cache_root, 'cas'), dedup=True)
+    content_store.add(path, etag=md5(data), size=len(data))
+    assert content_store.lookup(etag=md5(data), size=len(data)) is not None
+    _corrupt(path)
+
+    result = _scrub(cache_root, catalog)
+    assert result['checked'] == 1 and result['failed'] == 1
+    quarantined = os.path.join(cache_root, 'quarantine', relpath)
+    assert result['failures'] == [dict(path=path, detail=result['failures'][0]['detail'], quarantined_to=quarantined)]
+    assert not os.path.exists(path)
+    assert os.path.isfile(quarantined)
+    # nothing hands out the corrupt bytes any more
+    assert catalog.lookup(path=path) == []
+    assert content_store.lookup(etag=md5(data), size=len(data)) is None
+
+def test_report_only(cache_root, catalog):
+    data = os.urandom(100)
+    path = _cache_file(cache_root, catalog, 'hashid/file.bin', data, None, sha256=hashlib.sha256(data).hexdigest())
+    _corrupt(path)
+    result = _scrub(cache_root, catalog, quarantine=False)
+    assert result['failed'] == 1 and result['failures'][0]['quarantined_to'] is None
+    assert os.path.exists(path)
+
+def test_untrusted_etag_mismatch_is_left_alone(cache_root, catalog):
+    data = os.urandom(100)
+    # e.g. an SSE-KMS object, or an http server whose ETag is not an md5
+    path = _cache_file(cache_root, catalog, 'http/example.com/file.bin', data, 'https://example.com/file.bin',
+                       etag=md5(b'not the content'))
+    result = _scrub(cache_root, catalog)
+    assert result['unverifiable'] == 1 and result['failed'] == 0
+    assert os.path.exists(path)
+
+def test_scrub_is_incremental(cache_root, catalog):
+    data = os.urandom(100)
+    path = _cache_file(cache_root, catalog, 's3/aws/bucket/ok.bin', data, 's3://bucket/ok.bin', etag=md5(data))
+    first = _scrub(cache_root, catalog)
+    assert first['ok'] == 1
+    assert catalog.lookup(path=path)[0]['etag_verified']
+    second = _scrub(cache_root, catalog)
+    assert second['checked'] == 0 and second['skipped'] == 1
+    # a changed file is checked again
+    _corrupt(path)
+    third = _scrub(cache_root, catalog)
+    assert third['checked'] == 1 and third['failed'] == 1
+
+def test_missing_files_are_dropped_from_the_catalog(cache_root, catalog):
+    path = _cache_file(cache_root, catalog, 's3/aws/bucket/gone.bin', b'gone', 's3://bucket/gone.bin', etag=md5(b'gone'))
+    os.remove(path)
+    _scrub(cache_root, catalog)
+    assert catalog.lookup(path=path) == []
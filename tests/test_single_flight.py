@@ -0,0 +1,125 @@
+import os
+import time
+import threading
+
+import pytest
+
+from visionlab.remote_data.single_flight import single_flight_download, track_fetch
+
+def _run_in_threads(fns):
+    results, errors = [None] * len(fns), []
+
+    def run(i, fn):
+        try:
+            results[i] = fn()
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i, fn)) for i, fn in enumerate(fns)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    return results, errors
+
+def test_leader_downloads_once_and_waiter_reuses_it(tmp_path):
+    local_filepath = str(tmp_path / 'files' / 'object.bin')
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def download(tmp_filepath):
+        calls.append(tmp_filepath)
+        started.set()
+        assert release.wait(timeout=10)
+        with open(tmp_filepath, 'wb') as f:
+            f.write(b'payload')
+
+    def leader():
+        with track_fetch() as record:
+            single_flight_download(local_filepath, download, show_progress=False)
+        return record
+
+    def waiter():
+        assert started.wait(timeout=10)
+        # the leader holds the lock: the waiter must not see a partial file
+        assert not os.path.exists(local_filepath)
+        threading.Timer(0.2, release.set).start()
+        with track_fetch() as record:
+            single_flight_download(local_filepath, download, show_progress=False)
+        return record
+
+    (leader_record, waiter_record), errors = _run_in_threads([leader, waiter])
+    assert not errors
+    assert len(calls) == 1
+    assert leader_record['downloaded'] == 1 and leader_record['waited'] == 0
+    assert waiter_record['downloaded'] == 0 and waiter_record['waited'] == 1
+    with open(local_filepath, 'rb') as f:
+        assert f.read() == b'payload'
+    # no temp files left behind next to the result
+    assert sorted(os.listdir(tmp_path / 'files')) == ['object.bin', 'object.bin.lock']
+
+def test_cache_hit_does_not_call_download(tmp_path):
+    local_filepath = str(tmp_path / 'object.bin')
+    with open(local_filepath, 'wb') as f:
+        f.write(b'cached')
+
+    def download(tmp_filepath):
+        raise AssertionError("should not download a cached file")
+
+    with track_fetch() as record:
+        assert single_flight_download(local_filepath, download, show_progress=False) == local_filepath
+    assert record == dict(downloaded=0, waited=0, deduplicated=0, bytes=0)
+
+def test_waiter_takes_over_when_leader_fails(tmp_path):
+    local_filepath = str(tmp_path / 'object.bin')
+    started = threading.Event()
+    calls = []
+
+    def failing_download(tmp_filepath):
+        calls.append('leader')
+        with open(tmp_filepath, 'wb') as f:
+            f.write(b'part')
+        started.set()
+        time.sleep(0.2)
+        raise OSError("connection reset")
+
+    def download(tmp_filepath):
+        calls.append('waiter')
+        with open(tmp_filepath, 'wb') as f:
+            f.write(b'payload')
+
+    def leader():
+        single_flight_download(local_filepath, failing_download, show_progress=False)
+
+    def waiter():
+        assert started.wait(timeout=10)
+        return single_flight_download(local_filepath, download, show_progress=False)
+
+    (_, result), errors = _run_in_threads([leader, waiter])
+    assert [type(e) for e in errors] == [OSError]
+    assert calls == ['leader', 'waiter']
+    assert result == local_filepath
+    with open(local_filepath, 'rb') as f:
+        assert f.read() == b'payload'
+
+def test_waiter_times_out(tmp_path):
+    local_filepath = str(tmp_path / 'object.bin')
+    started, release = threading.Event(), threading.Event()
+
+    def slow_download(tmp_filepath):
+        started.set()
+        release.wait(timeout=10)
+        with open(tmp_filepath, 'wb') as f:
+            f.write(b'payload')
+
+    leader = threading.Thread(target=single_flight_download, args=(local_filepath, slow_download),
+                              kwargs=dict(show_progress=False))
+    leader.start()
+    try:
+        assert started.wait(timeout=10)
+        with pytest.raises(TimeoutError):
+            single_flight_download(local_filepath, slow_download, lock_timeout=0.3, show_progress=False)
+    finally:
+        release.set()
+        leader.join(timeout=10)
+    assert os.path.isfile(local_filepath)
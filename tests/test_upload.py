@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from visionlab.remote_data import s3_etag
+from visionlab.remote_data.s3_etag import calculate_s3_etag
+from visionlab.remote_data.upload import upload_data_file, _hash_file
+
+from conftest import write_file, md5
+
+MiB = 1024 * 1024
+
+@pytest.mark.parametrize('size', [0, 1000, 5 * MiB, 12 * MiB + 3])
+def test_local_etag_matches_calculate_s3_etag(size, tmp_path):
+    path = write_file(str(tmp_path / 'file.bin'), os.urandom(size))
+    sha256, etag = _hash_file(path, 5 * MiB)
+    assert etag == calculate_s3_etag(path, chunk_size=5 * MiB).strip('"')
+    assert etag.endswith('-3') == (size > 10 * MiB)
+
+@pytest.mark.parametrize('backend', ['boto3', 's5cmd'])
+@pytest.mark.parametrize('size', [1000, 12 * MiB + 3])
+def test_upload_verifies_the_remote_etag(backend, size, s3_config, fake_s5cmd, server_root, remote_prefix, tmp_path):
+    data = os.urandom(size)
+    path = write_file(str(tmp_path / 'upload' / 'weights.bin'), data)
+    result = upload_data_file(path, f"s3://{remote_prefix}/", s3_config=dict(s3_config, part_size=5),
+                              backend=backend, show_progress=False)
+    assert result['uri'] == f"s3://{remote_prefix}/weights.bin"
+    assert result['size'] == size
+    assert result['etag'] == calculate_s3_etag(path, chunk_size=5 * MiB).strip('"')
+    if size < 5 * MiB:
+        assert result['etag'] == md5(data)
+    with open(os.path.join(server_root, remote_prefix, 'weights.bin'), 'rb') as f:
+        assert f.read() == data
+
+def test_upload_fails_on_an_etag_mismatch(s3_config, remote_prefix, tmp_path, monkeypatch):
+    path = write_file(str(tmp_path / 'upload' / 'weights.bin'), b'weights')
+    monkeypatch.setattr(s3_etag, 'get_etag_and_size_from_s3_uri', lambda uri, s3_config=None: (md5(b'other'), 7))
+    with pytest.raises(ValueError, match="does not match"):
+        upload_data_file(path, f"s3://{remote_prefix}/weights.bin", s3_config=s3_config, backend='boto3',
+                         show_progress=False)
+    # verify=False skips the check
+    result = upload_data_file(path, f"s3://{remote_prefix}/weights.bin", s3_config=s3_config, backend='boto3',
+                              verify=False, show_progress=False)
+    assert result['etag'] == md5(b'weights')
+
+def test_hash_rename(s3_config, remote_prefix, tmp_path):
+    path = write_file(str(tmp_path / 'upload' / 'weights.bin'), b'weights')
+    result = upload_data_file(path, f"s3://{remote_prefix}/", s3_config=s3_config, backend='boto3',
+                              hash_rename=True, show_progress=False)
+    renamed = f"weights-{result['sha256'][:8]}.bin"
+    assert os.path.basename(result['file_path']) == renamed
+    assert result['uri'] == f"s3://{remote_prefix}/{renamed}"
+    assert not os.path.exists(path)
+
+def test_unknown_backend(tmp_path):
+    path = write_file(str(tmp_path / 'weights.bin'), b'weights')
+    with pytest.raises(ValueError, match="backend"):
+        upload_data_file(path, 's3://bucket/weights.bin', backend='rclone')